@@ -20,3 +20,6 @@ DATA_PATHS = [
      DATA_PATH_BASE / "caffeine",
      DATA_PATH_BASE / "chlorzoxazone",
 ]
+
+# cache of compiled models and simulation results
+CACHE_PATH = LOSARTAN_PATH / "cache"
@@ -1,21 +1,39 @@
 """
 Reusable functionality for multiple simulation experiments.
 """
-from collections import namedtuple
-from typing import Dict
+from collections import defaultdict, namedtuple
+from pathlib import Path
+from typing import Dict, List, Optional, Set
 
 import pandas as pd
 
 from pkdb_models.models.losartan import MODEL_PATH
 from pkdb_models.models.losartan.losartan_pk import calculate_losartan_pk, calculate_losartan_pd
+from pkdb_models.models.losartan.rendering import FigureRenderer, save_figure
+from sbmlsim.data import Data
 from sbmlsim.experiment import SimulationExperiment
 from sbmlsim.model import AbstractModel
+from sbmlsim.plot import Figure
 from sbmlsim.task import Task
 
 
 # Constants for conversion
 MolecularWeights = namedtuple("MolecularWeights", "losp los e3174 l158 ren anggen ang1 ang2 ald")
 
+def _task_selections(d: Optional[Data]) -> Set[str]:
+    """Selections of the tasks read by the data."""
+    if d is None:
+        return set()
+    if d.is_task():
+        return {d.selection}
+    if d.is_function():
+        selections = set()
+        for variable in d.variables.values():
+            selections.update(_task_selections(variable))
+        return selections
+    return set()
+
+
 class LosartanSimulationExperiment(SimulationExperiment):
     """Base class for all SimulationExperiments."""
 
@@ -25,6 +43,16 @@ class LosartanSimulationExperiment(SimulationExperiment):
     legend_font_size = 9
     suptitle_font_size = 25
 
+    # selections read by analyses outside of the figures and fit mappings,
+    # e.g. pharmacokinetic parameters or matplotlib figures
+    analysis_selections: List[str] = []
+
+    # render workers for saving figures, None saves figures directly
+    renderer: Optional[FigureRenderer] = None
+
+    # headless runs create no figures
+    headless: bool = False
+
     # labels
     label_time = "Time"
     label_los = "Losartan"
@@ -331,6 +359,36 @@ class LosartanSimulationExperiment(SimulationExperiment):
         """Default changes to simulations."""
         return LosartanSimulationExperiment._default_changes(Q_=self.Q_)
 
+    def dosing_regimen(
+        self, dose, n_doses: int, tau=None, urine_resets: int = 0
+    ) -> Dict:
+        """Changes for an oral losartan dosing regimen.
+
+        The first dose is the oral dose `PODOSE_los` at the start, the following
+        doses are given by events of the model at `tau, 2*tau, ..., (n_doses-1)*tau`;
+        with `urine_resets` the urine amounts are reset at `tau, 2*tau, ...`
+        (collection intervals). A multiple dose protocol is a single Timecourse
+        without restarts of the integrator. The doses of the events are added to
+        the undissolved oral dose `PODOSE_los` (not replacing the remainder of
+        the previous dose).
+
+        :param dose: oral dose per administration
+        :param n_doses: number of doses
+        :param tau: dosing interval (default: 24 hr)
+        :param urine_resets: number of urine collection resets
+        """
+        Q_ = self.Q_
+        if tau is None:
+            tau = Q_(24, "hr")
+        return {
+            "PODOSE_los": dose,
+            "dose_regimen_los": dose,
+            "tau_regimen_los": tau,
+            "n_regimen_los": Q_(n_doses, "dimensionless"),
+            "tau_urine": tau,
+            "n_urine": Q_(urine_resets, "dimensionless"),
+        }
+
     def tasks(self) -> Dict[str, Task]:
         if self.simulations():
             return {
@@ -339,87 +397,27 @@ class LosartanSimulationExperiment(SimulationExperiment):
             }
         return {}
 
-    def data(self) -> Dict:
-        self.add_selections_data(
-            selections=[
-                "time",
-
-                # dosing
-                "IVDOSE_los",
-                "PODOSE_los",
-                "IVDOSE_e3174",
-
-                # venous plasma
-                "[Cve_los]",
-                "[Cve_e3174]",
-                "[Cve_l158]",
-                "[Cve_los_e3174]",
-                "[Cve_total]",
-                "mr_e3174_los_plasma",
-                # "mr_los_e3174_plasma",
-
-                # urine
-                "Aurine_los",
-                "Aurine_e3174",
-                "Aurine_l158",
-                "Aurine_los_e3174",
-                "Aurine_total",
-                "mr_e3174_los_urine",
-                # "mr_los_e3174_urine",
-
-                # feces
-                "Afeces_los",
-                "Afeces_e3174",
-                "Afeces_l158",
-                "Afeces_total",
-                "mr_e3174_los_feces",
-                # "mr_los_e3174_feces",
-
-                # cases
-                'KI__f_renal_function',
-                'f_cirrhosis',
-
-                'LI__f_cyp2c9',
-                'GU__f_abcb1',
-
-                "[e3174]",
-
-                "[anggen]",
-                "[ang1]",
-                "ang1_change",
-                "ang1_ratio",
-                "[ang2]",
-                "ang2_change",
-                "ang2_ratio",
-
-                "[ren]",
-                "ren_change",
-                "ren_ratio",
-                "[ald]",
-                "ald_change",
-                "ald_ratio",
-
-                "fe_e3174",
-
-                "ANGGEN2ANG1",
-                "ANG1ANG2",
-                "ANG2DEG",
-
-                "RENSEC",
-                "RENDEG",
-                "ALDSEC",
-                "ALDDEG",
-
-                "SBP",
-                "SBP_change",
-                "SBP_ratio",
-                "DBP",
-                "DBP_change",
-                "DBP_ratio",
-                "MAP",
-            ]
-        )
-        return {}
+    def initialize(self) -> None:
+        """Initialize experiment and register the simulated selections.
+
+        Only the selections read by the figures, the fit mappings and
+        `analysis_selections` are simulated. The selections are collected from
+        the figures and fit mappings of the initialization.
+        """
+        super().initialize()
+
+        selections = {"time", *self.analysis_selections}
+        for fig in self._figures.values():
+            for plot in fig.get_plots():
+                for curve in [*plot.curves, *plot.areas]:
+                    for key in ["x", "y", "xerr", "yerr", "yfrom", "yto"]:
+                        selections.update(_task_selections(getattr(curve, key, None)))
+        for mapping in self._fit_mappings.values():
+            for fit_data in [mapping.reference, mapping.observable]:
+                for key in ["x", "y", "x_sd", "y_sd", "x_se", "y_se"]:
+                    selections.update(_task_selections(getattr(fit_data, key, None)))
+
+        self.add_selections_data(selections=sorted(selections))
 
     @property
     def Mr(self):
@@ -478,6 +476,48 @@ class LosartanSimulationExperiment(SimulationExperiment):
                pk_dfs[sim_key] = df
        return pk_dfs
 
+    def create_mpl_figures(self) -> Dict:
+        """Create matplotlib figures, none in headless runs."""
+        if self.headless:
+            return {}
+        return super().create_mpl_figures()
+
+    def save_mpl_figures(
+        self,
+        results_path: Path,
+        mpl_figures: Dict,
+        figure_formats: Optional[List[str]] = None,
+    ) -> Dict[str, List[Path]]:
+        """Save matplotlib figures with the resolution `Figure.fig_dpi`.
+
+        With a `renderer` the figures are saved asynchronously by the render
+        workers.
+        """
+        if figure_formats is None:
+            figure_formats = ["svg"]
+        paths = defaultdict(list)
+        for fkey, fig_mpl in mpl_figures.items():
+            fig_paths = [
+                results_path / f"{self.sid}_{fkey}.{fig_format}"
+                for fig_format in figure_formats
+            ]
+            if self.renderer is not None:
+                self.renderer.submit(fig_mpl, paths=fig_paths)
+            else:
+                save_figure(fig_mpl, paths=fig_paths, dpi=Figure.fig_dpi)
+            for fig_format, fig_path in zip(figure_formats, fig_paths):
+                paths[fig_format].append(fig_path)
+
+        return paths
+
+    def save_data_results(self, output_path: Path) -> None:
+        """Save post-processed results as TSV (headless runs).
+
+        Experiments which post-process their results (e.g. pharmacokinetic
+        parameters of scans) write them here, the default has nothing to save.
+        """
+        return None
+
     def calculate_losartan_pd(self, scans: list = []) -> Dict[str, pd.DataFrame]:
        """Calculate pd parameters for simulations (scans)"""
        pd_dfs = {}
@@ -1,7 +1,6 @@
 from copy import deepcopy
 from typing import Dict
 
-from matplotlib.pyplot import legend
 from sbmlsim.plot import Axis, Figure, Plot
 from sbmlsim.simulation import Timecourse, TimecourseSim
 
@@ -1,19 +1,20 @@
 """Parameter scans losartan."""
-from typing import Dict
-
-import matplotlib.axes
-import matplotlib.cm as cm
+import multiprocessing
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict
 
 import numpy as np
 from sbmlsim.simulation import Timecourse, TimecourseSim, ScanSim, Dimension
-from sbmlsim.plot.serialization_matplotlib import FigureMPL, MatplotlibFigureSerializer
-from sbmlsim.plot.serialization_matplotlib import plt
 from sbmlutils.console import console
 
+if TYPE_CHECKING:
+    from sbmlsim.plot.serialization_matplotlib import FigureMPL
+
 from pkdb_models.models.losartan.experiments.base_experiment import (
     LosartanSimulationExperiment,
 )
 from pkdb_models.models.losartan.helpers import run_experiments
+from pkdb_models.models.losartan.losartan_pk import PD_SELECTIONS, PK_SELECTIONS
 
 
 class LosartanParameterScan(LosartanSimulationExperiment):
@@ -90,6 +91,39 @@ class LosartanParameterScan(LosartanSimulationExperiment):
         },
     }
 
+    # timecourses of the scan figures
+    timecourse_sids = [
+        "[Cve_los]",
+        "[Cve_e3174]",
+        "[Cve_l158]",
+        # "fe_e3174",
+        # "mr_e3174_los_plasma",
+
+        "Aurine_los",
+        "Aurine_e3174",
+        # "Aurine_l158",
+        # "mr_e3174_los_urine",
+        "Afeces_los",
+        # "Afeces_e3174",
+        # "Afeces_l158",
+        # "mr_e3174_los_feces",
+
+        "[ren]",  # renin in Vplasma
+        "[ang1]",  # angiotensin I in Vplasma
+        # "[ang2]",  # angiotensin II in Vplasma
+
+        # "[anggen]",  # angiotensinogen in Vplasma
+        "[ald]",  # aldosterone in Vplasma
+        "SBP",
+        "DBP",
+    ]
+    analysis_selections = sorted({
+        *PK_SELECTIONS,
+        *PD_SELECTIONS,
+        *timecourse_sids,
+        *[scan_data["parameter"] for scan_data in scan_map.values()],
+    })
+
     def simulations(self) -> Dict[str, ScanSim]:
         Q_ = self.Q_
         tcscans = {}
@@ -121,11 +155,24 @@ class LosartanParameterScan(LosartanSimulationExperiment):
 
         return tcscans
 
-    def figures_mpl(self) -> Dict[str, FigureMPL]:
-        """Matplotlib figures."""
-        # calculate pharmacokinetic parameters
+    def pharmacokinetics(self) -> None:
+        """Calculate pharmacokinetic and pharmacodynamic parameters of scans."""
         self.pk_dfs = self.calculate_losartan_pk()
         self.pd_dfs = self.calculate_losartan_pd()
+
+    def save_data_results(self, output_path: Path) -> None:
+        """Save pharmacokinetic and pharmacodynamic parameters as TSV."""
+        self.pharmacokinetics()
+        for sim_key, df in self.pk_dfs.items():
+            df.to_csv(output_path / f"{self.sid}_{sim_key}_pk.tsv", sep="\t", index=False)
+        for sim_key, dfs in self.pd_dfs.items():
+            for sid, df in dfs.items():
+                df.to_csv(output_path / f"{self.sid}_{sim_key}_pd_{sid.strip('[]')}.tsv", sep="\t", index=False)
+
+    def figures_mpl(self) -> Dict[str, "FigureMPL"]:
+        """Matplotlib figures."""
+        # calculate pharmacokinetic parameters
+        self.pharmacokinetics()
         #console.print(self.pd_dfs)
 
         return {
@@ -134,8 +181,12 @@ class LosartanParameterScan(LosartanSimulationExperiment):
             **self.figures_mpl_pharmacodynamics(),
         }
 
-    def figures_mpl_timecourses(self) -> Dict[str, FigureMPL]:
+    def figures_mpl_timecourses(self) -> Dict[str, "FigureMPL"]:
         """Timecourse plots for key variables depending on degree of renal impairment."""
+        # matplotlib is only imported for figures (headless runs)
+        import matplotlib
+        import matplotlib.cm as cm
+        from sbmlsim.plot.serialization_matplotlib import plt
 
         figures = {}
         for scan_key, scan_data in self.scan_map.items():
@@ -149,31 +200,7 @@ class LosartanParameterScan(LosartanSimulationExperiment):
             # --------------------
             # pharmacokinetics
             # --------------------
-            sids = [
-                "[Cve_los]",
-                "[Cve_e3174]",
-                "[Cve_l158]",
-                # "fe_e3174",
-                # "mr_e3174_los_plasma",
-
-                "Aurine_los",
-                "Aurine_e3174",
-                # "Aurine_l158",
-                # "mr_e3174_los_urine",
-                "Afeces_los",
-                # "Afeces_e3174",
-                # "Afeces_l158",
-                # "mr_e3174_los_feces",
-
-                "[ren]",  # renin in Vplasma
-                "[ang1]",  # angiotensin I in Vplasma
-                # "[ang2]",  # angiotensin II in Vplasma
-
-                # "[anggen]",  # angiotensinogen in Vplasma
-                "[ald]",  # aldosterone in Vplasma
-                "SBP",
-                "DBP",
-            ]
+            sids = self.timecourse_sids
 
             f, axes = plt.subplots(
                 nrows=2,
@@ -306,6 +333,8 @@ class LosartanParameterScan(LosartanSimulationExperiment):
 
     def figures_mpl_pharmacokinetics(self):
         """Visualize dependency of pharmacokinetics parameters."""
+        import matplotlib
+        from sbmlsim.plot.serialization_matplotlib import plt
         Q_ = self.Q_
         figures = {}
 
@@ -465,6 +494,8 @@ class LosartanParameterScan(LosartanSimulationExperiment):
 
     def figures_mpl_pharmacodynamics(self):
         """Visualize dependency of pharmacodynamic parameters."""
+        import matplotlib
+        from sbmlsim.plot.serialization_matplotlib import plt
         Q_ = self.Q_
         figures = {}
 
@@ -597,4 +628,8 @@ class LosartanParameterScan(LosartanSimulationExperiment):
 
 
 if __name__ == "__main__":
-    run_experiments(LosartanParameterScan, output_dir=LosartanParameterScan.__name__)
+    run_experiments(
+        LosartanParameterScan,
+        output_dir=LosartanParameterScan.__name__,
+        n_scan_workers=multiprocessing.cpu_count(),
+    )
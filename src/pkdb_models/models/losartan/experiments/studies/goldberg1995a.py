@@ -97,39 +97,27 @@ class Goldberg1995a(LosartanSimulationExperiment):
                     "[ald]": Q_(11.2, "ng/dl") / self.Mr.ald,  # mean from runin data
                 },
             )
-            tc0 = Timecourse(
+            # once daily for 42 days after the run-in day
+            tc = Timecourse(
                 start=0,
-                end=24 * 60,  # [min]
-                steps=500,
+                end=(41 * 24 + 25) * 60,  # [min]
+                steps=21000,
                 changes={
-                    "PODOSE_los": Q_(self.losp_doses[intervention], "mg") * self.Mr.los/self.Mr.losp,
                     "ren_ref": Q_(5.02, "pg/ml") / self.Mr.ren,  # mean from runin data
                     "[ren]": Q_(5.02, "pg/ml") / self.Mr.ren,  # mean from runin data
                     "ang2_ref": Q_(2.71, "pg/ml") / self.Mr.ang2,  # mean from runin data
                     "[ang2]": Q_(2.71, "pg/ml") / self.Mr.ang2,  # mean from runin data
                     "ald_ref": Q_(11.2, "ng/dl") / self.Mr.ald,  # mean from runin data
                     "[ald]": Q_(11.2, "ng/dl") / self.Mr.ald,  # mean from runin data
-                },
-            )
-            tc1 = Timecourse(
-                start=0,
-                end=24 * 60,  # [min]
-                steps=500,
-                changes={
-                    "PODOSE_los": Q_(self.losp_doses[intervention], "mg") * self.Mr.los/self.Mr.losp,
-                },
-            )
-            tc2 = Timecourse(
-                start=0,
-                end=25 * 60,  # [min]
-                steps=500,
-                changes={
-                    "PODOSE_los": Q_(self.losp_doses[intervention], "mg") * self.Mr.los/self.Mr.losp,
+                    **self.dosing_regimen(
+                        dose=Q_(self.losp_doses[intervention], "mg") * self.Mr.los/self.Mr.losp,
+                        n_doses=42,
+                    ),
                 },
             )
 
             tcsims[f"po_{intervention}"] = TimecourseSim(
-                [tcs] + [tc0] + [tc1 for _ in range(40)] + [tc2],
+                [tcs, tc],
                 time_offset=-24*60,
             )
         # console.print(tcsims)
@@ -110,40 +110,25 @@ class Ohtawa1993(LosartanSimulationExperiment):
 
         # multiple dose
         for intervention, dose in self.interventions_multi.items():
-            tc0 = Timecourse(
+            # once daily for 7 days with 24 hr urine collections
+            tc = Timecourse(
                 start=0,
-                end=24 * 60,  # [min]
-                steps=500,
+                end=(6 * 24 + 60) * 60,  # [min]
+                steps=3500,
                 changes={
                     **self.default_changes(),
                     "BW": Q_(self.bodyweight, "kg"),
-                    "PODOSE_los": Q_(dose, "mg"),
                     **baseline_changes,
-                },
-            )
-            tc1 = Timecourse(
-                start=0,
-                end=24 * 60,  # [min]
-                steps=500,
-                changes={
-                    "PODOSE_los": Q_(dose, "mg"),
-                    "Aurine_los": Q_(0, "mmole"),
-                    "Aurine_e3174": Q_(0, "mmole"),
-                },
-            )
-            tc2 = Timecourse(
-                start=0,
-                end=60 * 60,  # [min]
-                steps=500,
-                changes={
-                    "PODOSE_los": Q_(dose, "mg"),
-                    "Aurine_los": Q_(0, "mmole"),
-                    "Aurine_e3174": Q_(0, "mmole"),
+                    **self.dosing_regimen(
+                        dose=Q_(dose, "mg"),
+                        n_doses=7,
+                        urine_resets=6,
+                    ),
                 },
             )
 
             tcsims[f"po_{intervention}_multi"] = TimecourseSim(
-                [tc0] + [tc1 for _ in range(5)] + [tc2],
+                [tc],
                 # time_offset=-6*24*60,
             )
         return tcsims
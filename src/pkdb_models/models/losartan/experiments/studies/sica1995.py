@@ -68,39 +68,24 @@ class Sica1995(LosartanSimulationExperiment):
         tcsims = {}
         for group in self.groups:
 
-            tc0 = Timecourse(
+            # 100 mg once daily for 7 days with 24 hr urine collections
+            tc = Timecourse(
                 start=0,
-                end=24 * 60,  # [min]
-                steps=500,
+                end=(6 * 24 + 65) * 60,  # [min]
+                steps=3500,
                 changes={
                     **self.default_changes(),
                     "KI__f_renal_function": Q_(self.renal_functions[group], "dimensionless"),
                     "BW": Q_(self.bodyweights[group], "kg"),
-                    "PODOSE_los": Q_(100, "mg") * self.Mr.los / self.Mr.losp,
-                },
-            )
-            tc1 = Timecourse(
-                start=0,
-                end=24 * 60,  # [min]
-                steps=500,
-                changes={
-                    "PODOSE_los": Q_(100, "mg") * self.Mr.los / self.Mr.losp,
-                    "Aurine_los": Q_(0, "mmole"),  # reset
-                    "Aurine_e3174": Q_(0, "mmole"),  # reset
-                },
-            )
-            tc2 = Timecourse(
-                start=0,
-                end=65 * 60,  # [min]
-                steps=500,
-                changes={
-                    "PODOSE_los": Q_(100, "mg") * self.Mr.los / self.Mr.losp,
-                    "Aurine_los": Q_(0, "mmole"),  # reset
-                    "Aurine_e3174": Q_(0, "mmole"),  # reset
+                    **self.dosing_regimen(
+                        dose=Q_(100, "mg") * self.Mr.los / self.Mr.losp,
+                        n_doses=7,
+                        urine_resets=6,
+                    ),
                 },
             )
             tcsims[f"po_los100_{group}"] = TimecourseSim(
-                [tc0] + [tc1 for _ in range(5)] + [tc2],
+                [tc],
                 time_offset=-6*24*60,  # [min]
             )
 
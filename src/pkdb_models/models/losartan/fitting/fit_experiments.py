@@ -1,5 +1,5 @@
 """Parameter fit problems for losartan."""
-from typing import Dict, List
+from typing import Dict, List, Optional, Type
 from sbmlsim.fit.helpers import f_fitexp, filter_empty
 from sbmlutils.console import console
 from sbmlutils.log import get_logger
@@ -132,22 +132,35 @@ def filter_pharmacokinetics(fit_mapping_key: str, fit_mapping: FitMapping) -> bo
     return False
 
 
-def f_fitexp_all():
+def _f_fitexp_kwargs(experiment_classes: Optional[List[Type]] = None) -> Dict:
+    """Arguments for the fit experiments, optionally of other experiment classes."""
+    if experiment_classes is None:
+        return f_fitexp_kwargs
+    return {**f_fitexp_kwargs, "experiment_classes": experiment_classes}
+
+
+def f_fitexp_all(experiment_classes: Optional[List[Type]] = None):
     """All data."""
-    return f_fitexp(metadata_filters=filter_empty, **f_fitexp_kwargs)
+    return f_fitexp(metadata_filters=filter_empty, **_f_fitexp_kwargs(experiment_classes))
 
 
-def f_fitexp_control() -> Dict[str, List[FitExperiment]]:
+def f_fitexp_control(experiment_classes: Optional[List[Type]] = None) -> Dict[str, List[FitExperiment]]:
     """Control data."""
-    return f_fitexp(metadata_filters=filter_control, **f_fitexp_kwargs)
+    return f_fitexp(metadata_filters=filter_control, **_f_fitexp_kwargs(experiment_classes))
 
-def f_fitexp_pk() -> Dict[str, List[FitExperiment]]:
+def f_fitexp_pk(experiment_classes: Optional[List[Type]] = None) -> Dict[str, List[FitExperiment]]:
     """Pharmacokinetic control data."""
-    return f_fitexp(metadata_filters=[filter_control, filter_pharmacokinetics], **f_fitexp_kwargs)
+    return f_fitexp(
+        metadata_filters=[filter_control, filter_pharmacokinetics],
+        **_f_fitexp_kwargs(experiment_classes),
+    )
 
-def f_fitexp_pd() -> Dict[str, List[FitExperiment]]:
+def f_fitexp_pd(experiment_classes: Optional[List[Type]] = None) -> Dict[str, List[FitExperiment]]:
     """Pharmacodynamic control data."""
-    return f_fitexp(metadata_filters=[filter_control, filter_pharmacodynamics], **f_fitexp_kwargs)
+    return f_fitexp(
+        metadata_filters=[filter_control, filter_pharmacodynamics],
+        **_f_fitexp_kwargs(experiment_classes),
+    )
 
 
 if __name__ == "__main__":
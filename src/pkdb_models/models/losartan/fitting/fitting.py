@@ -1,9 +1,12 @@
 """Losartan parameter fitting."""
+import json
 import logging
+from datetime import datetime
 from pathlib import Path
 
 import itertools
-from typing import List, Dict, Tuple
+from functools import partial
+from typing import List, Dict, Optional, Tuple
 
 import pandas as pd
 from pymetadata.console import console
@@ -27,6 +30,19 @@ from pkdb_models.models.losartan.fitting.parameters import (
     parameters_pk,
     parameters_pd,
 )
+from pkdb_models.models.losartan.fitting.storage import (
+    FitStorage,
+    PROBLEM_FILE,
+    RESULT_FILE_TSV,
+    REPORT_FILE,
+    parameters_info,
+    read_optimization_result_tsv,
+    read_report,
+    tsv_parameter_ids,
+)
+from pkdb_models.models.losartan.fitting.scheduler import fit_problems
+from pkdb_models.models.losartan.fitting.problem import LosartanOptimizationProblem
+from pkdb_models.models.losartan.experiments import studies
 
 from pkdb_models.models.losartan import (
     LOSARTAN_PATH,
@@ -54,14 +70,26 @@ fit_kwargs = {
 
 
 def create_optimization_problem(
-    fit_experiments: List[FitExperiment], opid: str, parameters: List[FitParameter]
+    fit_experiments: List[FitExperiment],
+    opid: str,
+    parameters: List[FitParameter],
+    sparse_output: bool = False,
+    sensitivity_jacobian: bool = False,
 ) -> OptimizationProblem:
-    op = OptimizationProblem(
+    """Create optimization problem.
+
+    :param sparse_output: simulate only the time points of the data
+    :param sensitivity_jacobian: residual Jacobian of least-squares fits from
+        forward sensitivities
+    """
+    op = LosartanOptimizationProblem(
         opid=opid,
         fit_experiments=fit_experiments,
         fit_parameters=parameters,
         base_path=LOSARTAN_PATH,
         data_path=DATA_PATHS,
+        sparse_output=sparse_output,
+        sensitivity_jacobian=sensitivity_jacobian,
     )
     return op
 
@@ -121,6 +149,37 @@ class FitExperimentSubset(str, Enum):
     PD = "PD",
 
 
+def problem_info(
+    op: OptimizationProblem,
+    fit_experiments: List[FitExperiment],
+    parameters: List[FitParameter],
+    fit_method: FitMethod,
+    seed: int,
+    batch_size: int,
+    optimization_strategy: OptimizationStrategy,
+    fit_subset: Optional[FitExperimentSubset],
+    sparse_output: bool = False,
+    sensitivity_jacobian: bool = False,
+) -> Dict:
+    """Description of an optimization problem for the storage of results."""
+    return {
+        "opid": op.opid,
+        "strategy": optimization_strategy.value,
+        "subset": fit_subset.value if fit_subset else None,
+        "fit_method": fit_method.value,
+        "seed": seed,
+        "batch_size": batch_size,
+        "experiments": [
+            [fit_exp.experiment_class.__name__, [str(m) for m in fit_exp.mappings]]
+            for fit_exp in fit_experiments
+        ],
+        "parameters": parameters_info(parameters),
+        "fit_kwargs": {key: str(value) for key, value in fit_kwargs.items()},
+        "sparse_output": sparse_output,
+        "sensitivity_jacobian": sensitivity_jacobian,
+    }
+
+
 def fit_losartan(
     optimization_strategy: OptimizationStrategy,
     fit_method: FitMethod,
@@ -129,65 +188,196 @@ def fit_losartan(
     n_cores: int,
     n_optimizations: int,
     seed: int,
+    storage_dir: Optional[Path] = None,
+    resume: bool = False,
+    fit_subset: Optional[FitExperimentSubset] = None,
+    sparse_output: bool = False,
+    sensitivity_jacobian: bool = False,
 ) -> Dict[str, Tuple[OptimizationResult, OptimizationProblem]]:
+    """Fit the optimization problems of the strategy.
+
+    With a `storage_dir` the optimizations are run in batches of `n_cores`
+    runs (seed of batch k is `seed + k`), the runs of every batch are stored
+    in `storage_dir/<opid>` as soon as the batch finished. With `resume` the
+    stored batches are reused and only the missing batches are run.
+    The start points therefore differ from a fit of all runs in a single
+    optimization with the same `seed` (fits without `storage_dir`).
+
+    With `OptimizationStrategy.SINGLE` and multiple cores the runs of all
+    problems are scheduled on a shared pool of workers (see `fit_problems`).
+
+    With `sparse_output` the simulations of the fit only output the time
+    points of the data, with `sensitivity_jacobian` least-squares fits use
+    the residual Jacobian from forward sensitivities (see
+    `LosartanOptimizationProblem`).
+    """
 
     if not isinstance(optimization_strategy, OptimizationStrategy):
         raise ValueError
     if not isinstance(fit_method, FitMethod):
         raise ValueError
 
-    def fit_op(
-        op: OptimizationProblem,
+    def run(
+        op: OptimizationProblem, seed: int, size: int
     ) -> Tuple[OptimizationResult, OptimizationProblem]:
-        """Wrapper for optimization function."""
-
-        # run optimization
+        """Run optimization."""
         opt_result: OptimizationResult
         op: OptimizationProblem
         if fit_method == FitMethod.LSQ:
-            opt_result, op = fitlsq(op, seed=seed, size=n_optimizations, n_cores=n_cores, **fit_kwargs)
+            opt_result, op = fitlsq(op, seed=seed, size=size, n_cores=n_cores, **fit_kwargs)
         elif fit_method == FitMethod.DE:
-            opt_result, op = fitde(op, seed=seed, size=n_optimizations, n_cores=n_cores, **fit_kwargs)
+            opt_result, op = fitde(op, seed=seed, size=size, n_cores=n_cores, **fit_kwargs)
 
         return opt_result, op
 
+    def open_storage(
+        op: OptimizationProblem, op_experiments: List[FitExperiment], batch_size: int
+    ) -> Tuple[FitStorage, Dict[int, int], set]:
+        """Storage of the problem with the sizes and completed batches."""
+        storage = FitStorage(storage_dir / op.opid)
+        info = problem_info(
+            op,
+            fit_experiments=op_experiments,
+            parameters=parameters,
+            fit_method=fit_method,
+            seed=seed,
+            batch_size=batch_size,
+            optimization_strategy=optimization_strategy,
+            fit_subset=fit_subset,
+            sparse_output=sparse_output,
+            sensitivity_jacobian=sensitivity_jacobian,
+        )
+        if storage.exists():
+            if not resume:
+                raise ValueError(
+                    f"Optimization results exist in '{storage.path}', use '--resume' "
+                    f"to continue the optimization or another output directory."
+                )
+            info_stored = storage.read_problem()
+            if info_stored != json.loads(json.dumps(info, default=str)):
+                raise ValueError(
+                    f"Optimization problem differs from the problem stored in "
+                    f"'{storage.path}', the optimization cannot be resumed."
+                )
+        else:
+            storage.write_problem(info)
+
+        batch_sizes = {
+            k: min(batch_size, n_optimizations - start)
+            for k, start in enumerate(range(0, n_optimizations, batch_size))
+        }
+        storage.discard_incomplete(batch_sizes)
+        completed = storage.completed_batches(batch_sizes)
+        if completed:
+            console.print(
+                f"Resume '{op.opid}': {len(completed)}/{len(batch_sizes)} batches completed"
+            )
+        return storage, batch_sizes, completed
+
+    def fit_op(
+        op: OptimizationProblem, op_experiments: List[FitExperiment]
+    ) -> Tuple[OptimizationResult, OptimizationProblem]:
+        """Wrapper for optimization function."""
+        if not storage_dir:
+            return run(op, seed=seed, size=n_optimizations)
+
+        storage, batch_sizes, completed = open_storage(
+            op, op_experiments=op_experiments, batch_size=max(n_cores, 1)
+        )
+        for k, size in batch_sizes.items():
+            if k in completed:
+                continue
+            opt_result, op = run(op, seed=seed + k, size=size)
+            storage.append_runs(batch=k, seed=seed + k, opt_result=opt_result)
+
+        return storage.optimization_result(parameters=parameters), op
+
     # store optimization results
     results = {}
 
     if optimization_strategy == OptimizationStrategy.SINGLE:
         # fit all experiments individually
+        problems: Dict[str, List[FitExperiment]] = {}
+        ops: Dict[str, OptimizationProblem] = {}
         for fit_exp in fit_experiments:
             opid = fit_exp.experiment_class.__name__
+            problems[opid] = [fit_exp]
+            ops[opid] = create_optimization_problem(
+                fit_experiments=[fit_exp],
+                opid=opid,
+                parameters=parameters,
+                sparse_output=sparse_output,
+                sensitivity_jacobian=sensitivity_jacobian,
+            )
 
-            op = create_optimization_problem(
-                fit_experiments=[fit_exp], opid=opid, parameters=parameters
+        if n_cores <= 1:
+            for opid, op in ops.items():
+                results[opid] = fit_op(op=op, op_experiments=problems[opid])
+        else:
+            # runs of all problems on a shared pool, every run is a batch
+            storages: Optional[Dict[str, FitStorage]] = None
+            completed: Dict[str, set] = {}
+            if storage_dir:
+                storages = {}
+                for opid, op in ops.items():
+                    storages[opid], _, completed[opid] = open_storage(
+                        op, op_experiments=problems[opid], batch_size=1
+                    )
+            opt_results = fit_problems(
+                problems=problems,
+                parameters=parameters,
+                create_problem=partial(
+                    create_optimization_problem,
+                    sparse_output=sparse_output,
+                    sensitivity_jacobian=sensitivity_jacobian,
+                ),
+                fit_function=fitlsq if fit_method == FitMethod.LSQ else fitde,
+                fit_kwargs=fit_kwargs,
+                n_cores=n_cores,
+                n_optimizations=n_optimizations,
+                seed=seed,
+                storages=storages,
+                completed=completed,
             )
-            results[opid] = fit_op(op=op)
+            for opid, op in ops.items():
+                results[opid] = (opt_results[opid], op)
 
     elif optimization_strategy == OptimizationStrategy.ALL:
         # fit all experiments together
         opid = "all"
         op = create_optimization_problem(
-            fit_experiments=fit_experiments, opid=opid, parameters=parameters
+            fit_experiments=fit_experiments,
+            opid=opid,
+            parameters=parameters,
+            sparse_output=sparse_output,
+            sensitivity_jacobian=sensitivity_jacobian,
         )
-        results[opid] = fit_op(op)
+        results[opid] = fit_op(op, op_experiments=fit_experiments)
 
     return results
 
 
-def get_fit_experiments(fit_subset: FitExperimentSubset, study_ids: List[str] = None):
-    """Creates a subset of fit experiments from given information."""
+def get_fit_experiments(
+    fit_subset: FitExperimentSubset,
+    study_ids: List[str] = None,
+    experiment_classes: Optional[List] = None,
+):
+    """Creates a subset of fit experiments from given information.
+
+    :param experiment_classes: experiment classes, by default the classes of
+        the fit experiments
+    """
     if not isinstance(fit_subset, FitExperimentSubset):
         raise ValueError
 
     if fit_subset == FitExperimentSubset.ALL:
-        fitexp_dict = f_fitexp_all()
+        fitexp_dict = f_fitexp_all(experiment_classes)
     elif fit_subset == FitExperimentSubset.CONTROL:
-        fitexp_dict = f_fitexp_control()
+        fitexp_dict = f_fitexp_control(experiment_classes)
     elif fit_subset == FitExperimentSubset.PK:
-        fitexp_dict = f_fitexp_pk()
+        fitexp_dict = f_fitexp_pk(experiment_classes)
     elif fit_subset == FitExperimentSubset.PD:
-        fitexp_dict = f_fitexp_pd()
+        fitexp_dict = f_fitexp_pd(experiment_classes)
 
     if study_ids:
         fit_experiments = [fitexp_dict[sid] for sid in study_ids]
@@ -216,6 +406,131 @@ def get_fit_parameters(fit_subset: FitExperimentSubset) -> List[FitParameter]:
     return parameters
 
 
+def _stored_fit_experiments(
+    experiments: List[List], fit_subset: FitExperimentSubset
+) -> List[FitExperiment]:
+    """Fit experiments of stored experiment names and mappings."""
+    names = list(dict.fromkeys(name for name, _ in experiments))
+    fit_experiments = get_fit_experiments(
+        fit_subset=fit_subset,
+        experiment_classes=[getattr(studies, name) for name in names],
+    )
+    mappings_stored = {name: set(mappings) for name, mappings in experiments}
+    for fit_exp in fit_experiments:
+        name = fit_exp.experiment_class.__name__
+        mappings = {str(m) for m in fit_exp.mappings}
+        if mappings_stored.get(name) and mappings != mappings_stored[name]:
+            logger.warning(
+                f"Mappings of '{name}' differ from the stored fit: "
+                f"{sorted(mappings ^ mappings_stored[name])}"
+            )
+    return fit_experiments
+
+
+def _infer_fit_subset(path: Path, name: str, parameter_ids: List[str]) -> FitExperimentSubset:
+    """Subset of a stored result from the name of the fit and its parameters."""
+    subsets = [
+        subset for subset in FitExperimentSubset
+        if [p.pid for p in get_fit_parameters(subset)] == parameter_ids
+    ]
+    for subset in subsets:
+        if name.endswith(f"_{subset.value}"):
+            return subset
+    if not subsets:
+        raise ValueError(
+            f"No fit subset with the parameters of '{path}', use '--subset': {parameter_ids}"
+        )
+    return subsets[0]
+
+
+def load_fit_results(
+    results_dir: Path, fit_subset: Optional[FitExperimentSubset] = None
+) -> Dict[str, Tuple[OptimizationResult, OptimizationProblem]]:
+    """Load stored optimization results and their optimization problems.
+
+    Reads all results in `results_dir`: optimization runs stored by
+    `fit_losartan` (`problem.json`, `runs.jsonl`) and the
+    `optimization_result.tsv` of earlier fit reports. The optimization
+    problems are created from the stored experiments.
+
+    :param results_dir: directory with stored results
+    :param fit_subset: subset of the fit experiments, by default the stored
+        subset or the subset with the fitted parameters
+    :return: results by name
+    """
+    results: Dict[str, Tuple[OptimizationResult, OptimizationProblem]] = {}
+    for problem_path in sorted(results_dir.rglob(PROBLEM_FILE)):
+        storage = FitStorage(problem_path.parent)
+        info = storage.read_problem()
+        opt_result = storage.optimization_result()
+        name = storage.path.parent.name
+        if fit_subset:
+            subset = fit_subset
+        elif info["subset"]:
+            subset = FitExperimentSubset(info["subset"])
+        else:
+            # fits without subset, e.g. of experiments selected by study ids
+            subset = _infer_fit_subset(
+                problem_path, name=name, parameter_ids=[p.pid for p in opt_result.parameters]
+            )
+        op = create_optimization_problem(
+            fit_experiments=_stored_fit_experiments(info["experiments"], fit_subset=subset),
+            opid=info["opid"],
+            parameters=opt_result.parameters,
+        )
+        if info["strategy"] == OptimizationStrategy.SINGLE.value:
+            name = f"{name}_{info['opid']}"
+        results[name] = (opt_result, op)
+
+    for tsv_path in sorted(results_dir.rglob(RESULT_FILE_TSV)):
+        parameter_ids = tsv_parameter_ids(tsv_path)
+        subset = fit_subset if fit_subset else _infer_fit_subset(
+            tsv_path, name=tsv_path.parent.name, parameter_ids=parameter_ids
+        )
+        p_dict = {p.pid: p for p in get_fit_parameters(subset)}
+        parameters = [p_dict[pid] for pid in parameter_ids]
+        report = read_report(tsv_path.parent / REPORT_FILE)
+        op = create_optimization_problem(
+            fit_experiments=_stored_fit_experiments(report["experiments"], fit_subset=subset),
+            opid=report["opid"] if report["opid"] else "all",
+            parameters=parameters,
+        )
+        opt_result = read_optimization_result_tsv(tsv_path, parameters=parameters)
+        results[tsv_path.parent.name] = (opt_result, op)
+
+    if not results:
+        raise ValueError(f"No optimization results in '{results_dir}'")
+    return results
+
+
+def analyze_fit_results(
+    results: Dict[str, Tuple[OptimizationResult, OptimizationProblem]],
+    output_dir: Path,
+) -> None:
+    """Create figures and reports of optimization results.
+
+    :param results: results by output name
+    :param output_dir: output directory of the reports
+    """
+    # parameters for plots
+    mpl_parameters = {
+        # 'axes.labelsize': 12,
+        # 'axes.labelweight': "bold",
+    }
+    for name, (opt_result, op) in results.items():
+        # create figures and outputs
+        opt_analysis = OptimizationAnalysis(
+            opt_result=opt_result,
+            op=op,
+            output_name=name,
+            output_dir=output_dir,
+            show_plots=False,
+            show_titles=False,
+            **fit_kwargs
+        )
+        opt_analysis.run(mpl_parameters=mpl_parameters)
+
+
 def main() -> None:
     """Entry point which runs parameter fitting script.
 
@@ -245,7 +560,8 @@ def main() -> None:
         "--seed",
         action="store",
         dest="seed",
-        help="Seed for optimization (ensures reproducibility)",
+        help="Seed for optimization (ensures reproducibility), batch k of the "
+             "runs uses seed + k",
     )
     parser.add_option(
         "-t",
@@ -259,7 +575,7 @@ def main() -> None:
         "--name",
         action="store",
         dest="name",
-        help="Name for optimization",
+        help="Name for optimization (default: <timestamp>_<method>_<subset>)",
     )
     parser.add_option(
         "-m",
@@ -282,6 +598,35 @@ def main() -> None:
         dest="output_dir",
         help="Path to output folder with optimization results (optional)",
     )
+    parser.add_option(
+        "-a",
+        "--analyze",
+        action="store",
+        dest="analyze",
+        help="Create reports from stored optimization results in the given "
+             "directory (no optimization)",
+    )
+    parser.add_option(
+        "--resume",
+        action="store_true",
+        dest="resume",
+        default=False,
+        help="Resume interrupted optimization from the stored results",
+    )
+    parser.add_option(
+        "--sparse",
+        action="store_true",
+        dest="sparse",
+        default=False,
+        help="Simulate only the time points of the data during the optimization",
+    )
+    parser.add_option(
+        "--jacobian",
+        action="store_true",
+        dest="jacobian",
+        default=False,
+        help="Jacobian from forward sensitivities for least-squares optimization",
+    )
 
     console.rule(style="white")
     console.print(":wrench: FIT LOSARTAN :wrench:")
@@ -295,6 +640,23 @@ def main() -> None:
         console.rule(style="white")
         sys.exit(1)
 
+    if options.analyze:
+        results_dir = Path(options.analyze)
+        if not results_dir.exists():
+            _parser_message(f"Results directory does not exist: '{results_dir}'.")
+        if options.output_dir:
+            output_dir = Path(options.output_dir)
+        else:
+            from pkdb_models.models.losartan import RESULTS_PATH_FIT
+            output_dir = RESULTS_PATH_FIT
+        fit_subset = FitExperimentSubset(options.subset) if options.subset else None
+        results = load_fit_results(results_dir, fit_subset=fit_subset)
+        if options.name and len(results) == 1:
+            results = {options.name: list(results.values())[0]}
+        console.print(results)
+        analyze_fit_results(results, output_dir=output_dir)
+        return
+
     if not options.cores:
         _parser_message("Required argument '--cores' missing.")
     if not options.runs:
@@ -322,7 +684,6 @@ def main() -> None:
     n_cores: int = int(options.cores)
     n_optimizations: int = int(options.runs)
     seed: int = int(options.seed)
-    name: str = str(options.name)
     method: str = str(options.method)
     subset: str = str(options.subset)
     strategy: str = str(options.strategy)
@@ -331,6 +692,13 @@ def main() -> None:
     fit_subset = FitExperimentSubset(subset)
     optimization_strategy = OptimizationStrategy(strategy)
 
+    name: str
+    if options.name:
+        name = str(options.name)
+    else:
+        # ends with the subset for the inference of the subset in '--analyze'
+        name = f"{datetime.now():%Y%m%d_%H%M%S}_{fit_method.value}_{fit_subset.value}"
+
     console.print(f"{'cores':<20}: {n_cores}")
     console.print(f"{'runs':<20}: {n_optimizations}")
     console.print(f"{'seed':<20}: {seed}")
@@ -338,6 +706,12 @@ def main() -> None:
     console.print(f"{'method':<20}: {fit_method}")
     console.print(f"{'subset':<20}: {fit_subset}")
     console.print(f"{'strategy':<20}: {optimization_strategy}")
+    console.print(f"{'resume':<20}: {options.resume}")
+    console.print(f"{'sparse':<20}: {options.sparse}")
+    console.print(f"{'jacobian':<20}: {options.jacobian}")
+
+    # storage of the optimization runs
+    storage_dir = output_dir / "runs" / name
 
     console.rule("Parameters", align="left", style="white")
 
@@ -358,40 +732,24 @@ def main() -> None:
         n_cores=n_cores,
         n_optimizations=n_optimizations,
         seed=seed,
+        storage_dir=storage_dir,
+        resume=options.resume,
+        fit_subset=fit_subset,
+        sparse_output=options.sparse,
+        sensitivity_jacobian=options.jacobian,
     )
-
-    # Serialization
-    # FIXME: this must store the results
     console.print(results)
-
-
-
-
-
-    # TODO: serialization
+    console.print(f"Optimization results stored in: {storage_dir}")
 
     console.rule(style="white")
-    # Create report
-    # FIXME: this creates the analysis;
-    # TODO: separate in different command
-
-    # parameters for plots
-    mpl_parameters = {
-        # 'axes.labelsize': 12,
-        # 'axes.labelweight': "bold",
-    }
-    for key, (opt_result, op) in results.items():
-        # create figures and outputs
-        opt_analysis = OptimizationAnalysis(
-            opt_result=opt_result,
-            op=op,
-            output_name=name,
-            output_dir=output_dir,
-            show_plots=False,
-            show_titles=False,
-            **fit_kwargs
-        )
-        opt_analysis.run(mpl_parameters=mpl_parameters)
+    # Create report, reports can be recreated with `fit_losartan --analyze`
+    analyze_fit_results(
+        {
+            name if len(results) == 1 else f"{name}_{opid}": result
+            for opid, result in results.items()
+        },
+        output_dir=output_dir,
+    )
 
 
 if __name__ == "__main__":
@@ -400,9 +758,21 @@ if __name__ == "__main__":
         
     fit_losartan
     fit_losartan --cores=10 --runs=10 --seed=1234 --method=LSQ --strategy=ALL --subset=PK --name=LOSARTAN_LSQ_PK
+    fit_losartan --cores=10 --runs=10 --seed=1234 --method=LSQ --strategy=ALL --subset=PK --name=LOSARTAN_LSQ_PK_SPARSE --sparse
+    fit_losartan --cores=10 --runs=10 --seed=1234 --method=LSQ --strategy=ALL --subset=PK --name=LOSARTAN_LSQ_PK_JAC --sparse --jacobian
     fit_losartan --cores=10 --runs=10 --seed=1234 --method=LSQ --strategy=ALL --subset=PD --name=LOSARTAN_LSQ_PD
     
     fit_losartan --cores=10 --runs=10 --seed=1234 --method=LSQ --strategy=ALL --subset=CONTROL --name=LOSARTAN_LSQ_CONTROL
     fit_losartan --cores=10 --runs=20 --seed=1234 --method=LSQ --strategy=ALL --subset=ALL --name=LOSARTAN_LSQ_ALL
+
+    Runs are stored in batches in 'results/fit/runs/<name>', batch k uses the
+    seed 'seed + k'. The start points differ from fits before the batched storage
+    with the same '--seed'. Without '--name' a timestamped name is used.
+
+    Reports from stored optimization results (no optimization):
+
+    fit_losartan --analyze=results/fit/runs/LOSARTAN_LSQ_PK
+    fit_losartan --analyze=fit/20250708_183921__4fba0
+    fit_losartan --analyze=fit/20250711_231400__8d0b3
     """
     main()
@@ -0,0 +1,324 @@
+"""Residual Jacobian of the least-squares fit from forward sensitivities.
+
+Without a Jacobian `least_squares` approximates it by finite differences,
+i.e. one additional simulation of all fit experiments per parameter and
+iteration, with a large `diff_step` to step over the integration noise.
+
+Here the derivatives of the observables with respect to the fit parameters
+are calculated from the forward sensitivities `dx(t)/dp` of the model
+(CVODES via roadrunner), which are integrated together with every timecourse
+of a simulation:
+
+- amounts are state variables, their derivatives are the sensitivities
+- concentrations `C = A/V`: `dC/dp = (dA/dp - C dV/dp) / V`
+
+The sensitivities are interpolated to the time points of the data and
+transformed like the residuals (baseline, normalization, weights) and to the
+parameter scale of the optimizer.
+
+Roadrunner starts the sensitivities of every timecourse at zero. This is
+exact if the sensitivities at the end of the previous timecourse are zero
+(e.g. a pre-simulation without drug for the pharmacokinetic parameters) or
+are reset by the changes of the timecourse. Parameters with sensitivities
+which are carried over to the next timecourse (e.g. repeated dosing), and
+observables which are not state variables (assignment rules), are
+differentiated by forward differences of the respective simulation. The forward
+sensitivities of roadrunner do not support events, simulations with the events
+of a dosing regimen or urine collection are differentiated by forward
+differences.
+
+The Jacobian requires the linear loss function.
+"""
+from typing import Dict, List, Set, Tuple
+
+import numpy as np
+from sbmlsim.fit.options import LossFunctionType, ResidualType
+from sbmlsim.fit.optimization import OptimizationProblem
+from sbmlsim.simulation import TimecourseSim
+from sbmlutils.log import get_logger
+
+from pkdb_models.models.losartan.sensitivity.forward_sensitivity import (
+    _species_compartments,
+    _time_series_sensitivities,
+)
+
+logger = get_logger(__name__)
+
+
+def _magnitude(value) -> float:
+    return float(value.magnitude) if hasattr(value, "magnitude") else float(value)
+
+
+def _has_events(simulation: TimecourseSim) -> bool:
+    """Simulation with dosing regimen or urine collection events."""
+    return any(
+        (key.startswith("n_regimen_") or key == "n_urine") and _magnitude(item) > 0
+        for tc in simulation.timecourses
+        for key, item in tc.changes.items()
+    )
+
+
+def _set_changes(
+    op: OptimizationProblem, simulation: TimecourseSim, simulator, x: np.ndarray
+) -> None:
+    """Set the parameters on the simulation (as in the residuals)."""
+    Q_ = op.runner.Q_
+    simulation.timecourses[0].changes.update(
+        {op.pids[ix]: Q_(value, op.punits[ix]) for ix, value in enumerate(x)}
+    )
+    simulation.normalize(uinfo=simulator.uinfo)
+
+
+def _sensitivity_timecourses(
+    r,
+    simulation: TimecourseSim,
+    pids: List[str],
+    selections: List[str],
+    compartments: Dict[str, str],
+    atol: float,
+) -> Tuple[np.ndarray, Dict[str, np.ndarray], Set[int]]:
+    """Derivatives of the selections along the simulation.
+
+    :return: time points, derivatives of the selections [time x parameters]
+        with respect to the model parameters, indices of the parameters with
+        sensitivities carried over between timecourses
+    """
+    if simulation.reset:
+        r.resetToOrigin()
+
+    times: List[np.ndarray] = []
+    derivatives: Dict[str, List[np.ndarray]] = {sel: [] for sel in selections}
+    carried: Set[int] = set()
+    sens_end = None
+    variables: List[str] = []
+    t_offset = simulation.time_offset
+    for k, tc in enumerate(simulation.timecourses):
+        if k == 0:
+            for key, item in tc.model_changes.items():
+                r[key] = _magnitude(item)
+        for key, item in tc.changes.items():
+            r[key] = _magnitude(item)
+
+        if sens_end is not None:
+            reset = {key[1:-1] if key.startswith("[") else key for key in tc.changes}
+            kept = [kv for kv, sid in enumerate(variables) if sid not in reset]
+            p = np.array([r.getValue(pid) for pid in pids])
+            # change of the states per relative change of the parameters
+            carried.update(np.where(
+                np.any(np.abs(sens_end[:, kept] * p[:, np.newaxis]) > atol, axis=1)
+            )[0])
+
+        num = 2 if tc.discard else tc.steps + 1
+        state = r.saveStateS()
+        _, sens, variables = _time_series_sensitivities(
+            r, tc.start, tc.end, num, parameter_ids=pids
+        )
+        r.loadStateS(state)
+        sens_end = sens[-1]
+
+        # volumes and their derivatives
+        p = np.array([r.getValue(pid) for pid in pids])
+        compartment_ids = sorted({
+            compartments[sel[1:-1]] for sel in selections
+            if sel.startswith("[") and sel[1:-1] in compartments
+        })
+        volumes = {cid: r.getValue(cid) for cid in compartment_ids}
+        dvolumes = {cid: np.zeros(len(pids)) for cid in compartment_ids}
+        for j, pid in enumerate(pids):
+            dp = 1e-6 * p[j] if p[j] != 0.0 else 1e-6
+            r.setValue(pid, p[j] + dp)
+            v_up = {cid: r.getValue(cid) for cid in compartment_ids}
+            r.setValue(pid, p[j] - dp)
+            v_down = {cid: r.getValue(cid) for cid in compartment_ids}
+            r.setValue(pid, p[j])
+            for cid in compartment_ids:
+                dvolumes[cid][j] = (v_up[cid] - v_down[cid]) / (2 * dp)
+
+        # values on the time grid of the sensitivities
+        integrator = r.integrator
+        variable_step_size = integrator.getValue("variable_step_size")
+        integrator.setValue("variable_step_size", False)
+        try:
+            s = r.simulate(start=tc.start, end=tc.end, steps=num - 1)
+        finally:
+            integrator.setValue("variable_step_size", variable_step_size)
+
+        if tc.discard:
+            continue
+
+        times.append(np.asarray(s["time"]) + t_offset)
+        t_offset += tc.end
+        for sel in selections:
+            sid = sel[1:-1] if sel.startswith("[") else sel
+            if sel.startswith("[") and sid in variables:
+                cid = compartments[sid]
+                derivatives[sel].append(
+                    (
+                        sens[:, :, variables.index(sid)]
+                        - np.outer(np.asarray(s[sel]), dvolumes[cid])
+                    ) / volumes[cid]
+                )
+            elif sel in variables:
+                derivatives[sel].append(sens[:, :, variables.index(sel)])
+
+    return (
+        np.concatenate(times),
+        {
+            sel: np.vstack(values)
+            for sel, values in derivatives.items()
+            if len(values) == len(times)
+        },
+        carried,
+    )
+
+
+def _observables(
+    op: OptimizationProblem, simulator, simulation: TimecourseSim, indices: List[int]
+) -> Dict[int, np.ndarray]:
+    """Simulated observables of the mappings at the data time points."""
+    df = simulator._timecourses([simulation])[0]
+    return {
+        k: np.interp(
+            op.x_references[k],
+            df[op.xid_observable[k]].values,
+            df[op.yid_observable[k]].values,
+        )
+        for k in indices
+    }
+
+
+def _difference_derivatives(
+    op: OptimizationProblem,
+    simulator,
+    simulation: TimecourseSim,
+    indices: List[int],
+    x: np.ndarray,
+    columns: List[int],
+    step: float,
+    derivatives: Dict[int, np.ndarray],
+) -> None:
+    """Forward differences of the observables for the parameter columns."""
+    _set_changes(op, simulation, simulator, x)
+    y0 = _observables(op, simulator, simulation, indices)
+    for j in columns:
+        x_up = x.copy()
+        h = step * x[j] if x[j] != 0.0 else step
+        x_up[j] = x[j] + h
+        _set_changes(op, simulation, simulator, x_up)
+        y_up = _observables(op, simulator, simulation, indices)
+        for k in indices:
+            derivatives[k][:, j] = (y_up[k] - y0[k]) / h
+    _set_changes(op, simulation, simulator, x)
+
+
+def sensitivity_jacobian(
+    op: OptimizationProblem, xlog: np.ndarray, step: float = 1e-3
+) -> np.ndarray:
+    """Jacobian of the weighted residuals of the fit mappings.
+
+    :param op: initialized optimization problem
+    :param xlog: parameters in the scale of the optimizer
+    :param step: relative parameter change of the forward differences
+    :return: Jacobian [residuals x parameters]
+    """
+    if op.loss_function != LossFunctionType.LINEAR:
+        raise ValueError(
+            f"Sensitivity Jacobian requires loss function "
+            f"'{LossFunctionType.LINEAR}', but '{op.loss_function}'."
+        )
+    x = np.power(10, xlog)
+    n_p = len(x)
+    simulator = op.runner.simulator
+    atol = simulator.integrator_settings.get("absolute_tolerance", 1e-10)
+
+    indices = list(range(len(op.mapping_keys)))
+    groups: Dict[Tuple[int, int], List[int]] = {}
+    for k in indices:
+        groups.setdefault((id(op.models[k]), id(op.simulations[k])), []).append(k)
+
+    # derivatives of the observables with respect to the parameters
+    derivatives: Dict[int, np.ndarray] = {
+        k: np.zeros((len(op.x_references[k]), n_p)) for k in indices
+    }
+    for group in groups.values():
+        k0 = group[0]
+        model = op.models[k0]
+        simulation: TimecourseSim = op.simulations[k0]
+        simulator.set_model(model=model)
+        selections = sorted(
+            {op.xid_observable[k] for k in group} | {op.yid_observable[k] for k in group}
+        )
+        simulator.set_timecourse_selections(selections=selections)
+        _set_changes(op, simulation, simulator, x)
+
+        # conversion of the parameters into the units of the model
+        p_model = np.array([
+            _magnitude(simulation.timecourses[0].changes[pid]) for pid in op.pids
+        ])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            factors = np.where(x != 0.0, p_model / x, 1.0)
+
+        columns: Set[int] = set()
+        if _has_events(simulation):
+            columns.update(range(n_p))
+        else:
+            try:
+                times, dsel, carried = _sensitivity_timecourses(
+                    simulator.r,
+                    simulation,
+                    pids=op.pids,
+                    selections=selections,
+                    compartments=_species_compartments(str(model.source.path)),
+                    atol=atol,
+                )
+                columns.update(carried)
+                for k in group:
+                    yid = op.yid_observable[k]
+                    if yid not in dsel:
+                        columns.update(range(n_p))
+                        continue
+                    for j in range(n_p):
+                        derivatives[k][:, j] = factors[j] * np.interp(
+                            op.x_references[k], times, dsel[yid][:, j]
+                        )
+            except RuntimeError as err:
+                logger.error(f"Forward sensitivities failed ('{op.pids} = {x}'): {err}")
+                columns.update(range(n_p))
+
+        if columns:
+            try:
+                _difference_derivatives(
+                    op,
+                    simulator,
+                    simulation,
+                    indices=group,
+                    x=x,
+                    columns=sorted(columns),
+                    step=step,
+                    derivatives=derivatives,
+                )
+            except RuntimeError as err:
+                # residuals of failed integrations are constant
+                logger.error(f"Integration failed ('{op.pids} = {x}'): {err}")
+                for k in group:
+                    derivatives[k][:] = 0.0
+
+    # derivatives of the weighted residuals (see `OptimizationProblem.residuals`)
+    rows = []
+    for k in indices:
+        dy = derivatives[k]
+        if op.residual in {
+            ResidualType.ABSOLUTE_TO_BASELINE,
+            ResidualType.NORMALIZED_TO_BASELINE,
+        }:
+            dy = dy - dy[0]
+        if op.residual in {
+            ResidualType.NORMALIZED,
+            ResidualType.NORMALIZED_TO_BASELINE,
+        }:
+            dy = dy / np.mean(op.y_references[k])
+        rows.append(dy * np.reshape(np.sqrt(op.weights[k]), (-1, 1)))
+
+    # derivative of the parameters with respect to the scale of the optimizer (log10)
+    dxdxlog = np.log(10) * x
+    return np.vstack(rows) * dxdxlog[np.newaxis, :]
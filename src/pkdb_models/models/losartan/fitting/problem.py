@@ -0,0 +1,126 @@
+"""Optimization problem of the losartan fits.
+
+`OptimizationProblem` with two optional modes of the objective evaluation:
+
+- `sparse_output`: the simulations only output the time points of the data
+  (see `SimulatorSparseOutput`)
+- `sensitivity_jacobian`: least-squares fits use the residual Jacobian from
+  forward sensitivities (see `sensitivity_jacobian`) instead of finite
+  differences
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+from sbmlsim.fit.optimization import OptimizationProblem
+from sbmlsim.fit.options import (
+    LossFunctionType,
+    OptimizationAlgorithmType,
+    ResidualType,
+    WeightingCurvesType,
+    WeightingPointsType,
+)
+from sbmlutils.log import get_logger
+
+from pkdb_models.models.losartan.fitting.jacobian import sensitivity_jacobian
+from pkdb_models.models.losartan.fitting.sparse_output import SimulatorSparseOutput
+
+logger = get_logger(__name__)
+
+
+class LosartanOptimizationProblem(OptimizationProblem):
+    """Optimization problem with sparse output and sensitivity Jacobian."""
+
+    def __init__(
+        self,
+        *args,
+        sparse_output: bool = False,
+        sensitivity_jacobian: bool = False,
+        **kwargs,
+    ):
+        """Initialize optimization problem.
+
+        :param sparse_output: simulate only the time points of the data
+        :param sensitivity_jacobian: residual Jacobian of least-squares fits
+            from forward sensitivities
+        """
+        self.sparse_output = sparse_output
+        self.sensitivity_jacobian = sensitivity_jacobian
+        super().__init__(*args, **kwargs)
+
+    def initialize(
+        self,
+        residual: Optional[ResidualType],
+        loss_function: LossFunctionType,
+        weighting_curves: List[WeightingCurvesType],
+        weighting_points: Optional[WeightingPointsType],
+        variable_step_size: bool = True,
+        relative_tolerance: float = 1e-6,
+        absolute_tolerance: float = 1e-6,
+    ) -> None:
+        """Initialize the problem, with `sparse_output` the `SimulatorSparseOutput` is set."""
+        super().initialize(
+            residual=residual,
+            loss_function=loss_function,
+            weighting_curves=weighting_curves,
+            weighting_points=weighting_points,
+            variable_step_size=variable_step_size,
+            relative_tolerance=relative_tolerance,
+            absolute_tolerance=absolute_tolerance,
+        )
+        if not self.sparse_output:
+            return
+
+        simulator = SimulatorSparseOutput(
+            absolute_tolerance=absolute_tolerance,
+            relative_tolerance=relative_tolerance,
+            variable_step_size=variable_step_size,
+        )
+        simulator.output_times = self.output_times()
+        self.set_simulator(simulator)
+
+        n_points = sum(len(times) for times in simulator.output_times.values())
+        logger.info(
+            f"'{self.opid}': output at {n_points} time points of "
+            f"{len(simulator.output_times)} simulations"
+        )
+
+    def output_times(self) -> Dict[int, np.ndarray]:
+        """Union of the data time points of the mappings of every simulation."""
+        times: Dict[int, List[np.ndarray]] = {}
+        for k, simulation in enumerate(self.simulations):
+            times.setdefault(id(simulation), []).append(
+                np.asarray(self.x_references[k], dtype=float)
+            )
+        return {key: np.unique(np.concatenate(values)) for key, values in times.items()}
+
+    def residuals(self, xlog: np.ndarray, complete_data: bool = False):
+        """Residuals for given parameter vector.
+
+        The complete data of the mappings (reports) is simulated with dense output.
+        """
+        simulator = self.runner.simulator
+        if not complete_data or not isinstance(simulator, SimulatorSparseOutput):
+            return super().residuals(xlog, complete_data=complete_data)
+
+        simulator.sparse = False
+        try:
+            return super().residuals(xlog, complete_data=complete_data)
+        finally:
+            simulator.sparse = True
+
+    def jacobian(self, xlog: np.ndarray) -> np.ndarray:
+        """Jacobian of the residuals from forward sensitivities."""
+        return sensitivity_jacobian(self, xlog)
+
+    def _optimize_single(
+        self,
+        x0=None,
+        algorithm: OptimizationAlgorithmType = OptimizationAlgorithmType.LEAST_SQUARE,
+        **kwargs,
+    ):
+        """Run single optimization, least-squares with the sensitivity Jacobian."""
+        if self.sensitivity_jacobian and algorithm == OptimizationAlgorithmType.LEAST_SQUARE:
+            # `diff_step` is only used by finite difference Jacobians
+            kwargs.pop("diff_step", None)
+            kwargs["jac"] = self.jacobian
+        return super()._optimize_single(x0=x0, algorithm=algorithm, **kwargs)
@@ -0,0 +1,137 @@
+"""Concurrent fitting of independent optimization problems.
+
+With `OptimizationStrategy.SINGLE` every study is an optimization problem of
+its own. Instead of running the problems one after the other (with the
+multistart of a single problem distributed over the cores), every single
+optimization run of every problem is a task on one shared pool of worker
+processes. Tasks are dispatched dynamically, i.e. a worker takes the next
+task as soon as it is free, and tasks of expensive problems (many mappings)
+are dispatched first, so that short studies do not wait for long studies
+and the pool is not idle at the end.
+
+The workers create the optimization problems on first use (loading models
+and data once per worker and problem).
+"""
+import multiprocessing
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sbmlsim.fit import FitExperiment, FitParameter
+from sbmlsim.fit.optimization import OptimizationProblem
+from sbmlsim.fit.result import OptimizationResult
+from sbmlutils.console import console
+from sbmlutils.log import get_logger
+
+from pkdb_models.models.losartan.fitting.storage import FitStorage
+
+logger = get_logger(__name__)
+
+_worker_problems: Dict[str, List[FitExperiment]] = {}
+_worker_ops: Dict[str, OptimizationProblem] = {}
+_worker_parameters: List[FitParameter] = []
+_worker_create_problem: Optional[Callable] = None
+_worker_fit_function: Optional[Callable] = None
+_worker_fit_kwargs: Dict = {}
+
+
+def _init_worker(
+    problems: Dict[str, List[FitExperiment]],
+    parameters: List[FitParameter],
+    create_problem: Callable,
+    fit_function: Callable,
+    fit_kwargs: Dict,
+) -> None:
+    """Set the problems and fit function of the worker process."""
+    global _worker_problems, _worker_ops, _worker_parameters
+    global _worker_create_problem, _worker_fit_function, _worker_fit_kwargs
+    _worker_problems = problems
+    _worker_ops = {}
+    _worker_parameters = parameters
+    _worker_create_problem = create_problem
+    _worker_fit_function = fit_function
+    _worker_fit_kwargs = fit_kwargs
+
+
+def _fit_task(args: Tuple[str, int, int]) -> Tuple[str, int, int, OptimizationResult]:
+    """Single optimization run of a problem in the worker process."""
+    opid, k, seed = args
+    if opid not in _worker_ops:
+        _worker_ops[opid] = _worker_create_problem(
+            fit_experiments=_worker_problems[opid], opid=opid, parameters=_worker_parameters
+        )
+    # the worker is a daemon process of the pool: optimization in the process
+    opt_result, _ = _worker_fit_function(
+        _worker_ops[opid], seed=seed, size=1, serial=True, **_worker_fit_kwargs
+    )
+    return opid, k, seed, opt_result
+
+
+def problem_weight(fit_experiments: List[FitExperiment]) -> int:
+    """Estimated cost of an optimization problem, the number of mappings."""
+    return sum(len(fit_exp.mappings) for fit_exp in fit_experiments)
+
+
+def fit_problems(
+    problems: Dict[str, List[FitExperiment]],
+    parameters: List[FitParameter],
+    create_problem: Callable,
+    fit_function: Callable,
+    fit_kwargs: Dict,
+    n_cores: int,
+    n_optimizations: int,
+    seed: int,
+    storages: Optional[Dict[str, FitStorage]] = None,
+    completed: Optional[Dict[str, set]] = None,
+) -> Dict[str, OptimizationResult]:
+    """Fit independent optimization problems on a shared pool of workers.
+
+    The seed of run k of every problem is `seed + k`.
+
+    :param problems: fit experiments by problem id
+    :param parameters: fit parameters of all problems
+    :param create_problem: function creating an `OptimizationProblem` from
+        `fit_experiments`, `opid` and `parameters`
+    :param fit_function: optimization function, e.g. `fitlsq`
+    :param fit_kwargs: settings of the optimization
+    :param n_cores: number of worker processes
+    :param n_optimizations: number of runs per problem
+    :param seed: seed of the first run
+    :param storages: storages of the problems, every finished run is stored
+        as a batch of its own
+    :param completed: runs of the problems already in the storages
+    :return: optimization results by problem id
+    """
+    completed = completed if completed else {}
+    weights = {opid: problem_weight(fit_exps) for opid, fit_exps in problems.items()}
+    tasks = [
+        (opid, k, seed + k)
+        for opid in problems
+        for k in range(n_optimizations)
+        if k not in completed.get(opid, set())
+    ]
+    # longest processing time first: runs of expensive problems are dispatched first
+    tasks.sort(key=lambda task: (-weights[task[0]], task[1]))
+    console.print(
+        f"Fit {len(problems)} problems: {len(tasks)} runs on {n_cores} workers"
+    )
+
+    results: Dict[str, List[OptimizationResult]] = {opid: [] for opid in problems}
+    with multiprocessing.Pool(
+        processes=n_cores,
+        initializer=_init_worker,
+        initargs=(problems, parameters, create_problem, fit_function, fit_kwargs),
+    ) as pool:
+        for opid, k, run_seed, opt_result in pool.imap_unordered(_fit_task, tasks):
+            if storages:
+                storages[opid].append_runs(batch=k, seed=run_seed, opt_result=opt_result)
+            results[opid].append(opt_result)
+            logger.info(f"Finished run {k} of '{opid}'")
+
+    if storages:
+        return {
+            opid: storages[opid].optimization_result(parameters=parameters)
+            for opid in problems
+        }
+    return {
+        opid: OptimizationResult.combine(opt_results)
+        for opid, opt_results in results.items()
+    }
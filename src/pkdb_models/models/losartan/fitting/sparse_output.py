@@ -0,0 +1,92 @@
+"""Simulation output at the time points of the data during fitting.
+
+The residuals of an `OptimizationProblem` interpolate the simulated
+timecourses to the time points of the reference data. By default every
+timecourse is integrated with dense output (every step of the integrator with
+`variable_step_size`), although only the values at the data time points are
+used.
+
+`LosartanOptimizationProblem` with `sparse_output` sets a
+`SimulatorSparseOutput` on the problem which requests output of every
+simulation only at the union of the data time points of the fit mappings of
+the simulation (plus the start and end of every timecourse). The integrator still controls its step size internally;
+the interpolation of the residuals becomes a lookup of the simulated points.
+
+Reports of the problem (residuals with `complete_data`) are simulated with
+dense output so that the plotted curves are unchanged.
+"""
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from sbmlsim.simulation import Timecourse, TimecourseSim
+from sbmlsim.simulator.simulation_serial import SimulatorSerial
+from sbmlutils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class SimulatorSparseOutput(SimulatorSerial):
+    """Serial simulator with output only at requested time points.
+
+    The requested time points are registered per simulation object in
+    `output_times` (keys are `id(simulation)`), all other simulations are run
+    with the output of the `SimulatorSerial`.
+    """
+
+    def __init__(self, model=None, **kwargs):
+        """Initialize simulator.
+
+        :param model: Path to model or model
+        :param kwargs: integrator settings
+        """
+        self.output_times: Dict[int, np.ndarray] = {}
+        self.sparse: bool = True
+        super().__init__(model=model, **kwargs)
+
+    def _timecourse(self, simulation: TimecourseSim) -> pd.DataFrame:
+        """Timecourse simulation with output at the requested time points."""
+        if isinstance(simulation, Timecourse):
+            simulation = TimecourseSim(timecourses=[simulation])
+
+        times = self.output_times.get(id(simulation)) if self.sparse else None
+        if times is None or any(tc.model_manipulations for tc in simulation.timecourses):
+            return super()._timecourse(simulation)
+
+        r = self.r
+        if simulation.reset:
+            r.resetToOrigin()
+
+        frames: List[pd.DataFrame] = []
+        t_offset = simulation.time_offset
+        for k, tc in enumerate(simulation.timecourses):
+            if k == 0 and tc.model_changes:
+                for key, item in tc.model_changes.items():
+                    r[key] = item.magnitude if hasattr(item, "magnitude") else item
+            for key, item in tc.changes.items():
+                r[key] = float(item.magnitude) if hasattr(item, "magnitude") else float(item)
+
+            # time points of the timecourse (local time of the timecourse)
+            tc_times = [tc.start, tc.end]
+            if not tc.discard:
+                t_local = times - t_offset
+                tc_times.extend(t_local[(t_local > tc.start) & (t_local < tc.end)])
+            tc_times = np.unique(tc_times)
+
+            # fixed output times, the integrator keeps its adaptive steps
+            integrator = r.integrator
+            variable_step_size = integrator.getValue("variable_step_size")
+            integrator.setValue("variable_step_size", False)
+            try:
+                s = r.simulate(times=tc_times)
+            finally:
+                integrator.setValue("variable_step_size", variable_step_size)
+
+            df = pd.DataFrame(s, columns=s.colnames)
+            df.time = df.time + t_offset
+
+            if not tc.discard:
+                t_offset += tc.end
+                frames.append(df)
+
+        return pd.concat(frames, sort=False)
@@ -0,0 +1,234 @@
+"""Persistent storage of optimization results.
+
+The runs of an optimization problem are stored in a directory per problem:
+
+- `problem.json`: description of the problem (experiments, parameters,
+  method, seed and settings); a resumed fit must have the same description
+- `runs.jsonl`: one JSON line per optimization run with the final and start
+  parameters, cost, status and the trajectory (parameters and cost of every
+  evaluation)
+
+Results of earlier fits (`optimization_result.tsv` and `report.txt` of the
+fit reports) can be read as well; they contain no trajectories.
+
+The multistart optimization is run in batches; the runs of a batch are
+appended (and flushed to disk) as soon as the batch finished. An interrupted
+fit resumes with the batches which are not in the storage; runs of
+incomplete batches and incomplete lines of an interrupted write are
+discarded.
+"""
+import ast
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import OptimizeResult
+from sbmlsim.fit import FitParameter
+from sbmlsim.fit.result import OptimizationResult
+from sbmlutils.log import get_logger
+
+logger = get_logger(__name__)
+
+PROBLEM_FILE = "problem.json"
+RUNS_FILE = "runs.jsonl"
+RESULT_FILE_TSV = "optimization_result.tsv"
+REPORT_FILE = "report.txt"
+
+# stored fields of the single optimizations
+FIT_KEYS = ["x", "x0", "cost", "success", "status", "message", "duration", "nfev", "nit"]
+
+
+def _to_json(value: Any) -> Any:
+    """Convert numpy values for JSON serialization."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _trajectory_to_dict(trajectory: List[Tuple[np.ndarray, float]]) -> Dict[str, Any]:
+    """Split trajectory of (parameters, cost) steps in costs and parameters."""
+    return {
+        "trajectory_cost": [float(cost) for _, cost in trajectory],
+        "trajectory_x": [np.asarray(x, dtype=float).tolist() for x, _ in trajectory],
+    }
+
+
+def _trajectory_from_dict(d: Dict[str, Any]) -> List[Tuple[np.ndarray, float]]:
+    costs = d.get("trajectory_cost", [])
+    xs = d.get("trajectory_x") or []
+    return [(np.array(x), cost) for x, cost in zip(xs, costs)]
+
+
+def parameters_info(parameters: List[FitParameter]) -> List[List[Any]]:
+    """Description of the fit parameters."""
+    return [
+        [p.pid, p.lower_bound, p.upper_bound, p.start_value, p.unit] for p in parameters
+    ]
+
+
+class FitStorage:
+    """Runs of an optimization problem stored on disk."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    @property
+    def problem_path(self) -> Path:
+        return self.path / PROBLEM_FILE
+
+    @property
+    def runs_path(self) -> Path:
+        return self.path / RUNS_FILE
+
+    def exists(self) -> bool:
+        return self.problem_path.exists()
+
+    def write_problem(self, info: Dict[str, Any]) -> None:
+        """Write description of the optimization problem."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.problem_path, "w") as f:
+            json.dump(info, f, indent=2, default=str)
+
+    def read_problem(self) -> Dict[str, Any]:
+        with open(self.problem_path, "r") as f:
+            return json.load(f)
+
+    def append_runs(self, batch: int, seed: int, opt_result: OptimizationResult) -> None:
+        """Append the runs of a completed batch."""
+        n_stored = max((run["run"] + 1 for run in self.read_runs()), default=0)
+        lines = []
+        for k, fit in enumerate(opt_result.fits):
+            d: Dict[str, Any] = {"run": n_stored + k, "batch": batch, "seed": seed}
+            for key in FIT_KEYS:
+                if key in fit:
+                    d[key] = _to_json(fit[key])
+            trajectory = opt_result.trajectories[k] if k < len(opt_result.trajectories) else []
+            d.update(_trajectory_to_dict(trajectory))
+            lines.append(json.dumps(d, default=_to_json))
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.runs_path, "a") as f:
+            f.write("".join(f"{line}\n" for line in lines))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read_runs(self) -> List[Dict[str, Any]]:
+        """Read stored runs, incomplete lines are skipped."""
+        if not self.runs_path.exists():
+            return []
+        runs = []
+        with open(self.runs_path, "r") as f:
+            for line in f:
+                try:
+                    runs.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f"Skip incomplete run in '{self.runs_path}'")
+        return runs
+
+    def completed_batches(self, batch_sizes: Dict[int, int]) -> Set[int]:
+        """Batches with all runs stored.
+
+        :param batch_sizes: number of runs per batch
+        """
+        counts: Dict[int, int] = {}
+        for run in self.read_runs():
+            counts[run["batch"]] = counts.get(run["batch"], 0) + 1
+        return {
+            batch for batch, size in batch_sizes.items() if counts.get(batch, 0) >= size
+        }
+
+    def discard_incomplete(self, batch_sizes: Dict[int, int]) -> None:
+        """Remove runs of incomplete batches and incomplete lines.
+
+        Incomplete batches are rerun when the fit resumes.
+        """
+        if not self.runs_path.exists():
+            return
+        completed = self.completed_batches(batch_sizes)
+        runs = [run for run in self.read_runs() if run["batch"] in completed]
+        tmp_path = self.runs_path.with_name(f"{RUNS_FILE}.tmp")
+        with open(tmp_path, "w") as f:
+            f.write("".join(f"{json.dumps(run)}\n" for run in runs))
+        os.replace(tmp_path, self.runs_path)
+
+    def optimization_result(
+        self, parameters: Optional[List[FitParameter]] = None
+    ) -> OptimizationResult:
+        """Optimization result of all stored runs.
+
+        :param parameters: fit parameters, by default from the problem description
+        """
+        if parameters is None:
+            parameters = [
+                FitParameter(
+                    pid=pid, lower_bound=lb, upper_bound=ub, start_value=value, unit=unit
+                )
+                for pid, lb, ub, value, unit in self.read_problem()["parameters"]
+            ]
+        runs = self.read_runs()
+        if not runs:
+            raise ValueError(f"No optimization runs stored in '{self.path}'")
+
+        fits = []
+        trajectories = []
+        for run in runs:
+            fit = OptimizeResult(**{key: run[key] for key in FIT_KEYS if key in run})
+            fit.x = np.array(fit.x)
+            fit.x0 = np.array(fit.x0)
+            fits.append(fit)
+            trajectories.append(_trajectory_from_dict(run))
+
+        return OptimizationResult(
+            parameters=parameters, fits=fits, trajectories=trajectories
+        )
+
+
+def _parse_array(value: str) -> np.ndarray:
+    """Parse numpy array string of the TSV, e.g. '[1.4e-01 3.2e+00]'."""
+    return np.array(value.strip().strip("[]").split(), dtype=float)
+
+
+def tsv_parameter_ids(path: Path) -> List[str]:
+    """Ids of the fit parameters in an `optimization_result.tsv`."""
+    columns = list(pd.read_csv(path, sep="\t", nrows=0).columns)
+    return columns[columns.index("cost") + 1:columns.index("message")]
+
+
+def read_optimization_result_tsv(
+    path: Path, parameters: List[FitParameter]
+) -> OptimizationResult:
+    """Optimization result of an `optimization_result.tsv` (without trajectories)."""
+    df = pd.read_csv(path, sep="\t")
+    fits = []
+    for _, row in df.iterrows():
+        fits.append(OptimizeResult(
+            x=_parse_array(row.x),
+            x0=_parse_array(row.x0),
+            cost=float(row.cost),
+            success=str(row.success) == "True",
+            message=row.message,
+            duration=float(row.duration),
+        ))
+    return OptimizationResult(
+        parameters=parameters, fits=fits, trajectories=[[] for _ in fits]
+    )
+
+
+def read_report(path: Path) -> Dict[str, Any]:
+    """Optimization problem id, experiments and mappings of a fit `report.txt`."""
+    info: Dict[str, Any] = {"opid": None, "experiments": []}
+    experiments = info["experiments"]
+    with open(path, "r") as f:
+        for line in f:
+            if line.startswith("OptimizationProblem: ") and info["opid"] is None:
+                info["opid"] = line[len("OptimizationProblem: "):].strip()
+            elif line.startswith("experiment: "):
+                experiments.append([line[len("experiment: "):].strip(), []])
+            elif line.startswith("mappings: ") and experiments:
+                experiments[-1][1] = ast.literal_eval(line[len("mappings: "):].strip())
+    return info
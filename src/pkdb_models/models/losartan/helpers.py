@@ -1,5 +1,6 @@
+import multiprocessing
 from pathlib import Path
-from typing import List, Type, Union
+from typing import Any, Dict, List, Optional, Type, Union
 
 from pkdb_models.models.losartan import (
     DATA_PATHS,
@@ -8,27 +9,242 @@ from pkdb_models.models.losartan import (
     RESULTS_PATH_SIMULATION,
 )
 from sbmlsim.experiment import ExperimentRunner, SimulationExperiment
+from sbmlsim.experiment.experiment import ExperimentResult
+from sbmlsim.plot import Figure
 from sbmlsim.report.experiment_report import ExperimentReport, ReportResults
 from sbmlsim.simulator.simulation_serial import SimulatorSerial
 from sbmlutils import log
 from sbmlutils.console import console
 
+from pkdb_models.models.losartan.experiments.base_experiment import (
+    LosartanSimulationExperiment,
+)
+from pkdb_models.models.losartan.manifest import ExperimentManifest
+from pkdb_models.models.losartan.model_cache import (
+    disable_model_cache,
+    enable_model_cache,
+)
+from pkdb_models.models.losartan.rendering import FigureRenderer
+from pkdb_models.models.losartan.simulation_cache import SimulationCache
+from pkdb_models.models.losartan.simulator import SimulatorParallelScan
+
 logger = log.get_logger(__name__)
 
+# simulator of a worker process, the model is loaded once per worker
+_worker_simulator: Optional[SimulatorParallelScan] = None
+
 
 def run_experiments(
     experiment_classes: Union[
         Type[SimulationExperiment], List[Type[SimulationExperiment]]
     ],
     output_dir: str,
+    n_workers: int = 1,
+    n_scan_workers: int = 1,
+    use_cache: bool = True,
+    headless: bool = False,
+    figure_formats: Optional[List[str]] = None,
+    n_render_workers: int = 1,
+    incremental: bool = False,
+    use_model_cache: bool = False,
 ):
-    """Execute given simulation experiment(s)."""
-    simulator = SimulatorSerial(model=MODEL_PATH)
+    """Execute given simulation experiment(s).
+
+    With `n_workers > 1` the experiment classes are distributed over a pool
+    of worker processes. Every worker loads the model once and runs one
+    experiment class at a time; the report information of the experiments
+    is collected in the main process, so that the output layout and the
+    HTML report are identical to the serial run.
+
+    With `n_scan_workers > 1` the points of scans are distributed over a pool
+    of worker processes (see `SimulatorParallelScan`). Worker processes cannot
+    start pools of their own, so scans are only parallelized in serial runs.
+
+    With `use_cache` the results of simulations are reused from the
+    `SimulationCache`, a changed model, experiment or integrator setting
+    results in new simulations.
+
+    With `headless` no figures are created. Simulations, post-processing and
+    the evaluation of the fit mappings are run as usual; the results are
+    written as netCDF and TSV, post-processed results (e.g. pharmacokinetic
+    parameters) as TSV.
+
+    Figures are saved in the `figure_formats` (default: svg and png) with
+    the resolution `Figure.fig_dpi`. With `n_render_workers > 1` the figures
+    of serial runs are saved by a pool of render workers while the next
+    experiments are simulated (see `FigureRenderer`).
+
+    With `incremental` only experiments whose inputs changed since the last
+    run in the `output_dir` are run (see `ExperimentManifest`).
 
+    With `use_model_cache` the models are loaded from the cache of compiled
+    models (see `enable_model_cache`), in this and in all worker processes.
+    """
     output_path: Path = RESULTS_PATH_SIMULATION / output_dir
-    if isinstance(experiment_classes, SimulationExperiment):
+    if figure_formats is None:
+        figure_formats = ["svg", "png"]
+    if isinstance(experiment_classes, type):
         experiment_classes = [experiment_classes]
 
+    manifest: Optional[ExperimentManifest] = None
+    all_sids = [exp_class.__name__ for exp_class in experiment_classes]
+    if incremental:
+        manifest = ExperimentManifest(output_path)
+        settings = {
+            "headless": headless,
+            "figure_formats": figure_formats,
+            "fig_dpi": Figure.fig_dpi,
+        }
+        inputs = {
+            exp_class.__name__: ExperimentManifest.inputs(exp_class, settings=settings)
+            for exp_class in experiment_classes
+        }
+        experiment_classes = [
+            exp_class
+            for exp_class in experiment_classes
+            if not manifest.is_current(
+                exp_class.__name__, inputs[exp_class.__name__], output_path
+            )
+        ]
+        console.print(
+            f"Skip {len(all_sids) - len(experiment_classes)} unchanged experiments",
+            style="info",
+        )
+
+    report_results = ReportResults()
+    if experiment_classes:
+        if use_model_cache:
+            enable_model_cache()
+        try:
+            report_results.data = _execute_experiments(
+                experiment_classes=experiment_classes,
+                output_path=output_path,
+                n_workers=n_workers,
+                n_scan_workers=n_scan_workers,
+                use_cache=use_cache,
+                headless=headless,
+                figure_formats=figure_formats,
+                n_render_workers=n_render_workers,
+                use_model_cache=use_model_cache,
+            )
+        finally:
+            if use_model_cache:
+                disable_model_cache()
+
+    if manifest is not None:
+        for sid, data in report_results.data.items():
+            manifest.update(sid, inputs=inputs[sid], report_data=data)
+        manifest.save()
+        # report of all experiments in the order of the experiment classes
+        report_results.data = {
+            sid: report_results.data.get(sid) or manifest.report_data(sid)
+            for sid in all_sids
+        }
+
+    # create HTML report
+    report = ExperimentReport(report_results, metadata=None)
+    report.create_report(output_path, report_type=ExperimentReport.ReportType.HTML)
+
+    console.print("Successfully executed simulation experiments", style="success")
+
+
+def _execute_experiments(
+    experiment_classes: List[Type[SimulationExperiment]],
+    output_path: Path,
+    n_workers: int,
+    n_scan_workers: int,
+    use_cache: bool,
+    headless: bool,
+    figure_formats: List[str],
+    n_render_workers: int,
+    use_model_cache: bool = False,
+) -> Dict[str, Dict[str, Any]]:
+    """Run the experiments serially or on worker processes.
+
+    Returns the report information of the experiments.
+    """
+    report_results = ReportResults()
+    n_workers = min(n_workers, len(experiment_classes))
+    if n_workers > 1:
+        if n_scan_workers > 1:
+            logger.warning("Scans are run serially in experiment workers.")
+        if n_render_workers > 1:
+            logger.warning("Figures are saved by the experiment workers.")
+        console.print(
+            f"Run {len(experiment_classes)} experiments on {n_workers} workers",
+            style="info",
+        )
+        # figure settings are class attributes, which are not inherited by
+        # spawned processes
+        figure_settings = {
+            "fig_dpi": Figure.fig_dpi,
+            "legend_fontsize": Figure.legend_fontsize,
+        }
+        with multiprocessing.Pool(
+            processes=n_workers,
+            initializer=_init_worker,
+            initargs=(figure_settings, use_cache, use_model_cache),
+        ) as pool:
+            # imap keeps the order of the experiments for the report
+            for data in pool.imap(
+                _run_experiment_worker,
+                [
+                    (exp_class, output_path, headless, figure_formats)
+                    for exp_class in experiment_classes
+                ],
+                chunksize=1,
+            ):
+                report_results.data.update(data)
+    else:
+        simulator = SimulatorParallelScan(
+            model=MODEL_PATH,
+            n_workers=n_scan_workers,
+            cache=SimulationCache() if use_cache else None,
+        )
+        if n_render_workers > 1 and not headless:
+            LosartanSimulationExperiment.renderer = FigureRenderer(
+                n_workers=n_render_workers, dpi=Figure.fig_dpi
+            )
+        try:
+            results = _run_experiment_classes(
+                experiment_classes=experiment_classes,
+                output_path=output_path,
+                simulator=simulator,
+                show_figures=not headless,
+                headless=headless,
+                figure_formats=figure_formats,
+            )
+        finally:
+            simulator.close()
+            if LosartanSimulationExperiment.renderer is not None:
+                # wait for the figures of the last experiments
+                LosartanSimulationExperiment.renderer.close()
+                LosartanSimulationExperiment.renderer = None
+        if simulator.cache is not None:
+            console.print(
+                f"Simulation cache: {simulator.cache.hits} hits, "
+                f"{simulator.cache.misses} misses",
+                style="info",
+            )
+        for exp_result in results:
+            report_results.add_experiment_result(exp_result=exp_result)
+
+    return report_results.data
+
+
+def _run_experiment_classes(
+    experiment_classes: List[Type[SimulationExperiment]],
+    output_path: Path,
+    simulator: SimulatorSerial,
+    show_figures: bool,
+    headless: bool = False,
+    figure_formats: Optional[List[str]] = None,
+) -> List[ExperimentResult]:
+    """Run experiment classes with the given simulator.
+
+    In `headless` mode no figures are created, but the results are saved.
+    """
+    LosartanSimulationExperiment.headless = headless
     runner = ExperimentRunner(
         experiment_classes=experiment_classes,
         data_path=DATA_PATHS,
@@ -39,18 +255,50 @@ def run_experiments(
     )
     results = runner.run_experiments(
         output_path=output_path,
-        show_figures=True,
-        save_results=False,
-        figure_formats=["svg", "png"],
+        show_figures=show_figures,
+        save_results=headless,
+        figure_formats=[] if headless else figure_formats,
         reduced_selections=True,
     )
+    if headless:
+        for exp_result in results:
+            exp_result.experiment.save_data_results(exp_result.output_path)
+    return results
+
+
+def _init_worker(
+    figure_settings: Dict[str, Any], use_cache: bool, use_model_cache: bool
+) -> None:
+    """Load the model in the worker process."""
+    global _worker_simulator
+    if use_model_cache:
+        enable_model_cache()
+    for key, value in figure_settings.items():
+        setattr(Figure, key, value)
+    _worker_simulator = SimulatorParallelScan(
+        model=MODEL_PATH,
+        cache=SimulationCache() if use_cache else None,
+    )
 
+
+def _run_experiment_worker(
+    args: tuple[Type[SimulationExperiment], Path, bool, List[str]]
+) -> Dict[str, Any]:
+    """Run a single experiment class in a worker process.
+
+    Returns the report information of the experiment, the experiment itself
+    with its results stays in the worker.
+    """
+    experiment_class, output_path, headless, figure_formats = args
+    results = _run_experiment_classes(
+        experiment_classes=[experiment_class],
+        output_path=output_path,
+        simulator=_worker_simulator,
+        show_figures=False,
+        headless=headless,
+        figure_formats=figure_formats,
+    )
     report_results = ReportResults()
     for exp_result in results:
         report_results.add_experiment_result(exp_result=exp_result)
-
-    # create HTML report
-    report = ExperimentReport(report_results, metadata=None)
-    report.create_report(output_path, report_type=ExperimentReport.ReportType.HTML)
-
-    console.print("Successfully executed simulation experiments", style="success")
+    return report_results.data
@@ -1,160 +1,433 @@
+"""Pharmacokinetic and pharmacodynamic parameters of simulation scans.
+
+The parameters are calculated vectorized for all points of a scan: the
+kernels work on plain `[time x scan]` arrays and the units are handled once
+per column. `pk_parameters` reproduces the calculations of
+`pkdb_analysis.pk.pharmacokinetics.TimecoursePK`, `pk_units` the units of its
+parameters.
+"""
+import warnings
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
 import pandas as pd
-from pkdb_analysis.pk.pharmacokinetics import TimecoursePK
+from pint import Unit, UnitRegistry
+from scipy import stats
 
+# pharmacodynamic outputs
+PD_SIDS = [
+    "[ang1]",
+    "[ang2]",
+    "[ren]",
+    "[ald]",
+    "SBP",
+    "DBP",
+    "MAP",
+]
+
+# selections read by calculate_losartan_pk and calculate_losartan_pd
+PK_SELECTIONS = [
+    "PODOSE_los",
+    "[Cve_los]",
+    "[Cve_e3174]",
+    "[Cve_l158]",
+    "Aurine_e3174",
+    "Aurine_l158",
+    "Afeces_e3174",
+    "Afeces_l158",
+]
+PD_SELECTIONS = ["PODOSE_los", *PD_SIDS]
+
+# parameters of TimecoursePK with units and the regression parameters
+PK_PARAMETERS = [
+    "auc", "aucinf", "tmax", "cmax", "tmaxhalf", "cmaxhalf", "kel", "thalf",
+    "dose", "vd", "vdss", "cl",
+]
+PK_REGRESSION_PARAMETERS = [
+    "slope", "intercept", "r_value", "p_value", "std_err", "max_idx",
+]
+
+SUBSTANCE_INFO = {
+    "los": {
+        "conc_key": "[Cve_los]",
+        "aurine_key": "Aurine_e3174",
+        "afeces_key": "Afeces_e3174",
+        "dose_used": True,
+    },
+    "e3174": {
+        "conc_key": "[Cve_e3174]",
+        "aurine_key": "Aurine_e3174",
+        "afeces_key": "Afeces_e3174",
+        "dose_used": False,
+    },
+    "l158": {
+        "conc_key": "[Cve_l158]",
+        "aurine_key": "Aurine_l158",
+        "afeces_key": "Afeces_l158",
+        "dose_used": False,
+    },
+}
 
-def process_substance_pk(experiment, xres, scandim, dose_index, dose_value, substance, keys):
-    """Process PK calculations for a substance."""
-    Q_ = experiment.Q_
 
-    # Get time and concentration vectors
-    t_vec = Q_(xres.dim_mean("time").magnitude, xres.uinfo["time"])
-    conc_key = keys["conc_key"]
-    c_vec = Q_(
-        xres[conc_key].sel({scandim: dose_index}).values,
-        xres.uinfo[conc_key]
+def pk_parameters(
+    t: np.ndarray,
+    c: np.ndarray,
+    dose: Union[None, float, np.ndarray] = None,
+    min_treshold: float = 1e8,
+) -> Dict[str, np.ndarray]:
+    """Pharmacokinetic parameters of timecourses without units.
+
+    Vectorized version of `TimecoursePK` (intervention at time 0): the
+    parameters of all columns of `c` are calculated at once. The results are
+    in the units resulting from the units of `t`, `c` and `dose` (e.g. auc in
+    `[t]*[c]`), `pk_units` provides the conversion to the units of
+    `TimecoursePK`. Parameters which cannot be calculated are NaN.
+
+    :param t: time vector [time]
+    :param c: concentrations [time] or [time x scan]
+    :param dose: dose (scalar or [scan]), None or NaN if no dose was given
+    :param min_treshold: concentrations smaller than cmax/min_treshold are
+        set to NaN
+    :return: dictionary of parameters, scalars for 1D concentrations
+    """
+    t = np.asarray(t, dtype=float)
+    c = np.array(c, dtype=float)
+    squeeze = c.ndim == 1
+    if squeeze:
+        c = c[:, np.newaxis]
+    n_time, n = c.shape
+    cols = np.arange(n)
+    idx = np.arange(n_time)[:, np.newaxis]
+    dose = np.broadcast_to(
+        np.nan if dose is None else np.asarray(dose, dtype=float), (n,)
     )
 
-    # Set up TimecoursePK parameters
-    tpkw = {
-        "time": t_vec,
-        "concentration": c_vec,
-        "substance": substance,
-        "ureg": experiment.ureg,
-        "dose": dose_value if keys.get("dose_used", False) else None
-    }
+    with np.errstate(divide="ignore", invalid="ignore"), warnings.catch_warnings():
+        # all-NaN columns
+        warnings.simplefilter("ignore", RuntimeWarning)
+
+        # very small values are numerical artefacts of the simulation
+        cmin = np.nanmin(np.where(c != 0, c, np.nan), axis=0)
+        cmax = np.nanmax(c, axis=0)
+        c[(min_treshold * cmin < cmax) & (c * min_treshold < cmax)] = np.nan
+        valid = ~np.isnan(c)
+        has_values = valid.any(axis=0)
+
+        # trapezoid rule between consecutive non-NaN values
+        last = np.maximum.accumulate(np.where(valid, idx, -1), axis=0)
+        prev = np.vstack([np.full((1, n), -1), last[:-1]])
+        prev0 = np.maximum(prev, 0)
+        segments = (t[:, np.newaxis] - t[prev0]) * (c + c[prev0, cols]) / 2.0
+        auc = np.where(valid & (prev >= 0), segments, 0.0).sum(axis=0)
+
+        # maximum (first occurrence)
+        max_idx = np.argmax(np.where(valid, c, -np.inf), axis=0)
+        tmax = np.where(has_values, t[max_idx], np.nan)
+        cmax = np.where(has_values, c[max_idx, cols], np.nan)
 
-    if keys.get("dose_used", False) and "min_threshold" in keys:
-        tpkw["min_treshold"] = keys["min_threshold"]
-
-    # Calculate basic PK parameters
-    tcpk = TimecoursePK(**tpkw)
-    pk_dict = tcpk.pk.to_dict()
-    pk_dict["substance"] = substance
-
-    # For metabolites: calculate additional clearance parameters
-    if substance in ["los", "e3174", "l158"]:
-        # Renal clearance
-        aurine_key = keys["aurine_key"]
-        aurine_vec = Q_(
-            xres[aurine_key].sel({scandim: dose_index}).values,
-            xres.uinfo[aurine_key]
+        # half maximal value before the maximum
+        before = valid & (idx < max_idx)
+        half_idx = np.argmin(
+            np.where(before, np.abs(c - 0.5 * cmax), np.inf), axis=0
         )
-        pk_dict[aurine_key] = aurine_vec.magnitude[-1]
-        pk_dict[f"{aurine_key}_unit"] = aurine_vec.units
-        cl_renal = aurine_vec[-1] / tcpk.pk.auc
-        pk_dict["cl_renal"] = cl_renal.magnitude
-        pk_dict["cl_renal_unit"] = cl_renal.units
-
-        # Fecal clearance
-        afeces_key = keys["afeces_key"]
-        afeces_vec = Q_(
-            xres[afeces_key].sel({scandim: dose_index}).values,
-            xres.uinfo[afeces_key]
+        has_half = before.any(axis=0)
+        tmaxhalf = np.where(has_half, t[half_idx], np.nan)
+        cmaxhalf = np.where(has_half, c[half_idx, cols], np.nan)
+
+        # linear regression of log concentrations after the maximum,
+        # at least three data points after the maximum are required
+        has_regression = has_values & (max_idx <= n_time - 4)
+        y = np.log(c)
+        mask = (idx > max_idx) & ~np.isnan(y) & ~np.isnan(t)[:, np.newaxis]
+        mask &= has_regression
+        n_reg = mask.sum(axis=0)
+        xmean = np.where(mask, t[:, np.newaxis], 0.0).sum(axis=0) / n_reg
+        ymean = np.where(mask, y, 0.0).sum(axis=0) / n_reg
+        dx = np.where(mask, t[:, np.newaxis] - xmean, 0.0)
+        dy = np.where(mask, y - ymean, 0.0)
+        ssxm = (dx * dx).sum(axis=0) / n_reg
+        ssym = (dy * dy).sum(axis=0) / n_reg
+        ssxym = (dx * dy).sum(axis=0) / n_reg
+        r_value = np.where(
+            (ssxm == 0.0) | (ssym == 0.0),
+            0.0,
+            np.clip(ssxym / np.sqrt(ssxm * ssym), -1.0, 1.0),
         )
-        pk_dict[afeces_key] = afeces_vec.magnitude[-1]
-        pk_dict[f"{afeces_key}_unit"] = afeces_vec.units
-        cl_fecal = afeces_vec[-1] / tcpk.pk.auc
-        pk_dict["cl_fecal"] = cl_fecal.magnitude
-        pk_dict["cl_fecal_unit"] = cl_fecal.units
-
-        # Total clearance (sum of renal and fecal)
-        pk_dict["cl_total"] = pk_dict["cl_renal"] + pk_dict["cl_fecal"]
-        pk_dict["cl_total_unit"] = pk_dict["cl_renal_unit"]
-
-        # Apparent clearance (dose/AUC)
-        if dose_value is not None:
-            dose_mmol = dose_value / experiment.Mr.los
-            # Correction factor for metabolites
-            if substance == "e3174":
-                correction_factor = experiment.Mr.los / experiment.Mr.e3174
-            elif substance == "l158":
-                correction_factor = experiment.Mr.los / experiment.Mr.l158
-            else:
-                correction_factor = 1.0
-            cl_apparent = dose_mmol / tcpk.pk.auc * correction_factor
-            pk_dict["cl"] = cl_apparent.magnitude
-            pk_dict["cl_unit"] = cl_apparent.units
-        else:
-            pk_dict["cl"] = float('nan')
-            pk_dict["cl_unit"] = tcpk.pk.auc.units.replace('*min', '')
+        slope = ssxym / ssxm
+        intercept = ymean - slope * xmean
 
-        # Add AUC and volume of distribution
-        pk_dict["auc"] = tcpk.pk.auc.magnitude
-        pk_dict["auc_unit"] = tcpk.pk.auc.units
-        pk_dict["vd"] = pk_dict['cl'] / tcpk.pk.kel.magnitude
-        pk_dict["vd_unit"] = f"{pk_dict['cl_unit']}/{tcpk.pk.kel.units}"
+        # two-sided p-value of the slope (see scipy.stats.linregress)
+        df = n_reg - 2
+        t_stat = r_value * np.sqrt(df / ((1.0 - r_value + 1e-20) * (1.0 + r_value + 1e-20)))
+        p_value = 2 * stats.t.sf(np.abs(t_stat), df)
+        std_err = np.sqrt((1 - r_value ** 2) * ssym / ssxm / df)
+        two_points = n_reg == 2
+        y_first = y[np.argmax(mask, axis=0), cols]
+        y_last = y[n_time - 1 - np.argmax(mask[::-1], axis=0), cols]
+        p_value = np.where(two_points, np.where(y_first == y_last, 1.0, 0.0), p_value)
+        std_err = np.where(two_points, 0.0, std_err)
 
-    return pk_dict
+        # regressions need two points
+        no_regression = ~has_regression | (n_reg < 2)
+        slope, intercept, r_value, p_value, std_err = (
+            np.where(no_regression, np.nan, v)
+            for v in (slope, intercept, r_value, p_value, std_err)
+        )
+        max_idx = np.where(has_regression, max_idx, np.nan)
+        # positive slopes result in negative elimination rates
+        positive = slope > 0.0
+        slope = np.where(positive, np.nan, slope)
+        intercept = np.where(positive, np.nan, intercept)
 
+        kel = -slope
+        thalf = np.log(2) / kel
+        # extrapolation of the last non-NaN value
+        c_last = c[np.maximum(last[-1], 0), cols]
+        aucinf = auc + (-c_last / slope)
 
-def calculate_losartan_pk(experiment, xres):
-    """Calculate PK parameters for losartan, E3174, and L158."""
-    # Get scanned dimension and dose vector
-    scandim = xres._redop_dims()[0]
-    dose_vec = experiment.Q_(xres["PODOSE_los"].values[0], xres.uinfo["PODOSE_los"])
+        # parameters depending on dose
+        vdss = dose / np.exp(intercept)
+        vd = dose / (aucinf * kel)
+        cl = kel * vd
+
+    pk = {
+        "auc": auc,
+        "aucinf": aucinf,
+        "tmax": tmax,
+        "cmax": cmax,
+        "tmaxhalf": tmaxhalf,
+        "cmaxhalf": cmaxhalf,
+        "kel": kel,
+        "thalf": thalf,
+        "dose": np.array(dose),
+        "vd": vd,
+        "vdss": vdss,
+        "cl": cl,
+        "slope": slope,
+        "intercept": intercept,
+        "r_value": r_value,
+        "p_value": p_value,
+        "std_err": std_err,
+        "max_idx": max_idx,
+    }
+    if squeeze:
+        pk = {key: value[0] for key, value in pk.items()}
+    return pk
+
+
+def pk_units(
+    ureg: UnitRegistry,
+    time_unit: Union[str, Unit],
+    concentration_unit: Union[str, Unit],
+    dose_unit: Union[None, str, Unit] = None,
+) -> Dict[str, Tuple[float, Unit]]:
+    """Conversion factors and units of the pharmacokinetic parameters.
+
+    The units follow the unit arithmetic of `TimecoursePK`, the factor
+    converts the parameters of `pk_parameters` to these units.
 
-    # Define substance info dictionaries
-    substance_info = {
-        "los": {
-            "conc_key": "[Cve_los]",
-            "aurine_key": "Aurine_e3174",
-            "afeces_key": "Afeces_e3174",
-            "dose_used": True,
-        },
-        "e3174": {
-            "conc_key": "[Cve_e3174]",
-            "aurine_key": "Aurine_e3174",
-            "afeces_key": "Afeces_e3174",
-            "dose_used": False,
-        },
-        "l158": {
-            "conc_key": "[Cve_l158]",
-            "aurine_key": "Aurine_l158",
-            "afeces_key": "Afeces_l158",
-            "dose_used": False,
-        },
+    :param ureg: unit registry
+    :param time_unit: unit of the time
+    :param concentration_unit: unit of the concentrations
+    :param dose_unit: unit of the dose, None if no dose was given
+    :return: dictionary of (factor, unit) for `PK_PARAMETERS` and the slope
+        and intercept
+    """
+    Q_ = ureg.Quantity
+    t = Q_(1.0, time_unit)
+    c = Q_(1.0, concentration_unit)
+    dose = Q_(1.0, dose_unit if dose_unit else "mg")
+
+    auc = t * c
+    slope = Q_(1.0, ureg.Unit(f"1/{t.units}"))
+    intercept = Q_(1.0, c.units)
+    kel = slope
+    thalf = 1.0 / kel
+    if dose_unit:
+        vdss = dose / intercept
+        vd = dose / (auc * kel)
+        cl = kel * vd
+    else:
+        vd_units = dose.units / (auc.units / kel.units)
+        vdss = Q_(1.0, vd_units)
+        vd = Q_(1.0, vd_units)
+        cl = Q_(1.0, kel.units * vd.units)
+    for vd_par in [vd, vdss]:
+        if vd_par.check("[length] ** 3"):
+            vd_par.ito("liter")
+        elif vd_par.check("[length] ** 3/[mass]"):
+            vd_par.ito("liter/kg")
+
+    quantities = {
+        "auc": auc.to_reduced_units(),
+        "aucinf": auc.to_reduced_units(),
+        "tmax": t.to_reduced_units(),
+        "cmax": c.to_reduced_units(),
+        "tmaxhalf": t.to_reduced_units(),
+        "cmaxhalf": c.to_reduced_units(),
+        "kel": kel.to_reduced_units(),
+        "thalf": thalf.to_reduced_units(),
+        "dose": dose.to_reduced_units(),
+        "vd": vd,
+        "vdss": vdss,
+        "cl": cl.to_reduced_units(),
+        "slope": slope.to_reduced_units(),
+        "intercept": intercept.to_reduced_units(),
     }
+    return {key: (q.magnitude, q.units) for key, q in quantities.items()}
+
 
-    # Process each substance for each dose
-    pk_dicts = []
-    for substance, keys in substance_info.items():
-        for idx, dose in enumerate(dose_vec):
-            pk_dict = process_substance_pk(experiment, xres, scandim, idx, dose, substance, keys)
-            pk_dicts.append(pk_dict)
+def timecourse_pk(
+    ureg: UnitRegistry,
+    t: np.ndarray,
+    c: np.ndarray,
+    time_unit: Union[str, Unit],
+    concentration_unit: Union[str, Unit],
+    dose: Optional[np.ndarray] = None,
+    dose_unit: Union[None, str, Unit] = None,
+    substance: str = "substance",
+) -> pd.DataFrame:
+    """Pharmacokinetic parameters of the timecourses as DataFrame.
 
+    The columns correspond to `TimecoursePK.pk.to_dict()` with one row per
+    column of `c`; slope and intercept are magnitudes with unit columns.
+    """
+    c = np.asarray(c)
+    pk = pk_parameters(t, c if c.ndim == 2 else c[:, np.newaxis], dose=dose)
+    units = pk_units(
+        ureg, time_unit, concentration_unit, dose_unit if dose is not None else None
+    )
+    n = len(pk["auc"])
+    d = {"compound": [substance] * n}
+    for key in [*PK_PARAMETERS, "slope", "intercept"]:
+        factor, unit = units[key]
+        d[key] = pk[key] * factor
+        d[f"{key}_unit"] = [unit] * n
+    for key in PK_REGRESSION_PARAMETERS[2:]:
+        d[key] = pk[key]
+    return pd.DataFrame(d)
 
-    return pd.DataFrame(pk_dicts)
 
-def calculate_losartan_pd(experiment, xres) -> pd.DataFrame:
+def _substance_pk(experiment, xres, t_vec, dose_vec, substance, keys) -> pd.DataFrame:
+    """Pharmacokinetic parameters of a substance for all scan points."""
+    Q_ = experiment.Q_
     scandim = xres._redop_dims()[0]
+
+    def values(key: str) -> np.ndarray:
+        """[time x scan] values."""
+        return xres[key].transpose("_time", scandim).values
+
+    dose_used = keys.get("dose_used", False)
+    df = timecourse_pk(
+        ureg=experiment.ureg,
+        t=t_vec.magnitude,
+        c=values(keys["conc_key"]),
+        time_unit=t_vec.units,
+        concentration_unit=xres.uinfo[keys["conc_key"]],
+        dose=dose_vec.magnitude if dose_used else None,
+        dose_unit=dose_vec.units,
+        substance=substance,
+    )
+    df["substance"] = substance
+    n = len(df)
+
+    auc = df["auc"].to_numpy()
+    auc_unit = df["auc_unit"].values[0]
+
+    # renal and fecal clearance
+    for key, cl_key in [(keys["aurine_key"], "cl_renal"), (keys["afeces_key"], "cl_fecal")]:
+        amount = values(key)[-1]
+        amount_unit = Q_(1.0, xres.uinfo[key]).units
+        df[key] = amount
+        df[f"{key}_unit"] = [amount_unit] * n
+        q = Q_(1.0, amount_unit) / Q_(1.0, auc_unit)
+        df[cl_key] = amount / auc * q.magnitude
+        df[f"{cl_key}_unit"] = [q.units] * n
+
+    # total clearance (sum of renal and fecal)
+    df["cl_total"] = df["cl_renal"] + df["cl_fecal"]
+    df["cl_total_unit"] = df["cl_renal_unit"]
+
+    # apparent clearance (dose/AUC) with correction factor for metabolites
+    Mr = experiment.Mr
+    if substance == "e3174":
+        correction_factor = Mr.los / Mr.e3174
+    elif substance == "l158":
+        correction_factor = Mr.los / Mr.l158
+    else:
+        correction_factor = 1.0
+    q = Q_(1.0, dose_vec.units) / Mr.los / Q_(1.0, auc_unit) * correction_factor
+    df["cl"] = dose_vec.magnitude / auc * q.magnitude
+    df["cl_unit"] = [q.units] * n
+
+    # volume of distribution
+    kel_unit = df["kel_unit"].values[0]
+    df["vd"] = df["cl"] / df["kel"]
+    df["vd_unit"] = f"{q.units}/{kel_unit}"
+
+    return df
+
+
+def calculate_losartan_pk(experiment, xres) -> pd.DataFrame:
+    """Calculate PK parameters for losartan, E3174, and L158."""
+    t_vec = experiment.Q_(xres.dim_mean("time").magnitude, xres.uinfo["time"])
+    # dose of every scan point
     dose_vec = experiment.Q_(xres["PODOSE_los"].values[0], xres.uinfo["PODOSE_los"])
 
+    dfs = [
+        _substance_pk(experiment, xres, t_vec, dose_vec, substance, keys)
+        for substance, keys in SUBSTANCE_INFO.items()
+    ]
+    return pd.concat(dfs, ignore_index=True)
+
+
+def calculate_losartan_pd(
+    experiment, xres, thresholds: Optional[Dict[str, float]] = None
+) -> Dict[str, pd.DataFrame]:
+    """Calculate PD parameters for all scan points.
+
+    For every sid in `PD_SIDS` the extrema and the times of the extrema, the
+    area under the effect curve (auec) and the times above and below a
+    threshold are calculated by reductions over the time dimension. The
+    default thresholds are the half maximal changes from the baseline (value
+    at the first time point) to the maximum (time_above) and to the minimum
+    (time_below).
+
+    :param thresholds: absolute thresholds per sid in the units of the sid,
+        used for time_above and time_below
+    :return: dictionary of DataFrames per sid with one row per scan point
+    """
     Q_ = experiment.Q_
+    thresholds = thresholds if thresholds else {}
+    time_unit = Q_(1.0, xres.uinfo["time"]).units
 
     dfs = {}
-    for sid in [
-        "[ang1]",
-        "[ang2]",
-        "[ren]",
-        "[ald]",
-        "SBP",
-        "DBP",
-        "MAP",
-    ]:
-        pd_dicts = []
-        for idx, dose in enumerate(dose_vec):
-            # Get values
-            values = Q_(
-                xres[sid].sel({scandim: idx}).values,
-                xres.uinfo[sid]
-            )
-            pd_dict = {
-                "sid": sid,
-                "min": values.magnitude.min(),
-                "max": values.magnitude.max(),
-                "unit": values.units
-            }
-            pd_dicts.append(pd_dict)
-        dfs[sid] = pd.DataFrame(pd_dicts)
+    for sid in PD_SIDS:
+        da = xres[sid]
+        time = da["_time"].values
+        unit = Q_(1.0, xres.uinfo[sid]).units
+        vmin = da.min(dim="_time")
+        vmax = da.max(dim="_time")
+        if sid in thresholds:
+            threshold_above = threshold_below = thresholds[sid]
+        else:
+            baseline = da.isel(_time=0)
+            threshold_above = baseline + 0.5 * (vmax - baseline)
+            threshold_below = baseline + 0.5 * (vmin - baseline)
+
+        n = vmin.size
+        dfs[sid] = pd.DataFrame({
+            "sid": sid,
+            "min": vmin.values.ravel(),
+            "max": vmax.values.ravel(),
+            "unit": [unit] * n,
+            "tmin": time[da.argmin(dim="_time").values.ravel()],
+            "tmax": time[da.argmax(dim="_time").values.ravel()],
+            "auec": da.integrate("_time").values.ravel(),
+            "auec_unit": [(Q_(1.0, unit) * Q_(1.0, time_unit)).units] * n,
+            "time_above": (da > threshold_above).astype(float).integrate("_time").values.ravel(),
+            "time_below": (da < threshold_below).astype(float).integrate("_time").values.ravel(),
+            "time_unit": [time_unit] * n,
+        })
 
     return dfs
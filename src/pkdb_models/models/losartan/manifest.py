@@ -0,0 +1,140 @@
+"""Manifest of the inputs of simulation experiment outputs.
+
+For every experiment in a results directory the manifest records the hashes
+of what was used to create its outputs:
+
+- the source modules of the experiment class and its base classes
+- the shared source modules of the package (all modules except the
+  experiment modules of the studies, scans and misc experiments), e.g. the
+  pharmacokinetic analysis or the helpers
+- the versions of the simulation and analysis dependencies
+- the pkdb TSV files of the study in `DATA_PATHS`
+- the model SBML
+- the run settings which change the outputs (figure formats, resolution, ...)
+
+Incremental runs only rerun experiments whose inputs changed. The report
+information of the experiments is stored as well, so that the HTML report
+covers skipped experiments.
+"""
+import hashlib
+import inspect
+import json
+import os
+from functools import lru_cache
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Type
+
+from sbmlsim.experiment import SimulationExperiment
+from sbmlutils import log
+
+from pkdb_models.models.losartan import DATA_PATHS, LOSARTAN_PATH, MODEL_PATH
+from pkdb_models.models.losartan.model_cache import sha256_for_path
+
+logger = log.get_logger(__name__)
+
+# experiment modules, hashed per experiment via the classes
+EXPERIMENT_DIRS = ["studies", "scans", "misc"]
+# directories without package sources
+SKIP_DIRS = ["results", "cache", "data", "data_old", "latex", "literature"]
+
+# dependencies which change the outputs
+DEPENDENCIES = ["sbmlsim", "pkdb_analysis", "sbmlutils", "libroadrunner"]
+
+
+def _version(package: str) -> Optional[str]:
+    try:
+        return metadata.version(package)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+@lru_cache
+def shared_inputs() -> Dict[str, Any]:
+    """Hash of the shared package sources and the dependency versions."""
+    skip_paths = {LOSARTAN_PATH / "experiments" / d for d in EXPERIMENT_DIRS}
+    skip_paths |= {LOSARTAN_PATH / d for d in SKIP_DIRS}
+    paths = []
+    for root, dirs, files in os.walk(LOSARTAN_PATH):
+        dirs[:] = [d for d in dirs if Path(root) / d not in skip_paths]
+        paths.extend(Path(root) / f for f in files if f.endswith(".py"))
+
+    sha = hashlib.sha256()
+    for path in sorted(paths):
+        sha.update(str(path.relative_to(LOSARTAN_PATH)).encode("utf-8"))
+        sha.update(sha256_for_path(path).encode("utf-8"))
+    return {
+        "code": sha.hexdigest(),
+        "dependencies": {package: _version(package) for package in DEPENDENCIES},
+    }
+
+
+class ExperimentManifest:
+    """Manifest of the experiments in a results directory."""
+
+    filename = "manifest.json"
+
+    def __init__(self, output_path: Path):
+        """Load manifest of the results directory, empty if none exists."""
+        self.path = Path(output_path) / self.filename
+        self.experiments: Dict[str, Dict[str, Any]] = {}
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.experiments = json.load(f)
+            except (OSError, ValueError) as err:
+                logger.warning(f"Invalid manifest '{self.path}', rerunning all: {err}")
+
+    @staticmethod
+    def inputs(
+        experiment_class: Type[SimulationExperiment],
+        settings: Dict[str, Any],
+        data_paths: List[Path] = DATA_PATHS,
+        model_path: Path = MODEL_PATH,
+    ) -> Dict[str, Any]:
+        """Hashes of the inputs of the experiment."""
+        code = {}
+        for cls in experiment_class.__mro__:
+            if not cls.__module__.startswith("pkdb_models"):
+                continue
+            code[cls.__module__] = sha256_for_path(Path(inspect.getsourcefile(cls)))
+
+        data = {}
+        for data_path in data_paths:
+            study_path = Path(data_path) / experiment_class.__name__
+            for tsv_path in sorted(study_path.glob(".*.tsv")):
+                data[tsv_path.name] = sha256_for_path(tsv_path)
+
+        return {
+            "code": code,
+            "shared": shared_inputs(),
+            "data": data,
+            "model": sha256_for_path(model_path),
+            "settings": settings,
+        }
+
+    def is_current(self, sid: str, inputs: Dict[str, Any], output_path: Path) -> bool:
+        """Check if the outputs of the experiment were created from the inputs."""
+        entry = self.experiments.get(sid)
+        return (
+            entry is not None
+            and entry["inputs"] == inputs
+            and (Path(output_path) / sid).exists()
+        )
+
+    def report_data(self, sid: str) -> Dict[str, Any]:
+        """Report information of the experiment."""
+        return self.experiments[sid]["report"]
+
+    def update(self, sid: str, inputs: Dict[str, Any], report_data: Dict[str, Any]) -> None:
+        """Record the inputs and report information of the experiment."""
+        # round trip via JSON, so that the entry equals the stored manifest
+        self.experiments[sid] = json.loads(
+            json.dumps({"inputs": inputs, "report": report_data}, default=str)
+        )
+
+    def save(self) -> None:
+        """Write manifest."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.experiments, f, indent=2, default=str)
@@ -0,0 +1,166 @@
+"""On-disk cache of compiled roadrunner models.
+
+Loading the flattened losartan SBML parses the model and JIT-compiles it,
+which is a large share of the runtime of short runs and of every worker
+process. The compiled roadrunner state is stored once and loaded instead of
+the SBML. The state is keyed by the SHA256 of the SBML file and the
+roadrunner version, so a changed model or roadrunner update never loads a
+stale state.
+
+The cache is opt-in (`enable_model_cache`), sbmlsim itself does not load
+models from states (roadrunner issue #963). Before a state is cached, a
+reference timecourse (oral dose, i.e. with events) and the integrator
+settings of the state-loaded model are compared against the SBML-loaded
+model; a state which does not reproduce the SBML model is not cached.
+"""
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+
+import roadrunner
+from sbmlsim.model import RoadrunnerSBMLModel
+from sbmlsim.model.model_resources import Source
+from sbmlutils import log
+
+from pkdb_models.models.losartan import CACHE_PATH
+
+logger = log.get_logger(__name__)
+
+MODEL_CACHE_PATH = CACHE_PATH / "models"
+
+# changes and time span [min] of the reference timecourse of the check
+REFERENCE_CHANGES: Dict[str, float] = {"PODOSE_los": 50.0}
+REFERENCE_END = 24 * 60
+REFERENCE_STEPS = 200
+
+
+def sha256_for_path(path: Path) -> str:
+    """SHA256 hex digest of the file content."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def model_state_path(sbml_path: Path) -> Path:
+    """Path of the cached roadrunner state for the SBML file."""
+    sha = sha256_for_path(sbml_path)
+    return MODEL_CACHE_PATH / f"{sbml_path.stem}_{sha}_rr{roadrunner.__version__}.rrstate"
+
+
+def _reference_timecourse(r: roadrunner.RoadRunner) -> np.ndarray:
+    """Reference timecourse of all floating species."""
+    r.resetAll()
+    for key, value in REFERENCE_CHANGES.items():
+        try:
+            r.setValue(key, value)
+        except RuntimeError:
+            logger.debug(f"Reference change not in model: '{key}'")
+    r.timeCourseSelections = ["time"] + list(r.model.getFloatingSpeciesIds())
+    s = r.simulate(start=0, end=REFERENCE_END, steps=REFERENCE_STEPS)
+    r.resetAll()
+    return np.array(s)
+
+
+def check_model_state(
+    r_sbml: roadrunner.RoadRunner, state_path: Path, rtol: float = 1e-6, atol: float = 1e-9
+) -> bool:
+    """Check that the model loaded from the state simulates as the SBML model.
+
+    Compares the integrator settings and a reference timecourse of both load
+    paths. The SBML-loaded model is reset after the check.
+
+    :param r_sbml: model loaded from the SBML
+    :param state_path: path of the saved state of the model
+    """
+    r_state = roadrunner.RoadRunner()
+    r_state.loadState(str(state_path))
+
+    for key in ["absolute_tolerance", "relative_tolerance", "variable_step_size"]:
+        if r_sbml.integrator.getValue(key) != r_state.integrator.getValue(key):
+            logger.warning(f"Model state differs in integrator setting '{key}'")
+            return False
+    if r_sbml.integrator.getName() != r_state.integrator.getName():
+        logger.warning("Model state differs in integrator")
+        return False
+
+    selections = list(r_sbml.timeCourseSelections)
+    s_sbml = _reference_timecourse(r_sbml)
+    r_sbml.timeCourseSelections = selections
+    s_state = _reference_timecourse(r_state)
+    if s_sbml.shape != s_state.shape or not np.allclose(
+        s_sbml, s_state, rtol=rtol, atol=atol
+    ):
+        logger.warning(f"Model state does not reproduce the SBML model: '{state_path}'")
+        return False
+    return True
+
+
+def load_roadrunner(sbml_path: Path) -> roadrunner.RoadRunner:
+    """Load roadrunner model from the cache or the SBML.
+
+    The state of a freshly loaded model is written to the cache, so the
+    first load of a model fills the cache for all further loads.
+    """
+    sbml_path = Path(sbml_path)
+    state_path = model_state_path(sbml_path)
+    if state_path.exists():
+        try:
+            r = roadrunner.RoadRunner()
+            r.loadState(str(state_path))
+            logger.debug(f"Model loaded from cache: '{state_path}'")
+            return r
+        except RuntimeError as err:
+            logger.warning(f"Invalid model cache '{state_path}', loading SBML: {err}")
+            state_path.unlink(missing_ok=True)
+
+    r = roadrunner.RoadRunner(str(sbml_path))
+    try:
+        state_path.parent.mkdir(parents=True, exist_ok=True)
+        # write via temporary file, workers may store the state concurrently
+        tmp_path = state_path.with_name(f"{state_path.name}.{os.getpid()}.tmp")
+        r.saveState(str(tmp_path))
+        if check_model_state(r, tmp_path):
+            os.replace(tmp_path, state_path)
+            logger.debug(f"Model state cached: '{state_path}'")
+        else:
+            tmp_path.unlink(missing_ok=True)
+    except (OSError, RuntimeError) as err:
+        logger.warning(f"Model state could not be cached: {err}")
+    return r
+
+
+_load_roadrunner_model_sbml = RoadrunnerSBMLModel.load_roadrunner_model
+# unpatched classmethod of sbmlsim
+_load_roadrunner_model_classmethod = RoadrunnerSBMLModel.__dict__["load_roadrunner_model"]
+
+
+def _load_roadrunner_model(cls, source: Source) -> roadrunner.RoadRunner:
+    """Load model from given source, using the cache for SBML files."""
+    if isinstance(source, (str, Path)):
+        source = Source.from_source(source=source)
+    if source.path is not None:
+        return load_roadrunner(Path(source.path))
+    return _load_roadrunner_model_sbml(source)
+
+
+def enable_model_cache() -> None:
+    """Load all sbmlsim models via the cache of compiled models.
+
+    Patches `RoadrunnerSBMLModel.load_roadrunner_model` of the process.
+    """
+    RoadrunnerSBMLModel.load_roadrunner_model = classmethod(_load_roadrunner_model)
+
+
+def disable_model_cache() -> None:
+    """Load sbmlsim models from the SBML."""
+    RoadrunnerSBMLModel.load_roadrunner_model = _load_roadrunner_model_classmethod
+
+
+def model_cache_enabled() -> bool:
+    """Check whether models are loaded via the cache."""
+    return RoadrunnerSBMLModel.load_roadrunner_model.__func__ is _load_roadrunner_model
@@ -892,6 +892,105 @@ for sid, sdict in SUBSTANCES_BODY.items():
             ]
         )
 
+        # dosing regimen: n_regimen oral doses every tau_regimen (single
+        # continuous integration of multiple doses). The first dose is the oral
+        # dose PODOSE at the start, the following doses are given by events at
+        # tau_regimen, 2*tau_regimen, ... and are added to the undissolved oral
+        # dose PODOSE, i.e. the remainder of the previous dose is kept (changes
+        # of chained Timecourses replace PODOSE).
+        _m.parameters.extend([
+            Parameter(
+                f"dose_regimen_{sid}",
+                0,
+                U.mg,
+                constant=True,
+                sboTerm=SBO.QUANTITATIVE_SYSTEMS_DESCRIPTION_PARAMETER,
+                name=f"oral dose of regimen {sid} [mg]",
+            ),
+            Parameter(
+                f"tau_regimen_{sid}",
+                1440,
+                U.min,
+                constant=True,
+                sboTerm=SBO.QUANTITATIVE_SYSTEMS_DESCRIPTION_PARAMETER,
+                name=f"dosing interval of regimen {sid} [min]",
+            ),
+            Parameter(
+                f"n_regimen_{sid}",
+                0,
+                U.dimensionless,
+                constant=True,
+                sboTerm=SBO.QUANTITATIVE_SYSTEMS_DESCRIPTION_PARAMETER,
+                name=f"number of doses of regimen {sid}",
+            ),
+            Parameter(
+                f"count_regimen_{sid}",
+                1,
+                U.dimensionless,
+                constant=False,
+                sboTerm=SBO.QUANTITATIVE_SYSTEMS_DESCRIPTION_PARAMETER,
+                name=f"given doses of regimen {sid} (with the oral dose at start)",
+            ),
+        ])
+        _m.events.append(
+            Event(
+                f"EV_regimen_{sid}",
+                trigger=(
+                    f"(count_regimen_{sid} < n_regimen_{sid}) && "
+                    f"(time >= count_regimen_{sid} * tau_regimen_{sid})"
+                ),
+                assignments={
+                    f"PODOSE_{sid}": f"PODOSE_{sid} + dose_regimen_{sid}",
+                    f"count_regimen_{sid}": f"count_regimen_{sid} + 1 dimensionless",
+                },
+                trigger_initialValue=False,
+                sboTerm=SBO.OCCURRING_ENTITY_REPRESENTATION,
+                name=f"oral dose of regimen {sid}",
+            )
+        )
+
+# urine collection: urine amounts are reset every tau_urine (n_urine times),
+# starting at tau_urine, e.g. at the dosing times of a regimen
+_m.parameters.extend([
+    Parameter(
+        "tau_urine",
+        1440,
+        U.min,
+        constant=True,
+        sboTerm=SBO.QUANTITATIVE_SYSTEMS_DESCRIPTION_PARAMETER,
+        name="urine collection interval [min]",
+    ),
+    Parameter(
+        "n_urine",
+        0,
+        U.dimensionless,
+        constant=True,
+        sboTerm=SBO.QUANTITATIVE_SYSTEMS_DESCRIPTION_PARAMETER,
+        name="number of urine collection resets",
+    ),
+    Parameter(
+        "count_urine",
+        0,
+        U.dimensionless,
+        constant=False,
+        sboTerm=SBO.QUANTITATIVE_SYSTEMS_DESCRIPTION_PARAMETER,
+        name="performed urine collection resets",
+    ),
+])
+_m.events.append(
+    Event(
+        "EV_urine_collection",
+        trigger="(count_urine < n_urine) && (time >= (count_urine + 1 dimensionless) * tau_urine)",
+        assignments={
+            **{f"Aurine_{sid}": "0 mmole" for sid in ["los", "e3174", "l158"]},
+            "count_urine": "count_urine + 1 dimensionless",
+        },
+        trigger_initialValue=False,
+        sboTerm=SBO.OCCURRING_ENTITY_REPRESENTATION,
+        name="urine collection reset",
+    )
+)
+
 _m.rules = _m.rules + [
     AssignmentRule("f_shunts", "f_cirrhosis", unit=U.dimensionless),
     AssignmentRule("f_tissue_loss", "f_cirrhosis", unit=U.dimensionless),
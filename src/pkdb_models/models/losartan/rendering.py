@@ -0,0 +1,106 @@
+"""Rendering of matplotlib figures in worker processes.
+
+Writing the figures (rasterizing PNGs at high DPI and serializing SVGs) takes
+often longer than the simulations of an experiment. The `FigureRenderer`
+decouples both: the main process creates the figures of an experiment and
+hands them as pickled figures to a pool of render workers (producer), which
+write all formats (consumers) while the next experiment is already
+simulating.
+
+Only the saving is moved to the workers. Creating the figures needs the
+results and data of the experiment, but takes a small share of the
+rendering: for the studies about 6% of the time of `savefig` (svg and png at
+300 dpi), pickling the figures another 4%.
+"""
+import multiprocessing
+import pickle
+from multiprocessing.pool import AsyncResult, Pool
+from pathlib import Path
+from typing import List, Optional
+
+from sbmlutils import log
+
+logger = log.get_logger(__name__)
+
+
+def save_figure(fig_mpl, paths: List[Path], dpi: Optional[int] = None) -> None:
+    """Save matplotlib figure to the given paths.
+
+    :param fig_mpl: matplotlib figure
+    :param paths: figure paths, the format is given by the suffix
+    :param dpi: resolution of raster formats, None uses the figure DPI
+    """
+    for path in paths:
+        fig_mpl.savefig(path, bbox_inches="tight", dpi=dpi if dpi else "figure")
+
+
+def _init_worker() -> None:
+    """Use non-interactive backend in the render worker."""
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def _render_worker(args) -> None:
+    """Save pickled figure in the render worker."""
+    from matplotlib import pyplot as plt
+
+    data, paths, dpi = args
+    fig_mpl = pickle.loads(data)
+    try:
+        save_figure(fig_mpl, paths=paths, dpi=dpi)
+    finally:
+        plt.close(fig_mpl)
+
+
+class FigureRenderer:
+    """Pool of worker processes saving matplotlib figures."""
+
+    # maximal number of submitted figures per worker, bounds the memory of
+    # pending figures if rendering is slower than simulating
+    pending_per_worker = 8
+
+    def __init__(self, n_workers: int, dpi: Optional[int] = None):
+        """Start render workers.
+
+        :param n_workers: number of render worker processes
+        :param dpi: resolution of raster formats, None uses the figure DPI
+        """
+        self.n_workers = n_workers
+        self.dpi = dpi
+        self._pool: Pool = multiprocessing.Pool(
+            processes=n_workers, initializer=_init_worker
+        )
+        self._pending: List[AsyncResult] = []
+
+    def submit(self, fig_mpl, paths: List[Path]) -> None:
+        """Save figure asynchronously.
+
+        The figure is pickled directly, so it can be closed after the call.
+        Figures which cannot be pickled are saved in the calling process.
+        """
+        try:
+            data = pickle.dumps(fig_mpl)
+        except Exception as err:
+            logger.warning(f"Figure cannot be pickled, saving in main process: {err}")
+            save_figure(fig_mpl, paths=paths, dpi=self.dpi)
+            return
+
+        while len(self._pending) >= self.pending_per_worker * self.n_workers:
+            # raises errors of the render workers
+            self._pending.pop(0).get()
+        self._pending.append(
+            self._pool.apply_async(_render_worker, ((data, paths, self.dpi),))
+        )
+
+    def join(self) -> None:
+        """Wait until all submitted figures are saved."""
+        while self._pending:
+            self._pending.pop(0).get()
+
+    def close(self) -> None:
+        """Save all pending figures and shut down the render workers."""
+        try:
+            self.join()
+        finally:
+            self._pool.close()
+            self._pool.join()
@@ -114,6 +114,64 @@ def main() -> None:
         help="Comma-separated list of simulation experiments and/or groups (for '--action simulate'). "
              "Use '--action list_experiments' to see all available options.",
     )
+    parser.add_option(
+        "-j", "--jobs",
+        dest="jobs",
+        default="1",
+        help="Optional: Number of worker processes the simulation experiments are distributed over (default: 1)",
+    )
+    parser.add_option(
+        "--scan-jobs",
+        dest="scan_jobs",
+        default="1",
+        help="Optional: Number of worker processes the points of parameter scans are distributed over (default: 1)",
+    )
+    parser.add_option(
+        "--no-cache",
+        dest="use_cache",
+        action="store_false",
+        default=True,
+        help="Optional: Simulate all experiments, do not reuse cached simulation results",
+    )
+    parser.add_option(
+        "--headless",
+        dest="headless",
+        action="store_true",
+        default=False,
+        help="Optional: Do not create figures, write the results as netCDF and TSV (batch/CI runs)",
+    )
+    parser.add_option(
+        "--formats",
+        dest="formats",
+        default="svg,png",
+        help="Optional: Comma-separated list of figure formats (default: svg,png)",
+    )
+    parser.add_option(
+        "--dpi",
+        dest="dpi",
+        default="600",
+        help="Optional: Resolution of the figures (default: 600)",
+    )
+    parser.add_option(
+        "--render-jobs",
+        dest="render_jobs",
+        default="1",
+        help="Optional: Number of worker processes saving figures while the next experiments are simulated (default: 1)",
+    )
+    parser.add_option(
+        "--model-cache",
+        dest="model_cache",
+        action="store_true",
+        default=False,
+        help="Optional: Load the compiled models from the on-disk model cache",
+    )
+    parser.add_option(
+        "--force",
+        dest="force",
+        action="store_true",
+        default=False,
+        help="Optional: Rerun all experiments, also the ones whose code, data and model are unchanged since the last run",
+    )
 
     console.rule("[bold cyan]LOSARTAN PBPK/PD MODEL[/bold cyan]", style="cyan")
 
@@ -125,6 +183,23 @@ def main() -> None:
         console.rule(style="red")
         sys.exit(1)
 
+    def _parse_positive_int(value: str, option: str) -> int:
+        try:
+            number = int(value)
+        except ValueError:
+            number = 0
+        if number < 1:
+            _parser_message(f"Invalid value '{value}' for '{option}', must be a positive integer.")
+        return number
+
+    n_workers = _parse_positive_int(options.jobs, "--jobs")
+    n_scan_workers = _parse_positive_int(options.scan_jobs, "--scan-jobs")
+    n_render_workers = _parse_positive_int(options.render_jobs, "--render-jobs")
+    dpi = _parse_positive_int(options.dpi, "--dpi")
+    figure_formats = [f.strip().lower() for f in options.formats.split(",") if f.strip()]
+    if not figure_formats:
+        _parser_message("'--formats' requires at least one figure format.")
+
     if not options.action:
         _parser_message("Required argument '--action' is missing.")
 
@@ -152,11 +227,11 @@ def main() -> None:
         _list_available_experiments()
 
     elif action == Action.SIMULATE:
-        if not options.EXPERIMENTS:
+        if not options.experiments:
             _parser_message("For '--action simulate', the '--experiments' argument is required.")
 
         # Parse experiment names
-        exp_list = [e.strip() for e in options.EXPERIMENTS.split(",")]
+        exp_list = [e.strip() for e in options.experiments.split(",")]
 
         # Resolve names to experiment classes
         experiment_classes, not_found = _resolve_experiment_names(exp_list)
@@ -176,14 +251,36 @@ def main() -> None:
         # Run the experiments
         results_path = _get_current_results_path()
         console.rule("[bold cyan]Running Simulations[/bold cyan]", style="cyan")
-        run_simulation_experiments(experiment_classes=experiment_classes)
+        run_simulation_experiments(
+            experiment_classes=experiment_classes,
+            n_workers=n_workers,
+            n_scan_workers=n_scan_workers,
+            use_cache=options.use_cache,
+            headless=options.headless,
+            figure_formats=figure_formats,
+            dpi=dpi,
+            n_render_workers=n_render_workers,
+            incremental=not options.force,
+            use_model_cache=options.model_cache,
+        )
         console.print("[bold green]Simulations finished.[/bold green]")
         console.print(f"[bold green]Results saved to: {results_path / 'simulation'}[/bold green]")
 
     elif action == Action.ALL:
         console.rule("[bold cyan]Running: Factory and all simulations.[/bold cyan]", style="cyan")
         _run_factory()
-        run_simulation_experiments(selected="all")
+        run_simulation_experiments(
+            selected="all",
+            n_workers=n_workers,
+            n_scan_workers=n_scan_workers,
+            use_cache=options.use_cache,
+            headless=options.headless,
+            figure_formats=figure_formats,
+            dpi=dpi,
+            n_render_workers=n_render_workers,
+            incremental=not options.force,
+            use_model_cache=options.model_cache,
+        )
         console.print("\n[bold green]All scripts completed successfully![/bold green]")
 
     console.rule(style="white")
@@ -212,6 +309,29 @@ if __name__ == "__main__":
        Run all experiments:
        $ run_losartan --action simulate --experiments all
 
+       Run all experiments on 8 worker processes:
+       $ run_losartan --action simulate --experiments all --jobs 8
+
+       Run the parameter scan with the scan points on 16 worker processes:
+       $ run_losartan --action simulate --experiments scan --scan-jobs 16
+
+       Run all experiments without reusing cached simulation results:
+       $ run_losartan --action simulate --experiments all --no-cache
+
+       Run all experiments without figures, results as netCDF/TSV:
+       $ run_losartan --action simulate --experiments all --headless
+
+       Run all experiments with PNG figures at 150 dpi, saved by 4 render workers:
+       $ run_losartan --action simulate --experiments all --formats png --dpi 150 --render-jobs 4
+
+       Simulations are incremental, only experiments whose code, data, model,
+       shared package code or dependency versions changed since the last run
+       are rerun. Rerun all experiments:
+       $ run_losartan --action simulate --experiments all --force
+
+       Load the compiled models from the on-disk model cache:
+       $ run_losartan --action simulate --experiments all --model-cache
+
     5. Run Everything:
        Runs factory and all simulations.
        $ run_losartan --action all
@@ -0,0 +1,239 @@
+"""Evaluation of sensitivity samples on a pool of worker processes.
+
+Every worker loads the RoadRunner model once (via the cache of compiled
+models if enabled in the main process) and evaluates chunks of samples with
+`LosartanSensitivitySimulation.simulate`. The chunks are dispatched
+dynamically, so that workers with fast simulations take over more chunks;
+the results are written by sample index, i.e. the ordering is independent of
+the number of workers.
+
+With a checkpoint directory every completed chunk is written as netCDF file
+(one column per output). An interrupted evaluation resumes with the chunks
+which are not yet in the checkpoint; chunks are only reused if their samples
+and outputs are unchanged. `cache_key` identifies all inputs of an analysis
+for the naming of checkpoints and cached sensitivities.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+import roadrunner
+import xarray as xr
+from sbmlutils import log
+from sbmlutils.console import console
+
+from pkdb_models.models.losartan.model_cache import (
+    enable_model_cache,
+    model_cache_enabled,
+    sha256_for_path,
+)
+
+if TYPE_CHECKING:
+    from sbmlsim.sensitivity.analysis import SensitivitySimulation
+
+logger = log.get_logger(__name__)
+
+_worker_simulation: Optional[SensitivitySimulation] = None
+_worker_r: Optional[roadrunner.RoadRunner] = None
+
+
+def _init_worker(sensitivity_simulation: SensitivitySimulation, use_model_cache: bool) -> None:
+    """Load the model in the worker process."""
+    global _worker_simulation, _worker_r
+    if use_model_cache:
+        enable_model_cache()
+    _worker_simulation = sensitivity_simulation
+    _worker_r = sensitivity_simulation.load_model(
+        model_path=sensitivity_simulation.model_path,
+        selections=sensitivity_simulation.selections,
+    )
+
+
+def _simulate_chunk(args) -> tuple[int, np.ndarray]:
+    """Simulate chunk of samples in the worker process.
+
+    :return: index of the first sample, outputs [samples x outputs]
+    """
+    start, changes_list, output_ids = args
+    values = np.full((len(changes_list), len(output_ids)), np.nan)
+    for k, changes in enumerate(changes_list):
+        y = _worker_simulation.simulate(r=_worker_r, changes=changes)
+        values[k, :] = [y[uid] for uid in output_ids]
+    return start, values
+
+
+def sample_changes(sa, group_id: str) -> list[dict[str, float]]:
+    """Changes of all samples of the group."""
+    group = {g.uid: g for g in sa.groups}[group_id]
+    samples: xr.DataArray = sa.samples[group_id]
+    parameter_ids = [p.uid for p in sa.parameters]
+    return [
+        {**group.changes, **dict(zip(parameter_ids, values))}
+        for values in samples.values
+    ]
+
+
+def sample_chunks(n_samples: int, chunk_size: int) -> list[tuple[int, int]]:
+    """(start, end) of the chunks of samples."""
+    return [
+        (start, min(start + chunk_size, n_samples))
+        for start in range(0, n_samples, chunk_size)
+    ]
+
+
+def cache_key(sa, seed: Optional[int]) -> str:
+    """Hash of the inputs of the sensitivity analysis.
+
+    Covers the model SBML, the simulation changes, selections and horizon,
+    the parameters with bounds, the outputs, the groups and the seed; cached
+    results are only valid if all of them match.
+    """
+    sensitivity_simulation = sa.sensitivity_simulation
+    data = {
+        "model": sha256_for_path(Path(sensitivity_simulation.model_path)),
+        "changes_simulation": sensitivity_simulation.changes_simulation,
+        "selections": sensitivity_simulation.selections,
+        "horizon": {
+            key: getattr(sensitivity_simulation, key, None)
+            for key in ["tend", "steps"]
+        },
+        "parameters": [
+            [p.uid, p.value, p.lower_bound, p.upper_bound] for p in sa.parameters
+        ],
+        "outputs": [[o.uid, o.unit] for o in sensitivity_simulation.outputs],
+        "groups": [[g.uid, g.changes] for g in sa.groups],
+        "seed": seed,
+    }
+    data_str = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(data_str.encode("utf-8")).hexdigest()[:16]
+
+
+def _chunk_key(changes_list: list[dict[str, float]], output_ids: list[str]) -> str:
+    """Hash of the samples and outputs of a chunk."""
+    data = json.dumps([changes_list, output_ids], sort_keys=True)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _chunk_path(checkpoint_path: Path, group_id: str, start: int, end: int) -> Path:
+    return checkpoint_path / group_id / f"chunk_{start:08d}_{end:08d}.nc"
+
+
+def _write_chunk(
+    path: Path, start: int, values: np.ndarray, output_ids: list[str], key: str
+) -> None:
+    """Write results of a chunk, the outputs are stored as columns."""
+    ds = xr.Dataset(
+        {"results": (("output", "sample"), values.T)},
+        coords={"output": output_ids, "sample": np.arange(start, start + len(values))},
+        attrs={"key": key},
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # write to temporary file, so that interrupted writes leave no chunk
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    ds.to_netcdf(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _read_chunk(path: Path, output_ids: list[str], key: str) -> Optional[np.ndarray]:
+    """Read results [samples x outputs] of a chunk, None if not valid."""
+    if not path.exists():
+        return None
+    try:
+        ds = xr.load_dataset(path)
+        if ds.attrs.get("key") != key:
+            return None
+        return ds["results"].sel(output=output_ids).values.T
+    except (OSError, ValueError, KeyError) as err:
+        logger.warning(f"Invalid checkpoint chunk '{path}': {err}")
+        return None
+
+
+def simulate_samples(
+    sa,
+    n_workers: int = 1,
+    chunk_size: int = 64,
+    checkpoint_path: Optional[Path] = None,
+) -> None:
+    """Simulate the samples of all groups and set the results of the analysis.
+
+    Replaces `SensitivityAnalysis.simulate_samples`, the results have the
+    same layout [samples x outputs].
+
+    :param sa: sensitivity analysis with created samples
+    :param n_workers: number of worker processes, 1 simulates in the main
+        process
+    :param chunk_size: number of samples per dispatched chunk
+    :param checkpoint_path: directory for the results of completed chunks,
+        None for no checkpoints
+    """
+    sensitivity_simulation = sa.sensitivity_simulation
+    output_ids = [o.uid for o in sensitivity_simulation.outputs]
+    pool = None
+    if n_workers > 1:
+        pool = multiprocessing.Pool(
+            processes=n_workers,
+            initializer=_init_worker,
+            initargs=(sensitivity_simulation, model_cache_enabled()),
+        )
+    else:
+        _init_worker(sensitivity_simulation, model_cache_enabled())
+
+    try:
+        for group in sa.groups:
+            console.print(f"Simulate group: '{group.uid}'", style="blue")
+            t_start = time.perf_counter()
+            changes = sample_changes(sa, group.uid)
+            n_samples = len(changes)
+            results = xr.DataArray(
+                np.full((n_samples, len(output_ids)), np.nan),
+                dims=["sample", "output"],
+                coords={"sample": range(n_samples), "output": sensitivity_simulation.outputs},
+                name="results",
+            )
+            tasks = []
+            keys = {}
+            n_resumed = 0
+            for start, end in sample_chunks(n_samples, chunk_size):
+                key = _chunk_key(changes[start:end], output_ids)
+                if checkpoint_path:
+                    values = _read_chunk(
+                        _chunk_path(checkpoint_path, group.uid, start, end), output_ids, key
+                    )
+                    if values is not None:
+                        results[start:end, :] = values
+                        n_resumed += end - start
+                        continue
+                keys[start] = key
+                tasks.append((start, changes[start:end], output_ids))
+            if n_resumed:
+                console.print(f"Resume from checkpoint: {n_resumed}/{n_samples} samples")
+
+            chunk_results = (
+                pool.imap_unordered(_simulate_chunk, tasks)
+                if pool else map(_simulate_chunk, tasks)
+            )
+            for start, values in chunk_results:
+                end = start + len(values)
+                results[start:end, :] = values
+                if checkpoint_path:
+                    _write_chunk(
+                        _chunk_path(checkpoint_path, group.uid, start, end),
+                        start=start, values=values, output_ids=output_ids, key=keys[start],
+                    )
+
+            sa.results[group.uid] = results
+            console.print(
+                f"Simulated {n_samples - n_resumed} samples on {max(n_workers, 1)} workers: "
+                f"{time.perf_counter() - t_start:.3f} s"
+            )
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
@@ -0,0 +1,226 @@
+"""Local sensitivity analysis with forward sensitivity equations.
+
+The finite difference local sensitivity analysis needs two or more complete
+simulations per parameter and group. Here the sensitivities of the state
+trajectories `S(t) = dx(t)/dp` for all parameters are integrated together
+with the model (forward sensitivity equations, CVODES via roadrunner), i.e.
+one augmented integration per group.
+
+The sensitivities of the outputs are derived from the state sensitivities:
+
+- concentrations `C = A/V`: `dC/dp = (dA/dp - C dV/dp) / V`
+- outputs are functionals of the timecourses (`timecourse_outputs`), their
+  derivatives are central differences of the functionals along the
+  linearized timecourses `x ± h p S(t)`, so that no further simulations are
+  required
+- outputs of readouts which are not state variables (assignment rules,
+  e.g. blood pressure) are central finite differences of simulations with
+  the changed parameters, i.e. these outputs require two simulations per
+  parameter
+
+The timecourse is simulated with `simulate_timecourse`, i.e. with the same
+horizon as the finite difference analysis, the sensitivities are
+integrated on the same time grid.
+
+Parameters have to be global parameters of the model. Sensitivities of
+initial values (initial assignments) are not included.
+"""
+from __future__ import annotations
+
+import weakref
+from functools import lru_cache
+from pathlib import Path
+
+import libsbml
+import numpy as np
+import pandas as pd
+import roadrunner
+import xarray as xr
+from sbmlutils.console import console
+
+
+# number of global parameters of the first sensitivity calculation of a model,
+# roadrunner crashes if later calculations request more parameters
+_n_sensitivity_parameters: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+@lru_cache
+def _species_compartments(model_path: str) -> dict[str, str]:
+    """Compartment ids of the species."""
+    doc: libsbml.SBMLDocument = libsbml.readSBMLFromFile(model_path)
+    return {s.getId(): s.getCompartment() for s in doc.getModel().getListOfSpecies()}
+
+
+def _time_series_sensitivities(
+    r: roadrunner.RoadRunner, start: float, end: float, num: int, parameter_ids: list[str]
+) -> tuple[np.ndarray, np.ndarray, list[str]]:
+    """State sensitivities with respect to the parameters along a timecourse.
+
+    Roadrunner returns the sensitivities of a subset of the global parameters
+    at the position of the parameters in all global parameters, truncated to
+    the number of requested parameters (e.g. zeros for only the second
+    parameter). The sensitivities are calculated for the global parameters up
+    to the last requested parameter and selected by id.
+
+    The sensitivity solver keeps the parameter values and state of the model
+    from its creation and is synchronized with the current model first. The
+    number of global parameters cannot grow after the first calculation of a
+    model.
+
+    :return: time points, sensitivities [time x parameters x variables],
+        ids of the variables
+    """
+    global_ids = list(r.model.getGlobalParameterIds())
+    n = max(global_ids.index(pid) for pid in parameter_ids) + 1
+    n_first = _n_sensitivity_parameters.setdefault(r, n)
+    if n > n_first:
+        raise RuntimeError(
+            f"Sensitivities of {n} global parameters requested, but the model was "
+            f"used for {n_first} global parameters, load a new model."
+        )
+    r.getSensitivitySolver().syncWithModel(r.model)
+    time, sens, rownames, colnames = r.timeSeriesSensitivities(
+        start, end, num, params=global_ids[:n]
+    )
+    rownames = list(rownames)
+    sens = np.asarray(sens)[:, [rownames.index(pid) for pid in parameter_ids], :]
+    return np.asarray(time), sens, list(colnames)
+
+
+def forward_sensitivities(
+    sensitivity_simulation,
+    r: roadrunner.RoadRunner,
+    changes: dict[str, float],
+    parameter_ids: list[str],
+    h: float = 1e-3,
+) -> tuple[dict[str, float], dict[str, np.ndarray]]:
+    """Outputs and their derivatives with respect to the parameters.
+
+    :param sensitivity_simulation: LosartanSensitivitySimulation
+    :param r: roadrunner model
+    :param changes: changes of the group
+    :param parameter_ids: ids of the global parameters
+    :param h: relative parameter change of the linearized timecourses
+    :return: outputs, derivatives of the outputs [parameters]
+    """
+    sim = sensitivity_simulation
+    all_changes = {**sim.changes_simulation, **changes}
+    sim.apply_changes(r, all_changes, reset_all=True)
+    p = np.array([r.getValue(pid) for pid in parameter_ids])
+    dp = h * p
+
+    # volumes of the concentrations and their derivatives
+    compartments = _species_compartments(str(sim.model_path))
+    compartment_ids = sorted({
+        compartments[sel[1:-1]] for sel in sim.selections
+        if sel.startswith("[") and sel[1:-1] in compartments
+    })
+    volumes = {cid: r.getValue(cid) for cid in compartment_ids}
+    dvolumes = {cid: np.zeros(len(p)) for cid in compartment_ids}
+    for j, pid in enumerate(parameter_ids):
+        r.setValue(pid, p[j] + dp[j])
+        v_up = {cid: r.getValue(cid) for cid in compartment_ids}
+        r.setValue(pid, p[j] - dp[j])
+        v_down = {cid: r.getValue(cid) for cid in compartment_ids}
+        r.setValue(pid, p[j])
+        for cid in compartment_ids:
+            dvolumes[cid][j] = (v_up[cid] - v_down[cid]) / (2 * dp[j])
+
+    # timecourse with the horizon of the simulation
+    s = {key: np.array(values) for key, values in sim.simulate_timecourse(r, changes).items()}
+    y = sim.timecourse_outputs(s)
+    time = s["time"]
+
+    # state sensitivities [time x parameters x variables] on the same time grid
+    sim.apply_changes(r, all_changes, reset_all=True)
+    t_sens, sens, variables = _time_series_sensitivities(
+        r, time[0], time[-1], len(time), parameter_ids=parameter_ids
+    )
+    if not np.allclose(t_sens, time):
+        raise ValueError("Forward sensitivities require a uniform time grid of the timecourse.")
+
+    # sensitivities of the selections [time x parameters]
+    ds: dict[str, np.ndarray] = {}
+    readouts: list[str] = []
+    for sel in s:
+        if sel == "time":
+            continue
+        sid = sel[1:-1] if sel.startswith("[") else sel
+        if sel.startswith("[") and sid in variables:
+            cid = compartments[sid]
+            ds[sel] = (
+                sens[:, :, variables.index(sid)] - np.outer(s[sel], dvolumes[cid])
+            ) / volumes[cid]
+        elif sel in variables:
+            ds[sel] = sens[:, :, variables.index(sel)]
+        else:
+            readouts.append(sel)
+
+    # outputs of readouts by finite differences
+    readout_keys = [key for key in y if any(key.startswith(f"{sel}_") for sel in readouts)]
+    dy_readouts = {key: np.full(len(p), np.nan) for key in readout_keys}
+    if readout_keys:
+        for j, pid in enumerate(parameter_ids):
+            y_fd = []
+            for sign in [1.0, -1.0]:
+                s_fd = sim.simulate_timecourse(r, {**changes, pid: p[j] + sign * dp[j]})
+                y_fd.append(sim.timecourse_outputs(s_fd))
+            for key in readout_keys:
+                dy_readouts[key][j] = (y_fd[0][key] - y_fd[1][key]) / (2 * dp[j])
+
+    # outputs of the linearized timecourses
+    dy = {key: np.full(len(p), np.nan) for key in y}
+    for j in range(len(p)):
+        y_lin = []
+        for sign in [1.0, -1.0]:
+            s_lin = {
+                key: values + sign * dp[j] * ds[key][:, j] if key in ds else values
+                for key, values in s.items()
+            }
+            y_lin.append(sim.timecourse_outputs(s_lin))
+        for key in y:
+            dy[key][j] = (y_lin[0][key] - y_lin[1][key]) / (2 * dp[j])
+    dy.update(dy_readouts)
+
+    return y, dy
+
+
+def forward_local_sensitivity(sa, h: float = 1e-3) -> None:
+    """Calculate local sensitivities of the analysis with forward sensitivities.
+
+    Sets the raw and normalized sensitivities [parameter x output] of all
+    groups in `sa.sensitivity`, i.e. the plots of the local sensitivity
+    analysis can be used. The normalized sensitivities are written as TSV.
+
+    :param sa: local sensitivity analysis (samples are not required)
+    :param h: relative parameter change of the linearized timecourses
+    """
+    sim = sa.sensitivity_simulation
+    parameter_ids = [p.uid for p in sa.parameters]
+    output_ids = [o.uid for o in sim.outputs]
+    r = sim.load_model(model_path=sim.model_path, selections=sim.selections)
+
+    for kg, group in enumerate(sa.groups):
+        console.print(f"Forward sensitivities group: '{group.uid}'", style="blue")
+        y, dy = forward_sensitivities(
+            sim, r, changes=group.changes, parameter_ids=parameter_ids, h=h
+        )
+        sim.apply_changes(r, {**sim.changes_simulation, **group.changes}, reset_all=True)
+        p = np.array([r.getValue(pid) for pid in parameter_ids])
+
+        raw = np.array([dy[oid] for oid in output_ids]).T
+        normalized = raw * p[:, np.newaxis] / np.array([y[oid] for oid in output_ids])
+        sa.sensitivity[group.uid] = {
+            key: xr.DataArray(
+                values,
+                dims=["parameter", "output"],
+                coords={"parameter": parameter_ids, "output": output_ids},
+                name=key,
+            )
+            for key, values in [("raw", raw), ("normalized", normalized)]
+        }
+
+        df: pd.DataFrame = sa.sensitivity[group.uid]["normalized"].to_pandas()
+        df.to_csv(
+            Path(sa.results_path) / f"local_forward_{kg:>02}_{group.uid}.tsv", sep="\t"
+        )
@@ -1,10 +1,14 @@
 """Sensitivity analysis."""
 from __future__ import annotations
 
+import multiprocessing
+from pathlib import Path
+
 import dill
 import numpy as np
 import pandas as pd
 import roadrunner
+import xarray as xr
 from roadrunner._roadrunner import NamedArray
 
 from sbmlsim.sensitivity.analysis import (
@@ -23,93 +27,146 @@ from sbmlutils.console import console
 from pkdb_analysis.pk.pharmacokinetics import TimecoursePK
 from pint import UnitRegistry
 
+from pkdb_models.models.losartan import MODEL_PATH, RESULTS_PATH
+from pkdb_models.models.losartan.losartan_pk import pk_parameters, pk_units
+from pkdb_models.models.losartan.model_cache import (
+    enable_model_cache,
+    load_roadrunner,
+    model_cache_enabled,
+)
+from pkdb_models.models.losartan.sensitivity.evaluation import cache_key, simulate_samples
+from pkdb_models.models.losartan.sensitivity.forward_sensitivity import forward_local_sensitivity
+from pkdb_models.models.losartan.sensitivity.sequential_sobol import sequential_sobol
+from pkdb_models.models.losartan.sensitivity.surrogate import PolynomialChaosSurrogate, holdout_report
+
+ureg = UnitRegistry()
+Q_ = ureg.Quantity
+
+# losartan dose of the simulation
+DOSE_LOS = Q_(10, "mg") / Q_(461.0, "g/mole")
+
+# pharmacokinetic outputs per concentration
+PK_OUTPUTS: dict[str, list[str]] = {
+    "[Cve_los]": ["aucinf", "cmax", "thalf", "vd", "cl", "kel"],
+    "[Cve_e3174]": ["aucinf", "cmax", "thalf"],
+    "[Cve_l158]": ["aucinf", "cmax", "thalf"],
+}
+
+# pharmacodynamic outputs (minimum or maximum of readout)
+PD_OUTPUTS: list[tuple[str, str]] = [
+    ("[ang1]", "max"),
+    ("[ang2]", "max"),
+    ("[ren]", "max"),
+    ("[ald]", "min"),
+    ("SBP", "min"),
+    ("DBP", "min"),
+    ("MAP", "min"),
+]
+
+# timecourse of the outputs by selection
+Timecourse = dict[str, np.ndarray]
+
+# conversion factors and units of the pharmacokinetic parameters
+PK_UNITS = {
+    sid: pk_units(
+        ureg, time_unit="min", concentration_unit="mM",
+        dose_unit=DOSE_LOS.units if sid == "[Cve_los]" else None,
+    )
+    for sid in PK_OUTPUTS
+}
+
 
 class LosartanSensitivitySimulation(SensitivitySimulation):
     """Simulation for sensitivity calculation."""
 
+    @staticmethod
+    def load_model(model_path: Path, selections: list[str]) -> roadrunner.RoadRunner:
+        """Load roadrunner model, via the cache of compiled models if enabled."""
+        if model_cache_enabled():
+            r: roadrunner.RoadRunner = load_roadrunner(model_path)
+        else:
+            r = roadrunner.RoadRunner(str(model_path))
+        r.selections = selections
+        return r
+
+    # timecourse for the outputs
+    tend = 20 * 24 * 60  # [min]
+    steps = 3000
 
     def simulate(self, r: roadrunner.RoadRunner, changes: dict[str, float]) -> dict[str, float]:
-        tend = 20 * 24 * 60  # [min]
-        steps = 3000
+        s: Timecourse = self.simulate_timecourse(r, changes)
+        return self.timecourse_outputs(s)
+
+    @classmethod
+    def timecourse_outputs(cls, s: Timecourse) -> dict[str, float]:
+        """Outputs of the timecourse."""
+        # pharmacokinetic parameters
+        y: dict[str, float] = cls.pk_outputs(s)
+
+        # pharmacodynamics
+        for sid, f in PD_OUTPUTS:
+            # minimal and maximal value of readout
+            if f == "max":
+                y[f"{sid}_max"] = np.max(s[sid])
+            elif f == "min":
+                y[f"{sid}_min"] = np.min(s[sid])
 
-        # apply changes and simulate
+        return y
+
+    def simulate_timecourse(self, r: roadrunner.RoadRunner, changes: dict[str, float]) -> Timecourse:
+        """Apply changes and simulate the timecourse of the outputs."""
         all_changes = {
             **self.changes_simulation,
             **changes
         }
         self.apply_changes(r, all_changes, reset_all=True)
-        s: NamedArray = r.simulate(start=0, end=tend, steps=steps)
+        s: NamedArray = r.simulate(start=0, end=self.tend, steps=self.steps)
+        return {key: s[key] for key in s.colnames}
 
-        # pharmacokinetic parameters
+    @staticmethod
+    def pk_outputs(s: Timecourse) -> dict[str, float]:
+        """Pharmacokinetic outputs without units.
+
+        The parameters of all substances are calculated at once on the plain
+        arrays, the conversion factors to the units of `TimecoursePK` are
+        calculated once in `PK_UNITS`. The outputs are identical (up to
+        floating point rounding) to `pk_outputs_timecoursepk`.
+        """
+        pk = pk_parameters(
+            t=s["time"],
+            c=np.column_stack([s[sid] for sid in PK_OUTPUTS]),
+            dose=[DOSE_LOS.magnitude if sid == "[Cve_los]" else np.nan for sid in PK_OUTPUTS],
+        )
         y: dict[str, float] = {}
+        for k, (sid, pk_keys) in enumerate(PK_OUTPUTS.items()):
+            units = PK_UNITS[sid]
+            for pk_key in pk_keys:
+                y[f"{sid}_{pk_key}"] = pk[pk_key][k] * units[pk_key][0]
+        return y
 
-        # pharmacokinetics
-        ureg = UnitRegistry()
-        Q_ = ureg.Quantity
+    @staticmethod
+    def pk_outputs_timecoursepk(s: Timecourse) -> dict[str, float]:
+        """Pharmacokinetic outputs calculated with `TimecoursePK`.
 
-        # losartan
-        Mr_los = Q_(461.0, "g/mole")
+        Reference implementation for the validation of `pk_outputs`.
+        """
+        y: dict[str, float] = {}
         time = Q_(s["time"], "min")
-        tcpk = TimecoursePK(
-            time=time,
-            concentration=Q_(s["[Cve_los]"], "mM"),
-            substance="losartan",
-            ureg=ureg,
-            dose=Q_(10, "mg")/Mr_los,
-        )
-        pk_dict = tcpk.pk.to_dict()
-        # console.print(pk_dict)
-        for pk_key in [
-            "aucinf",
-            "cmax",
-            "thalf",
-            "vd",
-            "cl",
-            "kel",
-        ]:
-            y[f"[Cve_los]_{pk_key}"] = pk_dict[pk_key]
-
-        # E3174, L158
-        for sid in [
-            "[Cve_e3174]",
-            "[Cve_l158]"
-        ]:
+        for sid, pk_keys in PK_OUTPUTS.items():
             tcpk = TimecoursePK(
                 time=time,
                 concentration=Q_(s[sid], "mM"),
                 substance="losartan",
                 ureg=ureg,
-                dose=None,
+                dose=DOSE_LOS if sid == "[Cve_los]" else None,
             )
             pk_dict = tcpk.pk.to_dict()
-            # console.print(pk_dict)
-            for pk_key in [
-                "aucinf",
-                "cmax",
-                "thalf",
-                # "kel",
-            ]:
+            for pk_key in pk_keys:
                 y[f"{sid}_{pk_key}"] = pk_dict[pk_key]
 
-        # pharmacodynamics
-        for sid, f in [
-            ("[ang1]", "max"),
-            ("[ang2]", "max"),
-            ("[ren]", "max"),
-            ("[ald]", "min"),
-            ("SBP", "min"),
-            ("DBP", "min"),
-            ("MAP", "min"),
-        ]:
-            # minimal and maximal value of readout
-            if f == "max":
-                y[f"{sid}_max"] = np.max(s[sid])
-            elif f == "min":
-                y[f"{sid}_min"] = np.min(s[sid])
-
         return y
 
-    def _plot(self, s: NamedArray) -> None:
+    def _plot(self, s: Timecourse) -> None:
 
         # plotting
         from matplotlib import pyplot as plt
@@ -347,8 +404,14 @@ class LosartanSensitivitySimulation(SensitivitySimulation):
         return groups
 
 
-def local_sensitivity_analysis():
-    """Local sensitivity analysis"""
+def local_sensitivity_analysis(n_workers: int = 1, mode: str = "difference"):
+    """Local sensitivity analysis
+
+    :param n_workers: number of worker processes for the simulation of samples
+    :param mode: "difference" for finite differences of simulated samples,
+        "forward" for forward sensitivities of the state trajectories
+        (one augmented integration per group, same horizon)
+    """
     console.rule("LOSARTAN LOCAL SENSITIVITY ANALYSIS", style="blue bold", align="center")
 
     sensitivity_simulation = LosartanSensitivitySimulation.sensitivity_simulation()
@@ -363,16 +426,23 @@ def local_sensitivity_analysis():
         difference=0.01,
     )
 
-    console.rule("Samples", style="white")
-    sa.create_samples()
+    if mode == "forward":
+        console.rule("Sensitivity", style="white")
+        forward_local_sensitivity(sa)
+        console.print(sa.sensitivity)
+    elif mode == "difference":
+        console.rule("Samples", style="white")
+        sa.create_samples()
 
-    console.rule("Results", style="white")
-    sa.simulate_samples()
-    console.print(sa.results)
+        console.rule("Results", style="white")
+        simulate_samples(sa, n_workers=n_workers)
+        console.print(sa.results)
 
-    console.rule("Sensitivity", style="white")
-    sa.calculate_sensitivity()
-    console.print(sa.sensitivity)
+        console.rule("Sensitivity", style="white")
+        sa.calculate_sensitivity()
+        console.print(sa.sensitivity)
+    else:
+        raise ValueError(f"Unsupported local sensitivity mode: '{mode}'")
 
     console.rule("Plotting", style="white")
     for kg, group in enumerate(sa.groups):
@@ -386,12 +456,21 @@ def local_sensitivity_analysis():
             vcenter=0.0,
             vmin=-2.0,
             vmax=2.0,
-            fig_path=sa.results_path / f"local_sensitivity_{kg:>02}_{group.uid}_{sa.difference}.png",
+            fig_path=sa.results_path / (
+                f"local_sensitivity_{kg:>02}_{group.uid}_forward.png" if mode == "forward"
+                else f"local_sensitivity_{kg:>02}_{group.uid}_{sa.difference}.png"
+            ),
         )
 
 
-def global_sensitivity_analysis():
-    """Global sensitivity analysis"""
+def global_sensitivity_analysis(n_workers: int = 1, sequential: bool = False):
+    """Global sensitivity analysis
+
+    :param n_workers: number of worker processes for the simulation of samples
+    :param sequential: grow the samples in batches until the confidence
+        intervals of the Sobol indices above the cutoff are narrower than
+        the target width, `N` is the maximal length of the Sobol' sequence
+    """
 
     console.rule("LOSARTAN GLOBAL SENSITIVITY ANALYSIS", style="blue bold", align="center")
     sensitivity_simulation = LosartanSensitivitySimulation.sensitivity_simulation()
@@ -400,35 +479,51 @@ def global_sensitivity_analysis():
     # only analysis on control group
     groups = [g for g in groups if g.uid == "control"]
 
+    seed = 1234
     sa = SobolSensitivityAnalysis(
         sensitivity_simulation=sensitivity_simulation,
         parameters=parameters,
         groups=groups,
         results_path=RESULTS_PATH / "sensitivity",
         N=4096,
-        seed=1234,
+        seed=seed,
     )
+    # caches are only reused for identical model, parameters, outputs, groups and seed
+    key = cache_key(sa, seed=seed)
+
+    if sequential:
+        console.rule("Sequential sampling", style="white")
+        sequential_sobol(
+            sa,
+            checkpoint_path=sa.results_path / f"sobol_sequential_{key}_results",
+            N_start=256,
+            N_max=sa.N,
+            ci_width=0.1,
+            cutoff=0.05,
+            n_workers=n_workers,
+            seed=seed,
+        )
+        console.print(sa.sensitivity)
+        plot_sobol_sensitivity(sa)
+        return
 
     console.rule("Samples", style="white")
     sa.create_samples()
     console.print(sa.samples)
 
     console.rule("Results", style="white")
+    # completed chunks are checkpointed, interrupted runs resume
     cache_results: bool = True
-    results_path = sa.results_path / f"sobol_sensitivity_N{sa.N}_results.pkl"
-    if not cache_results or (cache_results and not results_path.exists()):
-        sa.simulate_samples()
-        with open(results_path, 'wb') as f:
-            dill.dump(sa.results, f)
-    else:
-        with open(results_path, 'rb') as f:
-            sa.results = dill.load(f)
+    checkpoint_path = sa.results_path / f"sobol_sensitivity_N{sa.N}_{key}_results"
+    simulate_samples(
+        sa, n_workers=n_workers, checkpoint_path=checkpoint_path if cache_results else None
+    )
 
     console.print(sa.results)
 
     console.rule("Sensitivity", style="white")
     cache_sensitivity: bool = True
-    sensitivity_path = sa.results_path / f"sobol_sensitivity_N{sa.N}.pkl"
+    sensitivity_path = sa.results_path / f"sobol_sensitivity_N{sa.N}_{key}.pkl"
     if not cache_sensitivity or (cache_sensitivity and not sensitivity_path.exists()):
         sa.calculate_sensitivity()
         with open(sensitivity_path, 'wb') as f:
@@ -438,7 +533,11 @@ def global_sensitivity_analysis():
             sa.sensitivity = dill.load(f)
 
     console.print(sa.sensitivity)
+    plot_sobol_sensitivity(sa)
 
+
+def plot_sobol_sensitivity(sa: SobolSensitivityAnalysis, prefix: str = "sobol_sensitivity") -> None:
+    """Heatmaps and barplots of the Sobol indices."""
     console.rule("Plotting", style="white")
     # Heatmaps
     for kg, group in enumerate(sa.groups):
@@ -453,15 +552,16 @@ def global_sensitivity_analysis():
                 vcenter=0.5,
                 vmin=0.0,
                 vmax=1.0,
-                fig_path=sa.results_path / f"sobol_sensitivity_N{sa.N}_{kg:>02}_{group.uid}_{key}.png"
+                fig_path=sa.results_path / f"{prefix}_N{sa.N}_{kg:>02}_{group.uid}_{key}.png"
             )
 
         # Barplots
         sa.plot_sobol_indices(
-            fig_path=sa.results_path / f"sobol_sensitivity_N{sa.N}_{kg:>02}_{group.uid}.png",
+            fig_path=sa.results_path / f"{prefix}_N{sa.N}_{kg:>02}_{group.uid}.png",
         )
 
-def sampling_sensitivity_analysis():
+
+def sampling_sensitivity_analysis(n_workers: int = 1):
     """Sampling sensitivity/uncertainty analysis"""
 
     console.rule("LOSARTAN SAMPLING SENSITIVITY ANALYSIS", style="blue bold", align="center")
@@ -469,29 +569,28 @@ def sampling_sensitivity_analysis():
     parameters = sensitivity_simulation.sensitivity_parameters()
     groups = sensitivity_simulation.sensitivity_groups()
 
+    seed = 1234
     sa = SamplingSensitivityAnalysis(
         sensitivity_simulation=sensitivity_simulation,
         parameters=parameters,
         results_path=RESULTS_PATH / "sensitivity",
         N=1000,
-        seed=1234,
+        seed=seed,
         groups=groups,
     )
+    key = cache_key(sa, seed=seed)
 
     console.rule("Samples", style="white")
     sa.create_samples()
     console.print(sa.samples)
 
     console.rule("Results", style="white")
+    # completed chunks are checkpointed, interrupted runs resume
     cache_results: bool = True
-    results_path = sa.results_path / f"sampling_sensitivity_N{sa.N}_results.pkl"
-    if not cache_results or (cache_results and not results_path.exists()):
-        sa.simulate_samples()
-        with open(results_path, 'wb') as f:
-            dill.dump(sa.results, f)
-    else:
-        with open(results_path, 'rb') as f:
-            sa.results = dill.load(f)
+    checkpoint_path = sa.results_path / f"sampling_sensitivity_N{sa.N}_{key}_results"
+    simulate_samples(
+        sa, n_workers=n_workers, checkpoint_path=checkpoint_path if cache_results else None
+    )
 
     console.print(sa.results)
 
@@ -508,6 +607,121 @@ def sampling_sensitivity_analysis():
         fig_path=sa.results_path / f"sampling_sensitivity_N{sa.N}.png",
     )
 
+def surrogate_sensitivity_analysis(
+    n_workers: int = 1,
+    N_train: int = 4096,
+    N_test: int = 512,
+    N_emulator: int = 100000,
+    degree: int = 2,
+):
+    """Sobol and sampling sensitivity analysis with a surrogate.
+
+    A polynomial chaos surrogate is fitted on `N_train` simulations, its
+    accuracy is checked on `N_test` holdout simulations. The Sobol indices
+    follow analytically from the surrogate, the sampling statistics are
+    calculated from `N_emulator` samples of the surrogate.
+    """
+    console.rule("LOSARTAN SURROGATE SENSITIVITY ANALYSIS", style="blue bold", align="center")
+    sensitivity_simulation = LosartanSensitivitySimulation.sensitivity_simulation()
+    parameters = sensitivity_simulation.sensitivity_parameters()
+    groups = sensitivity_simulation.sensitivity_groups()
+    output_ids = [o.uid for o in sensitivity_simulation.outputs]
+
+    seed = 1234
+    sa_design = SamplingSensitivityAnalysis(
+        sensitivity_simulation=sensitivity_simulation,
+        parameters=parameters,
+        results_path=RESULTS_PATH / "sensitivity",
+        N=N_train + N_test,
+        seed=seed,
+        groups=groups,
+    )
+    key = cache_key(sa_design, seed=seed)
+
+    console.rule("Design", style="white")
+    sa_design.create_samples()
+    checkpoint_path = sa_design.results_path / f"surrogate_N{sa_design.N}_{key}_results"
+    simulate_samples(sa_design, n_workers=n_workers, checkpoint_path=checkpoint_path)
+
+    # analytical Sobol indices and emulator samples
+    sa_sobol = SobolSensitivityAnalysis(
+        sensitivity_simulation=sensitivity_simulation,
+        parameters=parameters,
+        groups=groups,
+        results_path=RESULTS_PATH / "sensitivity",
+        N=N_train,
+        seed=seed,
+    )
+    sa_sampling = SamplingSensitivityAnalysis(
+        sensitivity_simulation=sensitivity_simulation,
+        parameters=parameters,
+        results_path=RESULTS_PATH / "sensitivity",
+        N=N_emulator,
+        seed=seed,
+        groups=groups,
+    )
+    sa_sampling.create_samples()
+
+    reports = []
+    for group in groups:
+        console.rule(f"Surrogate: {group.uid}", style="white")
+        X = sa_design.samples[group.uid].values
+        Y = sa_design.results[group.uid].values
+        surrogate = PolynomialChaosSurrogate(
+            lower=[p.lower_bound for p in sa_design.parameters],
+            upper=[p.upper_bound for p in sa_design.parameters],
+            degree=degree,
+        ).fit(X[:N_train], Y[:N_train])
+        console.print(f"{surrogate.num_terms} terms, {N_train} training samples")
+
+        df_report = holdout_report(surrogate, X[N_train:], Y[N_train:], output_ids=output_ids)
+        df_report.insert(0, "group", group.uid)
+        console.print(df_report)
+        if not df_report.valid.all():
+            console.print(
+                f"Surrogate not accurate for outputs: "
+                f"{df_report.output[~df_report.valid].tolist()}", style="red"
+            )
+        reports.append(df_report)
+
+        S1, ST = surrogate.sobol_indices()
+        sa_sobol.sensitivity[group.uid] = {
+            key: xr.DataArray(
+                values,
+                dims=["parameter", "output"],
+                coords={"parameter": [p.uid for p in sa_sobol.parameters], "output": output_ids},
+                name=key,
+            )
+            for key, values in [
+                ("S1", S1), ("ST", ST),
+                ("S1_conf", np.full_like(S1, np.nan)), ("ST_conf", np.full_like(ST, np.nan)),
+            ]
+        }
+        sa_sampling.results[group.uid] = xr.DataArray(
+            surrogate.predict(sa_sampling.samples[group.uid].values),
+            dims=["sample", "output"],
+            coords={"sample": range(N_emulator), "output": sensitivity_simulation.outputs},
+            name="results",
+        )
+
+    df_reports = pd.concat(reports, ignore_index=True)
+    df_reports.to_csv(
+        sa_design.results_path / f"surrogate_N{N_train}_holdout.tsv", sep="\t", index=False
+    )
+
+    console.rule("Sensitivity", style="white")
+    sa_sampling.calculate_sensitivity()
+    sa_sampling.df_sampling_sensitivity(
+        df_path=sa_sampling.results_path / f"surrogate_sampling_sensitivity_N{N_emulator}_statistics.tsv"
+    )
+    sa_sampling.plot_sampling_sensitivity(
+        fig_path=sa_sampling.results_path / f"surrogate_sampling_sensitivity_N{N_emulator}.png",
+    )
+    plot_sobol_sensitivity(sa_sobol, prefix="surrogate_sobol_sensitivity")
+
+    return df_reports
+
+
 def parameter_table():
     console.rule("LOSARTAN PARAMETER TABLE", style="blue bold", align="center")
     sensitivity_simulation = LosartanSensitivitySimulation.sensitivity_simulation()
@@ -524,16 +738,18 @@ def parameter_table():
 
 
 if __name__ == "__main__":
-    from pkdb_models.models.losartan import MODEL_PATH, RESULTS_PATH
     from matplotlib import pyplot as plt
 
     # parameters
     parameter_table()
 
     # sensitivity analysis
-    # local_sensitivity_analysis()
-    # sampling_sensitivity_analysis()
-    global_sensitivity_analysis()
+    enable_model_cache()
+    n_workers = multiprocessing.cpu_count()
+    # local_sensitivity_analysis(n_workers=n_workers)
+    # sampling_sensitivity_analysis(n_workers=n_workers)
+    # surrogate_sensitivity_analysis(n_workers=n_workers)
+    global_sensitivity_analysis(n_workers=n_workers)
 
 
 
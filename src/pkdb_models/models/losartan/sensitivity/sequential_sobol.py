@@ -0,0 +1,180 @@
+"""Sobol sensitivity analysis with sequential sampling.
+
+Instead of a fixed length `N` of the Sobol' sequence, the Saltelli sample is
+grown in batches (doubling `N`) until the Sobol indices are converged: after
+every batch the first order (S1) and total (ST) indices with bootstrap
+confidence intervals are calculated, the sampling stops once all indices
+above the cutoff have confidence intervals narrower than `ci_width`.
+
+The Saltelli sample of `N` is a prefix of the sample of `2N` (unscrambled
+Sobol' sequence), i.e. the evaluations of previous batches are reused from
+the checkpoint of the evaluation and only the new samples are simulated.
+The layout of the samples is the layout of SALib (second order indices).
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import SALib.analyze.sobol
+import xarray as xr
+from scipy.stats import qmc
+from sbmlutils import log
+from sbmlutils.console import console
+
+from pkdb_models.models.losartan.sensitivity.evaluation import simulate_samples
+
+logger = log.get_logger(__name__)
+
+SOBOL_KEYS = ["S1", "ST", "S1_conf", "ST_conf"]
+
+
+def saltelli_samples(sa, N: int, skip: int = 1024) -> np.ndarray:
+    """Saltelli samples [(2D + 2) * N x D] of the parameters.
+
+    :param sa: sensitivity analysis
+    :param N: length of the Sobol' sequence, power of 2
+    :param skip: skipped points of the Sobol' sequence, power of 2
+    """
+    d = len(sa.parameters)
+    engine = qmc.Sobol(d=2 * d, scramble=False)
+    engine.fast_forward(skip)
+    base = engine.random(N)
+    lower = np.array([p.lower_bound for p in sa.parameters])
+    upper = np.array([p.upper_bound for p in sa.parameters])
+    base = qmc.scale(base, np.tile(lower, 2), np.tile(upper, 2))
+
+    A, B = base[:, :d], base[:, d:]
+    samples = np.zeros((N, 2 * d + 2, d))
+    samples[:, 0, :] = A
+    for k in range(d):
+        samples[:, 1 + k, :] = A
+        samples[:, 1 + k, k] = B[:, k]
+        samples[:, 1 + d + k, :] = B
+        samples[:, 1 + d + k, k] = A[:, k]
+    samples[:, -1, :] = B
+    return samples.reshape(-1, d)
+
+
+def sobol_indices(
+    sa,
+    group_id: str,
+    num_resamples: int = 100,
+    conf_level: float = 0.95,
+    seed: Optional[int] = None,
+) -> dict[str, xr.DataArray]:
+    """Sobol indices [parameter x output] with bootstrap confidence intervals.
+
+    The confidence intervals (`*_conf`) are the half widths of the interval.
+
+    :param seed: seed of the bootstrap resampling
+    """
+    parameter_ids = [p.uid for p in sa.parameters]
+    output_ids = [o.uid for o in sa.sensitivity_simulation.outputs]
+    problem = {
+        "num_vars": len(parameter_ids),
+        "names": parameter_ids,
+        "bounds": [[p.lower_bound, p.upper_bound] for p in sa.parameters],
+    }
+    Y = sa.results[group_id].values
+    sensitivity = {
+        key: xr.DataArray(
+            np.full((len(parameter_ids), len(output_ids)), np.nan),
+            dims=["parameter", "output"],
+            coords={"parameter": parameter_ids, "output": output_ids},
+            name=key,
+        )
+        for key in SOBOL_KEYS
+    }
+    for ko, oid in enumerate(output_ids):
+        Yo = Y[:, ko]
+        if np.ptp(Yo) == 0.0 or np.any(np.isnan(Yo)):
+            logger.warning(f"Group '{group_id}': no Sobol indices for output '{oid}'")
+            continue
+        Si = SALib.analyze.sobol.analyze(
+            problem,
+            Yo,
+            calc_second_order=True,
+            num_resamples=num_resamples,
+            conf_level=conf_level,
+            print_to_console=False,
+            seed=seed,
+        )
+        for key in SOBOL_KEYS:
+            sensitivity[key][:, ko] = Si[key]
+    return sensitivity
+
+
+def max_ci_width(sensitivity: dict[str, xr.DataArray], cutoff: float) -> float:
+    """Largest confidence interval width of the indices above the cutoff."""
+    widths = []
+    for key in ["S1", "ST"]:
+        above = sensitivity[key].values > cutoff
+        widths.append(2 * sensitivity[f"{key}_conf"].values[above])
+    widths = np.concatenate(widths)
+    widths = widths[~np.isnan(widths)]
+    return float(np.max(widths)) if widths.size else 0.0
+
+
+def sequential_sobol(
+    sa,
+    checkpoint_path: Path,
+    N_start: int = 256,
+    N_max: int = 8192,
+    ci_width: float = 0.1,
+    cutoff: float = 0.05,
+    n_workers: int = 1,
+    seed: Optional[int] = None,
+) -> int:
+    """Sobol indices of all groups with sequential sampling.
+
+    Sets the samples, results, sensitivity and `N` of the analysis.
+
+    :param sa: Sobol sensitivity analysis
+    :param checkpoint_path: directory for the evaluated samples, previous
+        batches are reused from the checkpoint
+    :param N_start: length of the Sobol' sequence of the first batch, power of 2
+    :param N_max: maximal length of the Sobol' sequence
+    :param ci_width: target width of the confidence intervals
+    :param cutoff: indices above the cutoff must be converged
+    :param n_workers: number of worker processes
+    :param seed: seed of the bootstrap confidence intervals
+    :return: length of the Sobol' sequence at convergence or `N_max`
+    """
+    if N_start & (N_start - 1):
+        raise ValueError(f"N_start must be a power of 2: {N_start}")
+
+    parameter_ids = [p.uid for p in sa.parameters]
+    N = N_start
+    while True:
+        samples = saltelli_samples(sa, N=N)
+        for group in sa.groups:
+            sa.samples[group.uid] = xr.DataArray(
+                samples,
+                dims=["sample", "parameter"],
+                coords={"sample": range(len(samples)), "parameter": parameter_ids},
+                name="samples",
+            )
+        simulate_samples(sa, n_workers=n_workers, checkpoint_path=checkpoint_path)
+
+        width = 0.0
+        for group in sa.groups:
+            sa.sensitivity[group.uid] = sobol_indices(sa, group.uid, seed=seed)
+            width = max(width, max_ci_width(sa.sensitivity[group.uid], cutoff=cutoff))
+
+        converged = width <= ci_width
+        console.print(
+            f"N={N} ({len(samples)} evaluations): maximal CI width {width:.3f} "
+            f"(target {ci_width})"
+        )
+        if converged or 2 * N > N_max:
+            break
+        N *= 2
+
+    if not converged:
+        logger.warning(
+            f"Sobol indices not converged for N_max={N_max}: CI width {width:.3f} > {ci_width}"
+        )
+    sa.N = N
+    return N
@@ -0,0 +1,210 @@
+"""Polynomial chaos surrogate of the sensitivity outputs.
+
+The outputs of `LosartanSensitivitySimulation` are emulated by a polynomial
+chaos expansion (PCE) in the parameters, which are uniformly distributed
+within their bounds (as in the sampling and Sobol analysis). The basis are
+products of orthonormal Legendre polynomials up to total degree `degree`
+with at most `max_interaction` parameters per term.
+
+The coefficients are fitted by ridge regression on a design of simulations,
+the regularization of every output is selected by generalized
+cross-validation (one SVD of the design matrix for all outputs). Mean,
+variance and the Sobol indices follow analytically from the coefficients of
+the orthonormal basis:
+
+- mean: coefficient of the constant term
+- variance: sum of the squared coefficients of all other terms
+- S1: terms which only depend on the parameter
+- ST: all terms which depend on the parameter
+
+The accuracy of the surrogate is assessed on holdout simulations which were
+not used for fitting (`holdout_report`).
+"""
+from __future__ import annotations
+
+from itertools import combinations, product
+
+import numpy as np
+import pandas as pd
+from sbmlutils import log
+
+logger = log.get_logger(__name__)
+
+
+def multi_indices(
+    num_parameters: int, degree: int, max_interaction: int
+) -> list[tuple[tuple[int, int], ...]]:
+    """Terms of the expansion as tuples of (parameter index, degree).
+
+    The first term is the constant term `()`.
+    """
+    terms: list[tuple[tuple[int, int], ...]] = [()]
+    for order in range(1, min(max_interaction, degree) + 1):
+        for parameters in combinations(range(num_parameters), order):
+            for degrees in product(range(1, degree - order + 2), repeat=order):
+                if sum(degrees) <= degree:
+                    terms.append(tuple(zip(parameters, degrees)))
+    return terms
+
+
+def legendre(u: np.ndarray, degree: int) -> np.ndarray:
+    """Orthonormal Legendre polynomials [degree + 1 x ...] on [-1, 1]."""
+    P = np.zeros((degree + 1, *u.shape))
+    P[0] = 1.0
+    if degree > 0:
+        P[1] = u
+    for n in range(1, degree):
+        P[n + 1] = ((2 * n + 1) * u * P[n] - n * P[n - 1]) / (n + 1)
+    # orthonormal with respect to the uniform distribution
+    return P * np.sqrt(2 * np.arange(degree + 1) + 1)[(...,) + (np.newaxis,) * u.ndim]
+
+
+class PolynomialChaosSurrogate:
+    """Polynomial chaos expansion of outputs in uniform parameters."""
+
+    def __init__(
+        self,
+        lower: np.ndarray,
+        upper: np.ndarray,
+        degree: int = 2,
+        max_interaction: int = 2,
+    ):
+        """Initialize the expansion.
+
+        :param lower: lower bounds of the parameters
+        :param upper: upper bounds of the parameters
+        :param degree: maximal total degree of the terms
+        :param max_interaction: maximal number of parameters per term
+        """
+        self.lower = np.asarray(lower, dtype=float)
+        self.upper = np.asarray(upper, dtype=float)
+        self.degree = degree
+        self.terms = multi_indices(len(self.lower), degree, max_interaction)
+        self.coefficients: np.ndarray | None = None
+
+    @property
+    def num_terms(self) -> int:
+        return len(self.terms)
+
+    def basis(self, X: np.ndarray) -> np.ndarray:
+        """Design matrix [samples x terms] of the parameter samples."""
+        u = 2 * (X - self.lower) / (self.upper - self.lower) - 1
+        P = legendre(u, self.degree)  # [degree x samples x parameters]
+        Psi = np.ones((X.shape[0], self.num_terms))
+        for kt, term in enumerate(self.terms):
+            for kp, deg in term:
+                Psi[:, kt] *= P[deg, :, kp]
+        return Psi
+
+    def fit(self, X: np.ndarray, Y: np.ndarray) -> PolynomialChaosSurrogate:
+        """Fit the coefficients [terms x outputs].
+
+        Samples with nan outputs are excluded for the respective output.
+
+        :param X: parameter samples [samples x parameters]
+        :param Y: outputs [samples x outputs]
+        """
+        Psi = self.basis(X)
+        self.coefficients = np.full((self.num_terms, Y.shape[1]), np.nan)
+        masks = np.isfinite(Y)
+        # one decomposition per distinct set of valid samples
+        for mask in np.unique(masks, axis=1).T:
+            outputs = np.where(np.all(masks == mask[:, np.newaxis], axis=0))[0]
+            if mask.sum() < 2:
+                logger.warning(f"Not enough valid samples for outputs: {outputs}")
+                continue
+            U, s, Vt = np.linalg.svd(Psi[mask], full_matrices=False)
+            for ko in outputs:
+                self.coefficients[:, ko] = self._ridge_gcv(U, s, Vt, Y[mask, ko])
+        return self
+
+    @staticmethod
+    def _ridge_gcv(
+        U: np.ndarray, s: np.ndarray, Vt: np.ndarray, y: np.ndarray
+    ) -> np.ndarray:
+        """Ridge coefficients with regularization by generalized cross-validation."""
+        n = len(y)
+        Uty = U.T @ y
+        # residual outside of the column space of the design matrix
+        r0 = max(float(y @ y - Uty @ Uty), 0.0)
+        gcv_min, alpha_opt = np.inf, 0.0
+        for alpha in s[0] ** 2 * np.logspace(-12, 0, 49):
+            f = s**2 / (s**2 + alpha)
+            rss = r0 + float(np.sum(((1 - f) * Uty) ** 2))
+            dof = n - float(np.sum(f))
+            if dof <= 0:
+                continue
+            gcv = n * rss / dof**2
+            if gcv < gcv_min:
+                gcv_min, alpha_opt = gcv, alpha
+        return Vt.T @ (s / (s**2 + alpha_opt) * Uty)
+
+    def predict(self, X: np.ndarray, chunk_size: int = 10000) -> np.ndarray:
+        """Outputs [samples x outputs] of the parameter samples."""
+        return np.vstack([
+            self.basis(X[k:k + chunk_size]) @ self.coefficients
+            for k in range(0, X.shape[0], chunk_size)
+        ])
+
+    @property
+    def mean(self) -> np.ndarray:
+        return self.coefficients[0]
+
+    @property
+    def variance(self) -> np.ndarray:
+        return np.sum(self.coefficients[1:] ** 2, axis=0)
+
+    def sobol_indices(self) -> tuple[np.ndarray, np.ndarray]:
+        """First order and total Sobol indices [parameters x outputs]."""
+        c2 = self.coefficients**2
+        S1 = np.zeros((len(self.lower), c2.shape[1]))
+        ST = np.zeros_like(S1)
+        for kt, term in enumerate(self.terms):
+            for kp, _ in term:
+                ST[kp] += c2[kt]
+                if len(term) == 1:
+                    S1[kp] += c2[kt]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return S1 / self.variance, ST / self.variance
+
+
+def holdout_report(
+    surrogate: PolynomialChaosSurrogate,
+    X: np.ndarray,
+    Y: np.ndarray,
+    output_ids: list[str],
+    q2_min: float = 0.95,
+) -> pd.DataFrame:
+    """Prediction errors of the surrogate on holdout samples.
+
+    Q2 is the coefficient of determination of the holdout predictions, an
+    output is valid if `Q2 >= q2_min`. The maximal relative error is
+    calculated for the nonzero outputs (NaN if all outputs are zero).
+
+    :param surrogate: fitted surrogate
+    :param X: holdout parameter samples [samples x parameters]
+    :param Y: holdout outputs [samples x outputs]
+    :param output_ids: ids of the outputs
+    :param q2_min: minimal Q2 of valid outputs
+    """
+    Y_pred = surrogate.predict(X)
+    items = []
+    for ko, oid in enumerate(output_ids):
+        mask = np.isfinite(Y[:, ko])
+        y, y_pred = Y[mask, ko], Y_pred[mask, ko]
+        rmse = float(np.sqrt(np.mean((y - y_pred) ** 2)))
+        std = float(np.std(y))
+        nonzero = y != 0.0
+        q2 = 1.0 - rmse**2 / std**2 if std > 0 else np.nan
+        items.append({
+            "output": oid,
+            "n": int(mask.sum()),
+            "rmse": rmse,
+            "nrmse": rmse / std if std > 0 else np.nan,
+            "max_rel_error": float(
+                np.max(np.abs(y - y_pred)[nonzero] / np.abs(y[nonzero]))
+            ) if nonzero.any() else np.nan,
+            "Q2": q2,
+            "valid": bool(q2 >= q2_min),
+        })
+    return pd.DataFrame(items)
@@ -0,0 +1,57 @@
+"""Checks of the outputs of the sensitivity simulation.
+
+The checks are run standalone, e.g. after changes of the model or of the
+output calculation, and are not part of the sensitivity analyses:
+
+    python -m pkdb_models.models.losartan.sensitivity.validation
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+from sbmlutils.console import console
+
+from pkdb_models.models.losartan.sensitivity.sensitivity_analysis import (
+    LosartanSensitivitySimulation,
+)
+
+
+def validate_pk_outputs(rtol: float = 1e-9) -> pd.DataFrame:
+    """Validate the unit-free pharmacokinetic outputs against TimecoursePK.
+
+    Compares `pk_outputs` and `pk_outputs_timecoursepk` for the simulations
+    of all analysis groups.
+    """
+    console.rule("LOSARTAN VALIDATION PK OUTPUTS", style="blue bold", align="center")
+    sensitivity_simulation = LosartanSensitivitySimulation.sensitivity_simulation()
+    r = sensitivity_simulation.load_model(
+        model_path=sensitivity_simulation.model_path,
+        selections=sensitivity_simulation.selections,
+    )
+    items = []
+    for group in sensitivity_simulation.sensitivity_groups():
+        s = sensitivity_simulation.simulate_timecourse(r, changes=group.changes)
+        y = sensitivity_simulation.pk_outputs(s)
+        y_ref = sensitivity_simulation.pk_outputs_timecoursepk(s)
+        for key, value in y.items():
+            items.append({
+                "group": group.uid,
+                "output": key,
+                "value": value,
+                "reference": y_ref[key],
+            })
+    df = pd.DataFrame(items)
+    df["rel_error"] = np.abs(df.value - df.reference) / np.abs(df.reference)
+    console.print(df)
+
+    valid = np.isclose(df.value, df.reference, rtol=rtol, atol=0.0, equal_nan=True)
+    if not valid.all():
+        raise ValueError(
+            f"Unit-free pharmacokinetic outputs differ from TimecoursePK:\n"
+            f"{df[~valid]}"
+        )
+    return df
+
+
+if __name__ == "__main__":
+    validate_pk_outputs()
@@ -0,0 +1,176 @@
+"""Content-addressed cache of simulation results.
+
+Every timecourse simulation is stored under a key which hashes everything
+that determines its result:
+
+- the SHA256 of the model file
+- the fully resolved changes of all timecourses (including the default changes
+  of the experiments and the model changes)
+- the timecourse definitions (start, end, steps, discard, time offset)
+- the integrator settings and the selections
+
+A hit skips the integration, the results go straight to post-processing.
+Simulations with model manipulations have no stable serialization and are
+not cached.
+
+The cache is bounded in size, the least recently used results are evicted.
+The size is tracked incrementally by every cache instance; the directory is
+only scanned on the first write and once the size limit is reached, then the
+cache is reduced to `low_watermark` of its maximal size.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+from sbmlsim.simulation import TimecourseSim
+from sbmlutils import log
+
+from pkdb_models.models.losartan import CACHE_PATH
+
+logger = log.get_logger(__name__)
+
+SIMULATION_CACHE_PATH = CACHE_PATH / "simulations"
+
+
+def _value(value: Any) -> Any:
+    """JSON serializable value of a change."""
+    value = getattr(value, "magnitude", value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+class SimulationCache:
+    """Size-bounded LRU cache of timecourse results on disk."""
+
+    suffix = ".pkl"
+    # fraction of the maximal size the cache is reduced to by the eviction
+    low_watermark = 0.9
+
+    def __init__(
+        self,
+        cache_path: Path = SIMULATION_CACHE_PATH,
+        max_size: int = 5 * 1024**3,
+    ):
+        """Create cache.
+
+        :param cache_path: directory of the cached results
+        :param max_size: maximal size of the cache in bytes
+        """
+        self.cache_path = Path(cache_path)
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # size of the cache in bytes, None until the first write
+        self._size: Optional[int] = None
+
+    @staticmethod
+    def key(
+        model_sha: str,
+        selections: List[str],
+        integrator_settings: Dict[str, Any],
+        simulation: TimecourseSim,
+    ) -> str:
+        """Key of a normalized timecourse simulation.
+
+        Simulations with model manipulations must not be cached.
+        """
+        if any(tc.model_manipulations for tc in simulation.timecourses):
+            raise ValueError("Simulations with model manipulations are not cached.")
+        content = {
+            "model": model_sha,
+            "selections": list(selections),
+            "integrator": {k: _value(v) for k, v in sorted(integrator_settings.items())},
+            "time_offset": _value(simulation.time_offset),
+            "reset": simulation.reset,
+            "timecourses": [
+                {
+                    "start": _value(tc.start),
+                    "end": _value(tc.end),
+                    "steps": tc.steps,
+                    "discard": tc.discard,
+                    "changes": {k: _value(v) for k, v in sorted(tc.changes.items())},
+                    "model_changes": {
+                        k: _value(v) for k, v in sorted(tc.model_changes.items())
+                    },
+                }
+                for tc in simulation.timecourses
+            ],
+        }
+        return hashlib.sha256(
+            json.dumps(content, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_path / f"{key}{self.suffix}"
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        """Get cached result, None if not in cache."""
+        path = self._path(key)
+        try:
+            df = pd.read_pickle(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as err:
+            logger.warning(f"Invalid cached simulation '{path}': {err}")
+            path.unlink(missing_ok=True)
+            self.misses += 1
+            return None
+
+        # mark as recently used
+        os.utime(path)
+        self.hits += 1
+        return df
+
+    def put(self, key: str, df: pd.DataFrame) -> None:
+        """Store result in the cache."""
+        path = self._path(key)
+        # write via temporary file, workers may use the cache concurrently
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        df.to_pickle(tmp_path)
+        if self._size is None:
+            self._size = self._scan_size()
+        try:
+            self._size -= path.stat().st_size
+        except FileNotFoundError:
+            pass
+        self._size += tmp_path.stat().st_size
+        os.replace(tmp_path, path)
+        if self._size > self.max_size:
+            self.evict()
+
+    def _scan_size(self) -> int:
+        """Size of the cached results in bytes."""
+        return sum(
+            entry.stat().st_size
+            for entry in os.scandir(self.cache_path)
+            if entry.name.endswith(self.suffix)
+        )
+
+    def evict(self) -> None:
+        """Remove least recently used results until the cache fits its size.
+
+        The cache is reduced to `low_watermark` of the maximal size, so that
+        the directory is not scanned again on the next write.
+        """
+        entries = []
+        size = 0
+        for entry in os.scandir(self.cache_path):
+            if entry.name.endswith(self.suffix):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                size += stat.st_size
+        target = self.low_watermark * self.max_size
+        if size > self.max_size:
+            for _, entry_size, path in sorted(entries):
+                Path(path).unlink(missing_ok=True)
+                size -= entry_size
+                if size <= target:
+                    break
+        self._size = size
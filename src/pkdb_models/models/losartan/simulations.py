@@ -97,11 +97,36 @@ EXPERIMENTS["all"] = EXPERIMENTS["studies"] + EXPERIMENTS["misc"] + EXPERIMENTS[
 def run_simulation_experiments(
     selected: str = None,
     experiment_classes: List = None,
-    output_dir: Path = None
+    output_dir: Path = None,
+    n_workers: int = 1,
+    n_scan_workers: int = 1,
+    use_cache: bool = True,
+    headless: bool = False,
+    figure_formats: List[str] = None,
+    dpi: int = 600,
+    n_render_workers: int = 1,
+    incremental: bool = False,
+    use_model_cache: bool = False,
 ) -> None:
-    """Run losartan simulation experiments."""
-
-    Figure.fig_dpi = 600
+    """Run losartan simulation experiments.
+
+    :param n_workers: number of worker processes the experiments are
+        distributed over (1: serial execution).
+    :param n_scan_workers: number of worker processes the points of
+        parameter scans are distributed over (1: serial execution).
+    :param use_cache: reuse cached simulation results.
+    :param headless: skip all figures and write the results as netCDF and TSV
+        (batch and CI runs).
+    :param figure_formats: formats of the figures (default: svg and png).
+    :param dpi: resolution of the figures.
+    :param n_render_workers: number of worker processes saving the figures
+        while the next experiments are simulated (1: serial saving).
+    :param incremental: only run experiments whose code, data, model or
+        settings changed since the last run in the output directory.
+    :param use_model_cache: load the compiled models from the on-disk cache.
+    """
+
+    Figure.fig_dpi = dpi
     Figure.legend_fontsize = 10
 
     # Determine which experiments to run
@@ -127,7 +152,20 @@ def run_simulation_experiments(
         return
 
     # Run the experiments
-    run_experiments(experiment_classes=experiments_to_run, output_dir=output_dir)
+    run_experiments(
+        experiment_classes=experiments_to_run,
+        output_dir=output_dir,
+        n_workers=n_workers,
+        n_scan_workers=n_scan_workers,
+        use_cache=use_cache,
+        headless=headless,
+        figure_formats=figure_formats,
+        n_render_workers=n_render_workers,
+        incremental=incremental,
+        use_model_cache=use_model_cache,
+    )
+    if headless:
+        return
 
     # Collect figures into one folder
     figures_dir = output_dir / "_figures"
@@ -0,0 +1,182 @@
+"""Simulator evaluating the points of scans in worker processes.
+
+Results of timecourses are looked up in the `SimulationCache` first, only
+missing results are simulated.
+"""
+import math
+import multiprocessing
+from multiprocessing.pool import Pool
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+from sbmlsim.model import RoadrunnerSBMLModel
+from sbmlsim.simulation import TimecourseSim
+from sbmlsim.simulator.simulation_serial import SimulatorSerial
+from sbmlutils import log
+
+from pkdb_models.models.losartan.model_cache import (
+    enable_model_cache,
+    model_cache_enabled,
+    sha256_for_path,
+)
+from pkdb_models.models.losartan.simulation_cache import SimulationCache
+
+logger = log.get_logger(__name__)
+
+# simulator of a worker process, the model is loaded once per worker
+_worker_simulator: Optional[SimulatorSerial] = None
+
+
+def _init_worker(
+    model_path: Path, integrator_settings: Dict, use_model_cache: bool
+) -> None:
+    """Load the model in the worker process."""
+    global _worker_simulator
+    if use_model_cache:
+        enable_model_cache()
+    _worker_simulator = SimulatorSerial(model=model_path, **integrator_settings)
+
+
+def _timecourse_worker(args: Tuple[List[str], TimecourseSim]) -> pd.DataFrame:
+    """Run a single timecourse of a scan in the worker process."""
+    selections, simulation = args
+    if list(_worker_simulator.r.timeCourseSelections) != selections:
+        _worker_simulator.set_timecourse_selections(selections=selections)
+    return _worker_simulator._timecourse(simulation)
+
+
+class SimulatorParallelScan(SimulatorSerial):
+    """Serial simulator which distributes the points of scans over workers.
+
+    Timecourses are run in the main process. The points of a `ScanSim` are
+    split over a pool of worker processes, every worker holds a loaded
+    roadrunner instance which is reused for all scans of the model. The
+    results are returned in the order of the scan points, so that the
+    `XResult` is assembled exactly as by the `SimulatorSerial`.
+
+    With a `cache` the results of timecourses are read from and written to
+    the `SimulationCache`. Simulations which depend on the state of a
+    previous simulation (`reset=False`) or have model manipulations are
+    never cached.
+    """
+
+    # number of chunks per worker, smaller chunks balance the load
+    chunks_per_worker = 4
+
+    def __init__(
+        self,
+        model=None,
+        n_workers: int = 1,
+        cache: Optional[SimulationCache] = None,
+        **kwargs,
+    ):
+        """Initialize simulator.
+
+        :param model: Path to model or model
+        :param n_workers: number of worker processes for scans
+        :param cache: cache of simulation results, None disables caching
+        :param kwargs: integrator settings
+        """
+        self.n_workers = n_workers
+        self.cache = cache
+        self._pool: Optional[Pool] = None
+        self._pool_model_path: Optional[Path] = None
+        self._model_shas: Dict[Path, str] = {}
+        super().__init__(model=model, **kwargs)
+
+    def _timecourses(self, simulations: List[TimecourseSim]) -> List[pd.DataFrame]:
+        """Run the timecourses of a scan, cached results are reused."""
+        keys = self._cache_keys(simulations)
+        dfs: List[Optional[pd.DataFrame]] = [
+            self.cache.get(key) if key else None for key in keys
+        ]
+        missing = [k for k, df in enumerate(dfs) if df is None]
+        if missing:
+            results = self._simulate([simulations[k] for k in missing])
+            for k, df in zip(missing, results):
+                dfs[k] = df
+                if keys[k]:
+                    self.cache.put(keys[k], df)
+        return dfs
+
+    def _cache_keys(self, simulations: List[TimecourseSim]) -> List[Optional[str]]:
+        """Cache keys of the simulations, None for uncached simulations."""
+        model_path = self.model.source.path if self.model else None
+        if self.cache is None or model_path is None:
+            return [None] * len(simulations)
+
+        model_path = Path(model_path)
+        if model_path not in self._model_shas:
+            self._model_shas[model_path] = sha256_for_path(model_path)
+        model_sha = self._model_shas[model_path]
+        integrator = self.r.integrator
+        integrator_settings = {
+            key: integrator.getValue(key)
+            for key in RoadrunnerSBMLModel.IntegratorSettingKeys
+        }
+        integrator_settings["integrator"] = integrator.getName()
+        selections = list(self.r.timeCourseSelections)
+
+        return [
+            SimulationCache.key(
+                model_sha=model_sha,
+                selections=selections,
+                integrator_settings=integrator_settings,
+                simulation=simulation,
+            )
+            # model manipulations have no stable serialization
+            if simulation.reset
+            and not any(tc.model_manipulations for tc in simulation.timecourses)
+            else None
+            for simulation in simulations
+        ]
+
+    def _simulate(self, simulations: List[TimecourseSim]) -> List[pd.DataFrame]:
+        """Simulate the timecourses, in worker processes for scans."""
+        if self.n_workers < 2 or len(simulations) < 2:
+            return super()._timecourses(simulations)
+
+        pool = self._get_pool()
+        selections = list(self.r.timeCourseSelections)
+        chunksize = max(
+            1, math.ceil(len(simulations) / (self.chunks_per_worker * self.n_workers))
+        )
+        # map returns the results in the order of the simulations
+        return pool.map(
+            _timecourse_worker,
+            [(selections, simulation) for simulation in simulations],
+            chunksize=chunksize,
+        )
+
+    def _get_pool(self) -> Pool:
+        """Get worker pool for the current model."""
+        model_path = self.model.source.path
+        if model_path is None:
+            raise ValueError(
+                "Parallel scans require a model loaded from a file, but the "
+                "model source has no path."
+            )
+        if self._pool is not None and self._pool_model_path != model_path:
+            self.close()
+        if self._pool is None:
+            logger.info(f"Start {self.n_workers} scan workers for '{model_path}'")
+            self._pool = multiprocessing.Pool(
+                processes=self.n_workers,
+                initializer=_init_worker,
+                initargs=(model_path, self.integrator_settings, model_cache_enabled()),
+            )
+            self._pool_model_path = model_path
+        return self._pool
+
+    def close(self) -> None:
+        """Shut down the worker pool."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+            self._pool_model_path = None
+
+    def __del__(self):
+        if getattr(self, "_pool", None) is not None:
+            self._pool.terminate()
@@ -0,0 +1,189 @@
+"""Periodic steady state of repeated dosing.
+
+Instead of simulating many days of dosing until the periodic regime is
+reached, the periodic steady state is computed directly as fixed point
+`x = Phi(x)` of the flow map `Phi` over one dosing interval (shooting): `Phi`
+starts from the state `x`, adds the dose and integrates over the dosing
+interval. The fixed point iteration is accelerated with Anderson mixing,
+which needs only a few intervals for the (close to linear) pharmacokinetics.
+
+Accumulating amounts (urine, feces, cumulative doses) have no periodic
+steady state; they are excluded from the fixed point and start every
+interval at their initial value, i.e. they are amounts per dosing interval.
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import roadrunner
+from sbmlutils import log
+
+logger = log.get_logger(__name__)
+
+# state variables without periodic steady state
+ACCUMULATING_STATES = ("Aurine_", "Afeces_", "cum_dose_", "count_")
+
+
+@dataclass
+class PeriodicSteadyState:
+    """Periodic steady state of a dosing interval."""
+
+    state: Dict[str, float]
+    timecourse: pd.DataFrame
+    n_intervals: int
+    residual: float
+    converged: bool
+
+
+def _state_ids(
+    r: roadrunner.RoadRunner, exclude: Sequence[str]
+) -> Tuple[List[str], List[str]]:
+    """Ids of the periodic state: independent floating species and rate rule variables.
+
+    Floating species defined by assignment rules are not part of the state.
+    """
+    assignment_rules = set(r.getAssignmentRuleIds())
+    species = [
+        sid for sid in r.model.getFloatingSpeciesIds()
+        if sid not in assignment_rules
+        and not any(pattern in sid for pattern in exclude)
+    ]
+    rate_rules = [
+        sid for sid in r.getRateRuleIds()
+        if not any(pattern in sid for pattern in exclude) and sid not in species
+    ]
+    return species, rate_rules
+
+
+def _get_state(
+    r: roadrunner.RoadRunner, species: List[str], rate_rules: List[str]
+) -> np.ndarray:
+    amounts = dict(
+        zip(r.model.getFloatingSpeciesIds(), r.model.getFloatingSpeciesAmounts())
+    )
+    return np.array(
+        [amounts[sid] for sid in species] + [r.getValue(sid) for sid in rate_rules]
+    )
+
+
+def _set_state(
+    r: roadrunner.RoadRunner, species: List[str], rate_rules: List[str], x: np.ndarray
+) -> None:
+    species_ids = list(r.model.getFloatingSpeciesIds())
+    r.model.setFloatingSpeciesAmounts(
+        [species_ids.index(sid) for sid in species], x[: len(species)]
+    )
+    for sid, value in zip(rate_rules, x[len(species):]):
+        r.setValue(sid, value)
+
+
+def periodic_steady_state(
+    r: roadrunner.RoadRunner,
+    doses: Dict[str, float],
+    tau: float,
+    changes: Optional[Dict[str, float]] = None,
+    steps: int = 500,
+    rtol: float = 1e-6,
+    atol: float = 1e-12,
+    max_intervals: int = 100,
+    n_anderson: int = 5,
+    exclude: Sequence[str] = ACCUMULATING_STATES,
+) -> PeriodicSteadyState:
+    """Calculate the periodic steady state of repeated dosing.
+
+    :param r: roadrunner model, the timecourse selections are used for the
+        timecourse of the steady state interval
+    :param doses: doses added at the start of every interval, e.g.
+        `{"PODOSE_los": 50}` in model units
+    :param tau: dosing interval in model time units
+    :param changes: changes applied after the reset of the model, e.g.
+        bodyweight or parameters, in model units
+    :param steps: steps of the interval timecourse
+    :param rtol: relative tolerance of the fixed point
+    :param atol: absolute tolerance of the fixed point
+    :param max_intervals: maximal number of simulated intervals
+    :param n_anderson: number of previous intervals used by Anderson mixing
+    :param exclude: patterns of accumulating state variables
+    :return: periodic steady state with the timecourse of one interval
+    """
+    changes = changes if changes else {}
+    species, rate_rules = _state_ids(r, exclude=exclude)
+
+    def flow(x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Flow map over one dosing interval."""
+        r.resetToOrigin()
+        for key, value in changes.items():
+            r[key] = value
+        if x is not None:
+            _set_state(r, species, rate_rules, x)
+        for key, value in doses.items():
+            r[key] = r[key] + value
+        s = r.simulate(start=0, end=tau, steps=steps)
+        return _get_state(r, species, rate_rules), s
+
+    # first interval from the initial state
+    x, s = flow(None)
+    xs: List[np.ndarray] = []
+    fs: List[np.ndarray] = []
+    residual = np.inf
+    converged = False
+    n_intervals = 1
+    while n_intervals < max_intervals:
+        fx, s = flow(x)
+        n_intervals += 1
+        g = fx - x
+        residual = float(np.max(np.abs(g) / (atol + rtol * np.abs(fx))))
+        if residual <= 1.0:
+            converged = True
+            x = fx
+            break
+
+        # Anderson mixing on the last intervals
+        xs.append(x)
+        fs.append(fx)
+        xs, fs = xs[-(n_anderson + 1):], fs[-(n_anderson + 1):]
+        if len(xs) > 1:
+            G = np.array([f - xx for f, xx in zip(fs, xs)]).T
+            dG = G[:, 1:] - G[:, :-1]
+            dF = np.array(fs).T[:, 1:] - np.array(fs).T[:, :-1]
+            gamma, *_ = np.linalg.lstsq(dG, G[:, -1], rcond=None)
+            x = fx - dF @ gamma
+            # amounts and concentrations are non-negative
+            x = np.maximum(x, 0.0)
+        else:
+            x = fx
+
+    if not converged:
+        logger.warning(
+            f"Periodic steady state not converged after {n_intervals} "
+            f"intervals (residual: {residual:.3g})"
+        )
+
+    df = pd.DataFrame(s, columns=s.colnames)
+    return PeriodicSteadyState(
+        state=dict(zip(species + rate_rules, x)),
+        timecourse=df,
+        n_intervals=n_intervals,
+        residual=residual,
+        converged=converged,
+    )
+
+
+if __name__ == "__main__":
+    from sbmlutils.console import console
+
+    from pkdb_models.models.losartan import MODEL_PATH
+    from pkdb_models.models.losartan.model_cache import load_roadrunner
+
+    r = load_roadrunner(Path(MODEL_PATH))
+    r.integrator.setValue("absolute_tolerance", 1e-10)
+    r.integrator.setValue("relative_tolerance", 1e-10)
+    r.timeCourseSelections = ["time", "[Cve_los]", "[Cve_e3174]", "SBP", "DBP"]
+
+    # 50 mg losartan daily
+    pss = periodic_steady_state(r, doses={"PODOSE_los": 50.0}, tau=24 * 60)
+    console.print(f"converged: {pss.converged} after {pss.n_intervals} intervals")
+    console.print("trough:")
+    console.print(pss.timecourse.iloc[-1])
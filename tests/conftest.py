@@ -0,0 +1,14 @@
+"""Shared fixtures of the losartan tests."""
+import pytest
+import roadrunner
+
+from pkdb_models.models.losartan import MODEL_PATH
+
+
+@pytest.fixture
+def r() -> roadrunner.RoadRunner:
+    """Whole-body model with tight integrator tolerances."""
+    r = roadrunner.RoadRunner(str(MODEL_PATH))
+    r.integrator.setValue("absolute_tolerance", 1e-10)
+    r.integrator.setValue("relative_tolerance", 1e-10)
+    return r
@@ -0,0 +1,138 @@
+"""Tests of the evaluation of sensitivity samples."""
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from pkdb_models.models.losartan import MODEL_PATH
+from pkdb_models.models.losartan.sensitivity import evaluation
+
+
+class AnalyticSimulation:
+    """Sensitivity simulation with analytic outputs of the parameters."""
+
+    model_path = MODEL_PATH
+    selections = ["time", "[Cve_los]"]
+    changes_simulation = {"PODOSE_los": 10.0}
+    tend = 20 * 24 * 60
+    steps = 3000
+
+    def __init__(self):
+        self.outputs = [
+            SimpleNamespace(uid="y1", unit="mM"),
+            SimpleNamespace(uid="y2", unit="min"),
+        ]
+        self.n_simulations = 0
+
+    @staticmethod
+    def load_model(model_path, selections):
+        return None
+
+    def simulate(self, r, changes: dict[str, float]) -> dict[str, float]:
+        self.n_simulations += 1
+        return {"y1": changes["a"] * changes["b"], "y2": changes["a"] + 2 * changes["b"]}
+
+
+def analysis(n_samples: int = 200, seed: int = 1234) -> SimpleNamespace:
+    """Analysis with uniform samples of two parameters in two groups."""
+    parameters = [
+        SimpleNamespace(uid=uid, value=1.0, lower_bound=0.5, upper_bound=2.0)
+        for uid in ["a", "b"]
+    ]
+    groups = [
+        SimpleNamespace(uid="control", changes={}),
+        SimpleNamespace(uid="renal", changes={"KI__f_renal_function": 0.5}),
+    ]
+    rng = np.random.default_rng(seed)
+    samples = rng.uniform(0.5, 2.0, size=(n_samples, len(parameters)))
+    return SimpleNamespace(
+        sensitivity_simulation=AnalyticSimulation(),
+        parameters=parameters,
+        groups=groups,
+        samples={
+            g.uid: xr.DataArray(samples, dims=["sample", "parameter"]) for g in groups
+        },
+        results={},
+    )
+
+
+def test_cache_key_is_stable() -> None:
+    assert evaluation.cache_key(analysis(), seed=1234) == evaluation.cache_key(
+        analysis(), seed=1234
+    )
+
+
+@pytest.mark.parametrize("change", [
+    lambda sa: sa.parameters[0].__setattr__("upper_bound", 3.0),
+    lambda sa: sa.parameters.pop(),
+    lambda sa: sa.groups[1].changes.update({"KI__f_renal_function": 0.3}),
+    lambda sa: sa.sensitivity_simulation.outputs.pop(),
+    lambda sa: sa.sensitivity_simulation.__setattr__("changes_simulation", {"PODOSE_los": 50.0}),
+    lambda sa: sa.sensitivity_simulation.__setattr__("tend", 10 * 24 * 60),
+])
+def test_cache_key_invalidates(change) -> None:
+    """Changed parameters, groups, outputs, changes or horizon change the key."""
+    sa = analysis()
+    key = evaluation.cache_key(sa, seed=1234)
+    change(sa)
+    assert evaluation.cache_key(sa, seed=1234) != key
+
+
+def test_cache_key_seed() -> None:
+    sa = analysis()
+    assert evaluation.cache_key(sa, seed=1) != evaluation.cache_key(sa, seed=2)
+
+
+def expected_results(sa, group_id: str) -> np.ndarray:
+    a, b = sa.samples[group_id].values.T
+    return np.column_stack([a * b, a + 2 * b])
+
+
+@pytest.mark.parametrize("chunk_size", [1, 64, 500])
+def test_results_by_sample(tmp_path, chunk_size) -> None:
+    """Results are ordered by sample for all chunk sizes."""
+    sa = analysis()
+    evaluation.simulate_samples(sa, chunk_size=chunk_size, checkpoint_path=tmp_path)
+    for group in sa.groups:
+        np.testing.assert_allclose(sa.results[group.uid].values, expected_results(sa, group.uid))
+    assert sa.sensitivity_simulation.n_simulations == 2 * 200
+
+
+def test_resume_from_checkpoint(tmp_path) -> None:
+    """Completed chunks are reused, only missing chunks are simulated."""
+    evaluation.simulate_samples(analysis(), chunk_size=64, checkpoint_path=tmp_path)
+
+    # complete checkpoint
+    sa = analysis()
+    evaluation.simulate_samples(sa, chunk_size=64, checkpoint_path=tmp_path)
+    assert sa.sensitivity_simulation.n_simulations == 0
+    for group in sa.groups:
+        np.testing.assert_allclose(sa.results[group.uid].values, expected_results(sa, group.uid))
+
+    # interrupted run: last chunk of the first group is missing
+    chunks = sorted((tmp_path / "control").glob("chunk_*.nc"))
+    chunks[-1].unlink()
+    sa = analysis()
+    evaluation.simulate_samples(sa, chunk_size=64, checkpoint_path=tmp_path)
+    assert sa.sensitivity_simulation.n_simulations == 200 - 3 * 64
+    np.testing.assert_allclose(sa.results["control"].values, expected_results(sa, "control"))
+
+
+def test_changed_samples_not_resumed(tmp_path) -> None:
+    """Chunks of other samples or outputs are simulated again."""
+    evaluation.simulate_samples(analysis(), chunk_size=64, checkpoint_path=tmp_path)
+
+    sa = analysis(seed=1)
+    evaluation.simulate_samples(sa, chunk_size=64, checkpoint_path=tmp_path)
+    assert sa.sensitivity_simulation.n_simulations == 2 * 200
+    for group in sa.groups:
+        np.testing.assert_allclose(sa.results[group.uid].values, expected_results(sa, group.uid))
+
+    sa = analysis(seed=1)
+    sa.sensitivity_simulation.outputs.pop()
+    evaluation.simulate_samples(sa, chunk_size=64, checkpoint_path=tmp_path)
+    assert sa.sensitivity_simulation.n_simulations == 2 * 200
+    np.testing.assert_allclose(
+        sa.results["control"].values[:, 0], expected_results(sa, "control")[:, 0]
+    )
@@ -0,0 +1,55 @@
+"""Tests of the local sensitivities with forward sensitivity equations."""
+import numpy as np
+import pytest
+
+analysis = pytest.importorskip(
+    "pkdb_models.models.losartan.sensitivity.sensitivity_analysis", exc_type=ImportError
+)
+from pkdb_models.models.losartan.sensitivity.forward_sensitivity import (  # noqa: E402
+    forward_sensitivities,
+)
+
+# parameters early in the global parameters, i.e. few sensitivities are integrated;
+# the bodyweight changes the volumes of the concentrations
+PARAMETER_IDS = ["BW", "HR", "COBW"]
+
+
+@pytest.fixture
+def sensitivity_simulation():
+    """Sensitivity simulation with a two day horizon."""
+    sim = analysis.LosartanSensitivitySimulation.sensitivity_simulation()
+    sim.tend = 2 * 24 * 60
+    sim.steps = 400
+    return sim
+
+
+def test_forward_equals_differences(sensitivity_simulation) -> None:
+    """Forward derivatives of all outputs match central differences."""
+    sim = sensitivity_simulation
+    r = sim.load_model(sim.model_path, sim.selections)
+    for key in ["absolute_tolerance", "relative_tolerance"]:
+        r.integrator.setValue(key, 1e-12)
+    y, dy = forward_sensitivities(sim, r, changes={}, parameter_ids=PARAMETER_IDS)
+
+    sim.apply_changes(r, sim.changes_simulation, reset_all=True)
+    p = np.array([r.getValue(pid) for pid in PARAMETER_IDS])
+    for j, pid in enumerate(PARAMETER_IDS):
+        h = 1e-4 * p[j]
+        y_up = sim.timecourse_outputs(sim.simulate_timecourse(r, {pid: p[j] + h}))
+        y_down = sim.timecourse_outputs(sim.simulate_timecourse(r, {pid: p[j] - h}))
+        for key in y:
+            expected = (y_up[key] - y_down[key]) / (2 * h)
+            # derivatives relative to the output
+            np.testing.assert_allclose(
+                dy[key][j] * p[j] / y[key], expected * p[j] / y[key], rtol=0, atol=1e-2,
+                err_msg=f"{key} / {pid}",
+            )
+
+
+def test_more_parameters_raise(sensitivity_simulation) -> None:
+    """Growing parameter sets of a model raise instead of crashing roadrunner."""
+    sim = sensitivity_simulation
+    r = sim.load_model(sim.model_path, sim.selections)
+    forward_sensitivities(sim, r, changes={}, parameter_ids=["BW"])
+    with pytest.raises(RuntimeError):
+        forward_sensitivities(sim, r, changes={}, parameter_ids=["BW", "HR"])
@@ -0,0 +1,71 @@
+"""Tests of the vectorized pharmacokinetic parameters."""
+import numpy as np
+import pytest
+from pint import UnitRegistry
+from pkdb_analysis.pk.pharmacokinetics import TimecoursePK
+
+from pkdb_models.models.losartan.losartan_pk import (
+    PK_PARAMETERS,
+    PK_REGRESSION_PARAMETERS,
+    timecourse_pk,
+)
+
+ureg = UnitRegistry()
+Q_ = ureg.Quantity
+
+# oral doses of the scan [mg]
+DOSES = [10.0, 50.0, 100.0]
+
+
+@pytest.fixture
+def scan(r) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    """Timecourses [time x scan] of a losartan dose scan."""
+    sids = ["[Cve_los]", "[Cve_e3174]"]
+    r.timeCourseSelections = ["time"] + sids
+    columns = {sid: [] for sid in sids}
+    for dose in DOSES:
+        r.resetAll()
+        r.setValue("PODOSE_los", dose)
+        s = r.simulate(start=0, end=48 * 60, steps=400)
+        for sid in sids:
+            columns[sid].append(s[sid])
+    return s["time"], {sid: np.column_stack(values) for sid, values in columns.items()}
+
+
+@pytest.mark.parametrize("sid, dose_used", [("[Cve_los]", True), ("[Cve_e3174]", False)])
+def test_timecourse_pk_equals_timecoursepk(scan, sid, dose_used) -> None:
+    """Parameters of all scan points equal TimecoursePK of every timecourse."""
+    t, c = scan
+    dose = np.array(DOSES)
+    df = timecourse_pk(
+        ureg=ureg,
+        t=t,
+        c=c[sid],
+        time_unit="min",
+        concentration_unit="mM",
+        dose=dose if dose_used else None,
+        dose_unit="mg",
+    )
+    assert len(df) == len(DOSES)
+
+    for k in range(len(DOSES)):
+        pk = TimecoursePK(
+            time=Q_(t, "min"),
+            concentration=Q_(c[sid][:, k], "mM"),
+            substance="losartan",
+            ureg=ureg,
+            dose=Q_(dose[k], "mg") if dose_used else None,
+        ).pk.to_dict()
+        for key in [*PK_PARAMETERS, "slope", "intercept"]:
+            expected = pk[key].magnitude if hasattr(pk[key], "magnitude") else pk[key]
+            if key == "dose" and not dose_used:
+                continue
+            np.testing.assert_allclose(
+                df[key].values[k], expected, rtol=1e-9, equal_nan=True, err_msg=key
+            )
+            if f"{key}_unit" in pk:
+                assert df[f"{key}_unit"].values[k] == pk[f"{key}_unit"], key
+        for key in PK_REGRESSION_PARAMETERS[2:]:
+            np.testing.assert_allclose(
+                df[key].values[k], pk[key], rtol=1e-9, atol=1e-300, err_msg=key
+            )
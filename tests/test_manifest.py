@@ -0,0 +1,86 @@
+"""Tests of the manifest of incremental experiment runs."""
+import shutil
+
+import pytest
+
+from pkdb_models.models.losartan import DATA_PATHS, MODEL_PATH
+from pkdb_models.models.losartan.experiments.studies.sica1995 import Sica1995
+from pkdb_models.models.losartan.manifest import ExperimentManifest
+
+SETTINGS = {"headless": False, "figure_formats": ["svg"], "fig_dpi": 300}
+
+
+@pytest.fixture
+def inputs_paths(tmp_path):
+    """Copies of the study data and the model, which can be changed."""
+    data_path = tmp_path / "data"
+    study = Sica1995.__name__
+    shutil.copytree(DATA_PATHS[0] / study, data_path / study)
+    model_path = tmp_path / MODEL_PATH.name
+    shutil.copy(MODEL_PATH, model_path)
+    return {"data_paths": [data_path], "model_path": model_path}
+
+
+@pytest.fixture
+def output_path(tmp_path):
+    path = tmp_path / "results"
+    (path / Sica1995.__name__).mkdir(parents=True)
+    return path
+
+
+def inputs(inputs_paths, settings=SETTINGS):
+    return ExperimentManifest.inputs(Sica1995, settings=settings, **inputs_paths)
+
+
+def test_inputs(inputs_paths) -> None:
+    """Inputs cover the experiment and base classes, the study data and the model."""
+    d = inputs(inputs_paths)
+    assert "pkdb_models.models.losartan.experiments.studies.sica1995" in d["code"]
+    assert "pkdb_models.models.losartan.experiments.base_experiment" in d["code"]
+    assert ".Sica1995_Fig1.tsv" in d["data"]
+    assert d == inputs(inputs_paths)
+
+
+def test_current_after_update(inputs_paths, output_path) -> None:
+    manifest = ExperimentManifest(output_path)
+    sid = Sica1995.__name__
+    assert not manifest.is_current(sid, inputs(inputs_paths), output_path)
+
+    manifest.update(sid, inputs(inputs_paths), report_data={"sid": sid})
+    manifest.save()
+
+    manifest = ExperimentManifest(output_path)
+    assert manifest.is_current(sid, inputs(inputs_paths), output_path)
+    assert manifest.report_data(sid) == {"sid": sid}
+
+    # removed outputs are created again
+    shutil.rmtree(output_path / sid)
+    assert not manifest.is_current(sid, inputs(inputs_paths), output_path)
+
+
+@pytest.mark.parametrize("change", ["data", "model", "settings"])
+def test_changed_inputs(inputs_paths, output_path, change) -> None:
+    """Changed data, model or run settings rerun the experiment."""
+    sid = Sica1995.__name__
+    manifest = ExperimentManifest(output_path)
+    manifest.update(sid, inputs(inputs_paths), report_data={})
+    manifest.save()
+
+    settings = SETTINGS
+    if change == "data":
+        tsv_path = inputs_paths["data_paths"][0] / sid / ".Sica1995_Fig1.tsv"
+        tsv_path.write_text(tsv_path.read_text() + "\n")
+    elif change == "model":
+        with open(inputs_paths["model_path"], "a") as f:
+            f.write("\n")
+    elif change == "settings":
+        settings = {**SETTINGS, "figure_formats": ["svg", "png"]}
+
+    manifest = ExperimentManifest(output_path)
+    assert not manifest.is_current(sid, inputs(inputs_paths, settings=settings), output_path)
+
+
+def test_invalid_manifest(output_path) -> None:
+    """An unreadable manifest reruns all experiments."""
+    (output_path / ExperimentManifest.filename).write_text("{invalid")
+    assert ExperimentManifest(output_path).experiments == {}
@@ -0,0 +1,98 @@
+"""Tests of the cache of compiled roadrunner models."""
+import shutil
+
+import numpy as np
+import pytest
+import roadrunner
+
+from pkdb_models.models.losartan import MODEL_PATH
+from pkdb_models.models.losartan import model_cache
+
+
+@pytest.fixture
+def cache_path(tmp_path, monkeypatch):
+    """Empty model cache in a temporary directory."""
+    path = tmp_path / "models"
+    monkeypatch.setattr(model_cache, "MODEL_CACHE_PATH", path)
+    return path
+
+
+@pytest.fixture
+def sbml_loads(monkeypatch) -> list:
+    """Record the SBML paths of all RoadRunner models loaded from SBML."""
+    loads = []
+    RoadRunner = roadrunner.RoadRunner
+
+    class RecordingRoadRunner(RoadRunner):
+        def __init__(self, *args, **kwargs):
+            if args:
+                loads.append(args[0])
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(roadrunner, "RoadRunner", RecordingRoadRunner)
+    return loads
+
+
+def simulate(r: roadrunner.RoadRunner) -> np.ndarray:
+    r.timeCourseSelections = ["time", "[Cve_los]", "[Cve_e3174]", "SBP"]
+    r.resetAll()
+    r.setValue("PODOSE_los", 50.0)
+    return np.array(r.simulate(start=0, end=24 * 60, steps=100))
+
+
+def test_cold_load_compiles_once(cache_path, sbml_loads) -> None:
+    """A cold load compiles the SBML once and fills the cache."""
+    r = model_cache.load_roadrunner(MODEL_PATH)
+    assert len(sbml_loads) == 1
+    assert model_cache.model_state_path(MODEL_PATH).exists()
+    assert list(cache_path.glob("*.tmp")) == []
+
+    # warm load from the state
+    r_state = model_cache.load_roadrunner(MODEL_PATH)
+    assert len(sbml_loads) == 1
+    np.testing.assert_allclose(simulate(r_state), simulate(r), rtol=1e-8)
+
+
+def test_state_path_changes_with_model(tmp_path, cache_path) -> None:
+    """Changed SBML files never load the state of the previous model."""
+    sbml_path = tmp_path / MODEL_PATH.name
+    shutil.copy(MODEL_PATH, sbml_path)
+    state_path = model_cache.model_state_path(sbml_path)
+    assert state_path == model_cache.model_state_path(sbml_path)
+    assert roadrunner.__version__ in state_path.name
+
+    with open(sbml_path, "a") as f:
+        f.write("\n")
+    assert model_cache.model_state_path(sbml_path) != state_path
+
+
+def test_invalid_state_is_replaced(cache_path) -> None:
+    """A corrupt state is removed and the model is loaded from the SBML."""
+    state_path = model_cache.model_state_path(MODEL_PATH)
+    state_path.parent.mkdir(parents=True)
+    state_path.write_bytes(b"corrupt")
+
+    r = model_cache.load_roadrunner(MODEL_PATH)
+    assert simulate(r).shape == (101, 4)
+    assert state_path.stat().st_size > len(b"corrupt")
+
+
+def test_sensitivity_model_respects_cache_setting(cache_path, sbml_loads) -> None:
+    """The sensitivity simulation only uses the cache if it is enabled."""
+    analysis = pytest.importorskip(
+        "pkdb_models.models.losartan.sensitivity.sensitivity_analysis", exc_type=ImportError
+    )
+    load_model = analysis.LosartanSensitivitySimulation.load_model
+
+    model_cache.disable_model_cache()
+    load_model(MODEL_PATH, selections=["time", "[Cve_los]"])
+    assert not cache_path.exists()
+
+    model_cache.enable_model_cache()
+    try:
+        load_model(MODEL_PATH, selections=["time", "[Cve_los]"])
+        load_model(MODEL_PATH, selections=["time", "[Cve_los]"])
+    finally:
+        model_cache.disable_model_cache()
+    assert model_cache.model_state_path(MODEL_PATH).exists()
+    assert len(sbml_loads) == 2
@@ -0,0 +1,39 @@
+"""Tests of the rendering of figures in worker processes."""
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np  # noqa: E402
+from matplotlib import image  # noqa: E402
+from matplotlib import pyplot as plt  # noqa: E402
+
+from pkdb_models.models.losartan.rendering import FigureRenderer, save_figure  # noqa: E402
+
+
+def create_figure():
+    fig, ax = plt.subplots(figsize=(4, 3))
+    t = np.linspace(0, 24, 100)
+    ax.plot(t, np.exp(-0.2 * t), marker="o", label="losartan")
+    ax.set_xlabel("time [hr]")
+    ax.legend()
+    return fig
+
+
+def test_renderer_equals_serial_saving(tmp_path) -> None:
+    """Figures saved by the render workers equal figures saved in the process."""
+    fig = create_figure()
+    serial = [tmp_path / "serial.png", tmp_path / "serial.svg"]
+    save_figure(fig, paths=serial, dpi=72)
+
+    renderer = FigureRenderer(n_workers=2, dpi=72)
+    try:
+        paths = [tmp_path / f"fig{k}.png" for k in range(4)]
+        for path in paths:
+            renderer.submit(fig, paths=[path, path.with_suffix(".svg")])
+        plt.close(fig)
+    finally:
+        renderer.close()
+
+    for path in paths:
+        np.testing.assert_array_equal(image.imread(path), image.imread(serial[0]))
+        assert path.with_suffix(".svg").stat().st_size > 0
@@ -0,0 +1,87 @@
+"""Tests of the Sobol sensitivity analysis with sequential sampling."""
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from pkdb_models.models.losartan.sensitivity import sequential_sobol as ss
+
+
+def ishigami(X: np.ndarray, a: float = 7.0, b: float = 0.1) -> np.ndarray:
+    """Ishigami function with analytical Sobol indices."""
+    return np.sin(X[:, 0]) + a * np.sin(X[:, 1]) ** 2 + b * X[:, 2] ** 4 * np.sin(X[:, 0])
+
+
+# analytical first order and total indices of the Ishigami function (a=7, b=0.1)
+ISHIGAMI_S1 = np.array([0.3139, 0.4424, 0.0])
+ISHIGAMI_ST = np.array([0.5576, 0.4424, 0.2437])
+
+
+def ishigami_analysis() -> SimpleNamespace:
+    """Minimal Sobol analysis with the Ishigami function as single output."""
+    parameters = [
+        SimpleNamespace(uid=f"x{k}", lower_bound=-np.pi, upper_bound=np.pi)
+        for k in range(3)
+    ]
+    return SimpleNamespace(
+        parameters=parameters,
+        groups=[SimpleNamespace(uid="control")],
+        sensitivity_simulation=SimpleNamespace(outputs=[SimpleNamespace(uid="y")]),
+        samples={},
+        results={},
+        sensitivity={},
+    )
+
+
+def simulate_ishigami(sa, n_workers, checkpoint_path) -> None:
+    """Evaluate the samples of all groups with the Ishigami function."""
+    for group in sa.groups:
+        X = sa.samples[group.uid].values
+        sa.results[group.uid] = xr.DataArray(
+            ishigami(X)[:, np.newaxis], dims=["sample", "output"]
+        )
+
+
+def test_saltelli_samples_prefix() -> None:
+    """Samples of N are the first samples of 2N, previous batches are reused."""
+    sa = ishigami_analysis()
+    samples_N = ss.saltelli_samples(sa, N=256)
+    samples_2N = ss.saltelli_samples(sa, N=512)
+    assert samples_N.shape == (256 * 8, 3)
+    np.testing.assert_array_equal(samples_2N[: len(samples_N)], samples_N)
+
+
+def test_sobol_indices_ishigami() -> None:
+    """Sobol indices of the Ishigami function match the analytical values."""
+    sa = ishigami_analysis()
+    X = ss.saltelli_samples(sa, N=8192)
+    sa.results["control"] = xr.DataArray(ishigami(X)[:, np.newaxis], dims=["sample", "output"])
+
+    sensitivity = ss.sobol_indices(sa, "control", seed=1234)
+    np.testing.assert_allclose(sensitivity["S1"].values[:, 0], ISHIGAMI_S1, atol=0.02)
+    np.testing.assert_allclose(sensitivity["ST"].values[:, 0], ISHIGAMI_ST, atol=0.02)
+
+    # bootstrap confidence intervals are reproducible with the seed
+    repeated = ss.sobol_indices(sa, "control", seed=1234)
+    for key in ss.SOBOL_KEYS:
+        np.testing.assert_array_equal(repeated[key].values, sensitivity[key].values)
+
+
+def test_sequential_sobol_converges(monkeypatch, tmp_path) -> None:
+    """Sampling stops at the first N with confidence intervals below the target."""
+    monkeypatch.setattr(ss, "simulate_samples", simulate_ishigami)
+    sa = ishigami_analysis()
+
+    N = ss.sequential_sobol(
+        sa, checkpoint_path=tmp_path, N_start=256, N_max=8192, ci_width=0.1, seed=1234
+    )
+    assert 256 <= N <= 8192
+    assert ss.max_ci_width(sa.sensitivity["control"], cutoff=0.05) <= 0.1
+    assert len(sa.samples["control"]) == N * 8
+    np.testing.assert_allclose(sa.sensitivity["control"]["ST"].values[:, 0], ISHIGAMI_ST, atol=0.1)
+
+
+def test_sequential_sobol_power_of_two(tmp_path) -> None:
+    with pytest.raises(ValueError):
+        ss.sequential_sobol(ishigami_analysis(), checkpoint_path=tmp_path, N_start=300)
@@ -0,0 +1,84 @@
+"""Tests of the content-addressed cache of simulation results."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from sbmlsim.simulation import Timecourse, TimecourseSim
+
+from pkdb_models.models.losartan.simulation_cache import SimulationCache
+
+SELECTIONS = ["time", "[Cve_los]"]
+INTEGRATOR = {"absolute_tolerance": 1e-10, "relative_tolerance": 1e-10}
+
+
+def simulation(dose: float = 10.0, end: float = 1440.0, **changes) -> TimecourseSim:
+    return TimecourseSim([
+        Timecourse(start=0, end=end, steps=100, changes={"PODOSE_los": dose, **changes}),
+    ])
+
+
+def key(
+    sim: TimecourseSim, model_sha: str = "sha", selections=SELECTIONS, integrator=INTEGRATOR
+) -> str:
+    return SimulationCache.key(model_sha, selections, integrator, sim)
+
+
+def test_key_is_stable() -> None:
+    """Equal simulations have equal keys, independent of the order of changes."""
+    assert key(simulation()) == key(simulation())
+    assert key(simulation(BW=70.0, HR=60.0)) == key(simulation(HR=60.0, BW=70.0))
+
+
+@pytest.mark.parametrize("changed", [
+    lambda: key(simulation(dose=20.0)),
+    lambda: key(simulation(end=2880.0)),
+    lambda: key(simulation(BW=80.0)),
+    lambda: key(simulation(), model_sha="changed"),
+    lambda: key(simulation(), selections=["time", "[Cve_e3174]"]),
+    lambda: key(simulation(), integrator={**INTEGRATOR, "relative_tolerance": 1e-8}),
+])
+def test_key_invalidates(changed) -> None:
+    """Changed model, changes, timecourses, selections or integrator change the key."""
+    assert changed() != key(simulation())
+
+
+def test_model_manipulations_not_cached() -> None:
+    sim = TimecourseSim([
+        Timecourse(start=0, end=10, steps=10, model_manipulations={"remove": ["x"]}),
+    ])
+    with pytest.raises(ValueError):
+        key(sim)
+
+
+def test_get_put(tmp_path) -> None:
+    cache = SimulationCache(cache_path=tmp_path)
+    df = pd.DataFrame({"time": np.linspace(0, 10, 11), "[Cve_los]": np.arange(11.0)})
+    k = key(simulation())
+    assert cache.get(k) is None
+    cache.put(k, df)
+    pd.testing.assert_frame_equal(cache.get(k), df)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert list(tmp_path.glob("*.tmp")) == []
+
+
+def test_evicts_least_recently_used(tmp_path) -> None:
+    """The least recently used results are evicted down to the low watermark."""
+    df = pd.DataFrame({"x": np.arange(1000.0)})
+    keys = [key(simulation(dose=dose)) for dose in range(4)]
+
+    cache = SimulationCache(cache_path=tmp_path)
+    for k, kkey in enumerate(keys[:3]):
+        cache.put(kkey, df)
+        os.utime(cache._path(kkey), (k, k))
+    size = cache._path(keys[0]).stat().st_size
+
+    # reading the oldest result marks it as recently used
+    cache.get(keys[0])
+    cache = SimulationCache(cache_path=tmp_path, max_size=int(3.5 * size))
+    cache.put(keys[3], df)
+
+    assert not cache._path(keys[1]).exists()
+    for kkey in [keys[0], keys[2], keys[3]]:
+        assert cache._path(kkey).exists()
+    assert cache._size == 3 * size
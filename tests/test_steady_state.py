@@ -0,0 +1,24 @@
+"""Tests of the periodic steady state of repeated dosing."""
+import numpy as np
+
+from pkdb_models.models.losartan.steady_state import periodic_steady_state
+
+
+def test_periodic_steady_state_equals_repeated_dosing(r):
+    """The periodic steady state is the last interval of many dosing intervals."""
+    selections = ["time", "[Cve_los]", "[Cve_e3174]", "SBP"]
+    r.timeCourseSelections = selections
+    pss = periodic_steady_state(r, doses={"PODOSE_los": 50.0}, tau=24 * 60, steps=48)
+    assert pss.converged
+    assert pss.n_intervals < 20
+
+    # brute force: 30 days of 50 mg losartan daily
+    r.resetToOrigin()
+    for _ in range(30):
+        r["PODOSE_los"] = r["PODOSE_los"] + 50.0
+        s = r.simulate(start=0, end=24 * 60, steps=48)
+
+    expected = np.asarray(s)[:, 1:]
+    actual = pss.timecourse[selections[1:]].values
+    scale = np.abs(expected).max(axis=0)
+    np.testing.assert_allclose(actual / scale, expected / scale, rtol=0, atol=1e-5)
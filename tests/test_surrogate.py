@@ -0,0 +1,65 @@
+"""Tests of the polynomial chaos surrogate."""
+import numpy as np
+
+from pkdb_models.models.losartan.sensitivity.surrogate import (
+    PolynomialChaosSurrogate,
+    holdout_report,
+)
+
+LOWER = np.array([0.0, 1.0, -2.0])
+UPPER = np.array([2.0, 5.0, 2.0])
+
+
+def polynomial(X: np.ndarray) -> np.ndarray:
+    """Polynomial of degree 2 in the parameters scaled to [-1, 1]."""
+    u = 2 * (X - LOWER) / (UPPER - LOWER) - 1
+    return 1 + 2 * u[:, 0] + 3 * u[:, 1] ** 2 + u[:, 0] * u[:, 2]
+
+
+def ishigami(X: np.ndarray, a: float = 7.0, b: float = 0.1) -> np.ndarray:
+    return np.sin(X[:, 0]) + a * np.sin(X[:, 1]) ** 2 + b * X[:, 2] ** 4 * np.sin(X[:, 0])
+
+
+def samples(n: int, lower: np.ndarray, upper: np.ndarray, seed: int = 1234) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.uniform(lower, upper, size=(n, len(lower)))
+
+
+def test_polynomial_sobol_indices() -> None:
+    """Mean, variance and Sobol indices of a polynomial are exact."""
+    X = samples(200, LOWER, UPPER)
+    Y = np.column_stack([polynomial(X), np.zeros(len(X))])
+    surrogate = PolynomialChaosSurrogate(LOWER, UPPER, degree=2).fit(X, Y)
+
+    # variances of the terms: 4 Var(u), 9 Var(u^2), Var(u) Var(u)
+    v = np.array([4 / 3, 9 * 4 / 45, 1 / 9])
+    variance = v.sum()
+    np.testing.assert_allclose(surrogate.mean[0], 1 + 3 / 3, rtol=1e-6)
+    np.testing.assert_allclose(surrogate.variance[0], variance, rtol=1e-6)
+
+    S1, ST = surrogate.sobol_indices()
+    np.testing.assert_allclose(S1[:, 0], [v[0] / variance, v[1] / variance, 0], atol=1e-6)
+    np.testing.assert_allclose(
+        ST[:, 0], [(v[0] + v[2]) / variance, v[1] / variance, v[2] / variance], atol=1e-6
+    )
+    # constant outputs have no Sobol indices
+    assert np.all(np.isnan(S1[:, 1]))
+
+    X_test = samples(100, LOWER, UPPER, seed=1)
+    df = holdout_report(
+        surrogate, X_test, np.column_stack([polynomial(X_test), np.zeros(100)]), ["y", "zero"]
+    )
+    assert df.valid[0]
+    assert np.isnan(df.max_rel_error[1])
+
+
+def test_ishigami_sobol_indices() -> None:
+    """Sobol indices of the Ishigami function match the analytical values."""
+    lower, upper = np.full(3, -np.pi), np.full(3, np.pi)
+    X = samples(2000, lower, upper)
+    surrogate = PolynomialChaosSurrogate(lower, upper, degree=10, max_interaction=2)
+    surrogate.fit(X, ishigami(X)[:, np.newaxis])
+
+    S1, ST = surrogate.sobol_indices()
+    np.testing.assert_allclose(S1[:, 0], [0.3139, 0.4424, 0.0], atol=0.01)
+    np.testing.assert_allclose(ST[:, 0], [0.5576, 0.4424, 0.2437], atol=0.01)